@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Microbenchmarks of the group and storage primitives used by the RBE algorithms.
+
+Besides single multiplications, exponentiations, pairings and (de)serializations
+(as in ops-petrelic.py), this measures batch (de)serialization, GT inversion and
+division, scalar inversion, compression of GT elements (rbe/torus.py, if the
+backend supports it), and sqlite connections, point reads and commits.
+
+Products of pairings, multi-exponentiations and fixed-base exponentiation (with
+precomputed tables) are not measured: petrelic exposes no such primitives, so
+they would only repeat single pairings and exponentiations (the algorithms use
+those, see rbe/costmodel.py).
+
+Every operation is timed with `time.perf_counter` after warmup calls; the output
+JSON holds summary statistics, throughput and per-element cost for each
+operation, plus element sizes. It is the primitive cost input for the cost model
+(see rbe/costmodel.py and bench/simulate.py).
+"""
+
+from petrelic.multiplicative.pairing import G1,G2,GT,G1Element,G2Element,GTElement
+from rbe import stats
+from rbe import torus
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import tempfile
+
+def rand_g1():
+    return G1.generator() ** G1.order().random()
+
+def rand_g2():
+    return G2.generator() ** G2.order().random()
+
+def single_ops():
+    """Operations on one element: name -> (function, elements per call)."""
+    a = rand_g1()
+    b = rand_g2()
+    c = a.pair(b)
+    x1 = G1.order().random()
+    x2 = G2.order().random()
+    xt = GT.order().random()
+    a_bytes = G1Element.to_binary(a)
+    b_bytes = G2Element.to_binary(b)
+    c_bytes = GTElement.to_binary(c)
+    ops = {
+        "mul_g1": (lambda: a * a, 1),
+        "mul_g2": (lambda: b * b, 1),
+        "mul_gt": (lambda: c * c, 1),
+        "exp_g1": (lambda: a ** x1, 1),
+        "exp_g2": (lambda: b ** x2, 1),
+        "exp_gt": (lambda: c ** xt, 1),
+        "pair": (lambda: a.pair(b), 1),
+        "inv_gt": (lambda: c ** (-1), 1),
+        "div_gt": (lambda: c / c, 1),
+        "inv_scalar": (lambda: x1.mod_pow(-1, GT.order()), 1),
+        "serialize_g1": (lambda: G1Element.to_binary(a), 1),
+        "deserialize_g1": (lambda: G1Element.from_binary(a_bytes), 1),
+        "serialize_g2": (lambda: G2Element.to_binary(b), 1),
+        "deserialize_g2": (lambda: G2Element.from_binary(b_bytes), 1),
+        "serialize_gt": (lambda: GTElement.to_binary(c), 1),
+        "deserialize_gt": (lambda: GTElement.from_binary(c_bytes), 1),
+    }
+    if torus.available():
+        c_compressed = torus.compress(c)
+        ops["compress_gt"] = (lambda: torus.compress(c), 1)
+        ops["decompress_gt"] = (lambda: torus.decompress(c_compressed), 1)
+    return ops
+
+def batch_ops(k):
+    """Operations on `k` elements at once: name -> (function, elements per call)."""
+    As = [rand_g1() for _ in range(k)]
+    As_bytes = [G1Element.to_binary(a) for a in As]
+
+    return {
+        "serialize_g1_batch_{}".format(k): (lambda: [G1Element.to_binary(a) for a in As], k),
+        "deserialize_g1_batch_{}".format(k): (lambda: [G1Element.from_binary(s) for s in As_bytes], k),
+    }
+
+def sql_ops(workdir):
+    """sqlite connections, point reads and single-row commits, on a table like pp/aux."""
+    path = os.path.join(workdir, "micro.db")
+    con = sqlite3.connect(path)
+    cur = con.cursor()
+    cur.execute('''CREATE TABLE aux (upd BLOB)''')
+    val = G1Element.to_binary(rand_g1())
+    cur.executemany("INSERT INTO aux(rowid, upd) VALUES(?,?)", ((i, val) for i in range(10000)))
+    con.commit()
+    state = {"row": 0}
+
+    def select():
+        state["row"] = (state["row"]+7919) % 10000
+        cur.execute("SELECT * FROM aux WHERE rowid=?", (state["row"],))
+        return cur.fetchall()
+
+    def commit():
+        cur.execute("UPDATE aux SET upd = ? WHERE rowid = ?", (val, state["row"]))
+        con.commit()
+
+    def connect():
+        sqlite3.connect(path).close()
+
+    return con, {
+        "sql_connect": (connect, 1),
+        "sql_execute": (select, 1),
+        "sql_commit": (commit, 1),
+    }
+
+def element_sizes():
+    c = rand_g1().pair(rand_g2())
+    return {
+        "g1": len(G1Element.to_binary(rand_g1())),
+        "g2": len(G2Element.to_binary(rand_g2())),
+        "gt": len(GTElement.to_binary(c)),
+        "gt_compressed": len(torus.compress(c)) if torus.available() else None,
+        "scalar": len(G1.order().random().binary()),
+    }
+
+def run(ops, reps, warmup, results):
+    for name, (fn, elements) in ops.items():
+        summary = stats.summarize(stats.measure(fn, reps, warmup))
+        summary["throughput"] = stats.throughput(summary)
+        summary["elements"] = elements
+        summary["per_element"] = summary["mean"]/elements
+        results[name] = summary
+        print("{:<28}\t{:.3e} s\t(p99 {:.3e}; {:.1f} ops/s)".format(name, summary["mean"], summary["p99"], summary["throughput"]), flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="microbenchmarks of group and storage primitives")
+    parser.add_argument('-i','--iters',
+        type=int,
+        default=100,
+        dest='iters',
+        help='timed repetitions per operation')
+    parser.add_argument('-w','--warmup',
+        type=int,
+        default=5,
+        dest='warmup',
+        help='untimed warmup repetitions per operation')
+    parser.add_argument('-k','--batch',
+        type=int,
+        nargs='+',
+        default=[2, 4, 8, 16],
+        dest='batch',
+        help='batch sizes for batched operations')
+    parser.add_argument('-o','--out',
+        default='ops.json',
+        dest='out',
+        help='output json file')
+    args = parser.parse_args()
+
+    results = {}
+    run(single_ops(), args.iters, args.warmup, results)
+    for k in args.batch:
+        run(batch_ops(k), max(args.iters//k, 10), args.warmup, results)
+    with tempfile.TemporaryDirectory() as workdir:
+        con, ops = sql_ops(workdir)
+        run(ops, args.iters, args.warmup, results)
+        con.close()
+
+    out = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "iters": args.iters,
+            "warmup": args.warmup,
+        },
+        "sizes": element_sizes(),
+        "ops": results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(out, f, indent=2)
+    print("results written to", args.out)
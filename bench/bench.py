@@ -2,6 +2,7 @@
 from rbe import algos
 from rbe.objects import *
 from rbe import utils
+from rbe import instrument
 import time
 import argparse
 from os.path import exists
@@ -35,10 +36,19 @@ if __name__ == "__main__":
         default=False,
         dest='full_reg',
         help='run registration (only) for full system capacity (N parties)')
+    parser.add_argument('-p','--profile',
+        action='store_true',
+        required=False,
+        default=False,
+        dest='profile',
+        help='count and time primitive operations per algorithm (written to a json file)')
     args = parser.parse_args()
     if args.iters == -1:
         args.iters = ceil(sqrt(args.N))
 
+    if args.profile:
+        recorder = instrument.enable()
+
     ## Setup ###
     setup_time = time.time()
     crs = algos.setup(args.N, efficient=args.eff)
@@ -49,6 +59,15 @@ if __name__ == "__main__":
     print("Setup (s):\t", setup_time)
     print("--------------------------")
 
+    # cost of one G1 deserialization, to estimate the time saved by lazy updates
+    g1_ser = G1Element.to_binary(crs.g1 ** G1.order().random())
+    g1_deserialize_time = time.time()
+    for _ in range(100):
+        G1Element.from_binary(g1_ser)
+    g1_deserialize_time = (time.time()-g1_deserialize_time)/100
+    upd_elements = 0 # update elements returned by Upd
+    upd_decoded = 0 # update elements actually deserialized (by Dec)
+
     prefix = 'bench{}{}_'.format(args.N, 'e' if args.eff else '')
     f1 = open(prefix+'genreg.csv', 'w')
     f_enc = open(prefix+'enc.csv', 'w')
@@ -170,6 +189,9 @@ if __name__ == "__main__":
                     # ensure correctness
                     assert(target_ms[l] == m_prime)
 
+                    upd_elements += len(u)
+                    upd_decoded += u.decoded
+
         time_avgs["Gen"] /= crs.n
         time_avgs["Reg"] /= crs.n
         time_avgs["Enc"] /= args.iters
@@ -185,6 +207,20 @@ if __name__ == "__main__":
                 iters = args.iters
             print("{}:\t{}\t(avg of {})".format(key,time_avgs[key],iters))
 
+        print("\nLazy Updates")
+        print("--------------------------")
+        print("Deserialized:\t{} of {} update elements".format(upd_decoded, upd_elements))
+        print("Avoided (s):\t{}\t(avg per Upd; {} s per G1 deserialization)".format(
+            (upd_elements-upd_decoded)*g1_deserialize_time/args.iters, g1_deserialize_time))
+
         # print()
         # print("\nAverage Data Transmitted")
         # print("#Upd:\t{}\t(avg of {}; each one is an element of G1)".format(num_upd/args.iters, args.iters))
+
+    if args.profile:
+        instrument.disable()
+        print("\nOperation Breakdown (per call)")
+        print("--------------------------")
+        recorder.print_summary()
+        with open(prefix+'profile.json', 'w') as f_profile:
+            f_profile.write(recorder.to_json(indent=2))
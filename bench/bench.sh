@@ -1,16 +1,20 @@
 #!/bin/sh
 
-# delete old data files if they are present
-rm *.db
+# Runs the benchmarks in a scratch directory, so no databases or csv files in
+# the current directory are deleted or overwritten. Results (bench.txt, the
+# csv files and suite.json) go to the directory given as first argument
+# (default: a new timestamped directory).
+here=$(cd "$(dirname "$0")" && pwd)
+outdir=${1:-bench-$(date +%Y%m%d-%H%M%S)}
+mkdir -p "$outdir"
+outdir=$(cd "$outdir" && pwd)
+outfile="$outdir/bench.txt"
 
-# check if existing benchmarks will be overwritten
-rm -i *.csv
-outfile="bench.txt"
-if [ -f $outfile ]; then
-    rm -i $outfile
-fi
+workdir=$(mktemp -d)
+trap 'rm -rf "$workdir"' EXIT
+cd "$workdir"
 
-echo "curve: BLS12-381" >> $outfile
+echo "curve: BLS12-381" > $outfile
 echo "" >> $outfile
 
 echo "===================" >> $outfile
@@ -23,7 +27,7 @@ do
     echo "***** N=$N *****" >> $outfile
 
     # times
-    (python3 bench.py -N $N) >>$outfile
+    (python3 "$here/bench.py" -N $N) >>$outfile
     echo "" >> $outfile
 
     # sizes
@@ -33,7 +37,8 @@ do
     echo "crs.db:\t\t$crssize" >> $outfile
     echo "" >> $outfile
 
-    rm *.db
+    mv *.csv "$outdir"
+    rm -f *.db *.db-wal *.db-shm registered.bin
 done
 
 echo "===================" >> $outfile
@@ -47,7 +52,7 @@ do
     echo "***** N=$N *****" >> $outfile
 
     # times
-    (python3 bench.py -N $N -e) >>$outfile
+    (python3 "$here/bench.py" -N $N -e) >>$outfile
     echo "" >> $outfile
 
     # sizes
@@ -57,5 +62,9 @@ do
     echo "crs.db:\t\t$crssize" >> $outfile
     echo "" >> $outfile
 
-    rm *.db
+    mv *.csv "$outdir"
+    rm -f *.db *.db-wal *.db-shm registered.bin
 done
+
+# statistics (percentiles, confidence intervals) for all algorithms, as json
+python3 "$here/suite.py" -N 10000 100000 1000000 -o "$outdir/suite.json"
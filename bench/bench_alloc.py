@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Registration throughput and tail latency by id allocation policy.
+
+For each policy (see rbe/alloc.py), sets up a fresh system and registers `-c`
+parties with the ids an `Allocator` hands out, timing each `reg` (and each
+allocation) and counting the merges it triggers (from the count of its block
+before it, see `alloc.merges`). Policies differ while blocks are partly filled,
+so by default half of the ids are registered.
+"""
+
+from rbe import algos
+from rbe import alloc
+from rbe import stats
+from rbe.objects import *
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+from time import perf_counter
+
+def block_count(k):
+    """Registered parties in block `k` (efficient variant)."""
+    con = sqlite3.connect("pp.db")
+    fetched = con.execute("SELECT * FROM pp_block_count WHERE rowid = ?", (k,)).fetchall()
+    con.close()
+    return fetched[0][0] if len(fetched) != 0 else 0
+
+def run(N, efficient, policy, count, seed):
+    random.seed(seed)
+    crs = algos.setup(N, efficient=efficient)
+    ids = alloc.Allocator(crs, policy, efficient)
+    merges = 0
+    samples = {"alloc": [], "reg": []}
+    for _ in range(count):
+        start = perf_counter()
+        id = ids.next()
+        samples["alloc"] += [perf_counter()-start]
+        pk,sk,xi = algos.gen(crs, id)
+        if efficient:
+            # (the regular variant does not merge)
+            merges = merges + alloc.merges(block_count(id // crs.n))
+        start = perf_counter()
+        algos.reg(crs, id, pk, xi, efficient=efficient)
+        samples["reg"] += [perf_counter()-start]
+        ids.registered(id)
+    res = {op: stats.summarize(s) for op, s in samples.items()}
+    res["reg_per_s"] = count/sum(samples["reg"])
+    res["merges"] = merges
+    res["block_load"] = {"min": min(ids.load), "max": max(ids.load)}
+    return res
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="registration throughput and tail latency by id allocation policy")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=1000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-p','--policies',
+        nargs='+',
+        choices=alloc.POLICIES,
+        default=alloc.POLICIES,
+        dest='policies',
+        help='allocation policies')
+    parser.add_argument('-c','--count',
+        type=int,
+        default=None,
+        dest='count',
+        help='parties registered (default: N/2)')
+    parser.add_argument('--seed',
+        type=int,
+        default=1,
+        dest='seed',
+        help='random seed')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    count = args.count if args.count is not None else args.N//2
+    results = {}
+    cwd = os.getcwd()
+    for policy in args.policies:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                results[policy] = run(args.N, args.eff, policy, count, args.seed)
+            finally:
+                os.chdir(cwd)
+
+    print("N = {} ({} variant), {} registrations".format(args.N, "efficient" if args.eff else "regular", count))
+    for policy, res in results.items():
+        print("    {:<13}\treg {:.1f}/s\tp50 {:.6f} s\tp99 {:.6f} s\tmax {:.6f} s\t{} merges\tblock load {}-{}\talloc {:.6f} s".format(
+            policy, res["reg_per_s"], res["reg"]["p50"], res["reg"]["p99"], res["reg"]["max"], res["merges"],
+            res["block_load"]["min"], res["block_load"]["max"], res["alloc"]["mean"]))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Hit rate of the decoded-element cache, and reg/enc/upd+dec time with it, by capacity.
+
+Runs the same seeded workload (registrations in random order, each followed by
+`-r` encryptions to random registered ids, decrypted after `upd`) without the
+cache and with a cache (see `rbe/cache.py`) of each capacity in `-c`, and reports
+the mean time per operation and the cache statistics.
+"""
+
+from rbe import algos
+from rbe import cache
+from rbe import stats
+from rbe.objects import *
+import argparse
+import json
+import os
+import random
+import tempfile
+from time import perf_counter
+
+def run(N, efficient, reads, seed):
+    random.seed(seed)
+    crs = algos.setup(N, efficient=efficient)
+    ids = random.sample(range(N), N)
+    sks = {}
+    samples = {"reg": [], "enc": [], "upd+dec": []}
+    for id in ids:
+        pk,sk,xi = algos.gen(crs, id)
+        start = perf_counter()
+        algos.reg(crs, id, pk, xi, efficient=efficient)
+        samples["reg"] += [perf_counter()-start]
+        sks[id] = sk
+        for _ in range(reads):
+            tid = random.choice(list(sks))
+            m = GT.generator()**GT.order().random()
+            start = perf_counter()
+            cts = algos.enc(crs, tid, m, efficient=efficient)
+            samples["enc"] += [perf_counter()-start]
+            start = perf_counter()
+            m_prime = algos.dec(crs, tid, sks[tid], algos.upd(crs, tid, efficient=efficient), cts)
+            samples["upd+dec"] += [perf_counter()-start]
+            assert(m == m_prime)
+    return {op: stats.summarize(s) for op, s in samples.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="decoded-element cache hit rate and operation times")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=1000,
+        dest='N',
+        help='maximum number of parties (all are registered)')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-c','--capacity',
+        type=int,
+        nargs='+',
+        default=[64, 1024, 65536],
+        dest='capacities',
+        help='cache capacities (elements)')
+    parser.add_argument('-r','--reads',
+        type=int,
+        default=1,
+        dest='reads',
+        help='enc/upd/dec per registration')
+    parser.add_argument('--seed',
+        type=int,
+        default=1,
+        dest='seed',
+        help='random seed of the workload')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    for capacity in [None] + args.capacities:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            elements = cache.enable(capacity) if capacity is not None else None
+            name = "capacity {}".format(capacity) if capacity is not None else "no cache"
+            results[name] = run(args.N, args.eff, args.reads, args.seed)
+            if elements is not None:
+                s = elements.stats()
+                s["hit_rate"] = s["hits"]/max(1, s["hits"]+s["misses"]+s["stale"])
+                results[name]["cache"] = s
+            cache.disable()
+            os.chdir(cwd)
+
+    for name, res in results.items():
+        line = "{:<16}\t".format(name) + "\t".join("{} {:.6f} s".format(op, res[op]["mean"]) for op in ["reg", "enc", "upd+dec"])
+        if "cache" in res:
+            line += "\thit rate {:.3f} evictions {}".format(res["cache"]["hit_rate"], res["cache"]["evictions"])
+        print(line)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""Memory footprint of the RBE algorithms, by variant and N.
+
+For every N and variant, runs setup, loads the CRS from crs.db, fills one block
+with registrations (`merge` is measured on its own when `reg` cascades into it)
+and runs enc/upd/dec on registered ids, twice, each time in a fresh process:
+
+* with `tracemalloc`, for the peak of Python allocations during each call (above
+  the level when it started), the memory it still holds when it returns (its
+  result included) and, for the call with the highest peak, the allocation sites
+  of that memory, largest first;
+* without it, for the process's peak RSS (`ru_maxrss`) after each phase, and its
+  growth during the phase.
+
+Memory held by sqlite is not traced by `tracemalloc`; it shows in the RSS only.
+Results are written as JSON, keyed by "N/variant". With `--compare baseline.json`,
+peaks that grew by more than the threshold are reported (exit status 1 if any).
+"""
+
+from rbe import algos
+from rbe.objects import *
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+VARIANTS = {"regular": False, "efficient": True}
+OPS = ["setup", "crs", "reg", "merge", "enc", "upd", "dec"]
+# growth (bytes) below which a peak is not reported as a regression
+MIN_GROWTH = 64*1024
+
+def max_rss():
+    """Peak resident set size of this process so far, in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss*1024
+
+class Tracer:
+    """Traced memory of calls, which may be nested (`merge` within `reg`).
+
+    Parameters
+    ----------
+    top : int
+        allocation sites kept for the call with the highest peak (0: none)
+    """
+
+    def __init__(self, top):
+        self.top = top
+        self.samples = {op: [] for op in OPS}
+        self.sites = {op: None for op in OPS}
+        # [start, peak so far] of the calls in progress
+        self._stack = []
+
+    def call(self, op, fn, *args):
+        if len(self._stack) != 0:
+            # the peak of the enclosing call up to here (reset below)
+            outer = self._stack[-1]
+            outer[1] = max(outer[1], tracemalloc.get_traced_memory()[1])
+        # snapshots only around outermost calls (they are traced objects themselves)
+        before = tracemalloc.take_snapshot() if self.top and len(self._stack) == 0 else None
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        frame = [start, start]
+        self._stack += [frame]
+        try:
+            result = fn(*args)
+        finally:
+            self._stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, frame[1]) - start
+        self.samples[op] += [(peak, current-start)]
+        if before is not None and peak == max(p for p, _ in self.samples[op]):
+            after = tracemalloc.take_snapshot()
+            stats = after.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).compare_to(before, "lineno")
+            self.sites[op] = [{"site": "{}:{}".format(s.traceback[0].filename, s.traceback[0].lineno), "size": s.size_diff, "count": s.count_diff}
+                for s in stats if s.size_diff > 0][:self.top]
+        return result
+
+    def summary(self):
+        out = {}
+        for op in OPS:
+            s = self.samples[op]
+            if len(s) == 0:
+                out[op] = {"n": 0}
+                continue
+            out[op] = {
+                "n": len(s),
+                "peak_max": max(p for p, _ in s),
+                "peak_mean": sum(p for p, _ in s)/len(s),
+                "retained_mean": sum(r for _, r in s)/len(s),
+                "sites": self.sites[op],
+            }
+        return out
+
+class RSSMeter:
+    """Peak RSS after each phase (calls of one operation), and its growth during it."""
+
+    def __init__(self):
+        self.phases = {}
+
+    def call(self, op, fn, *args):
+        before = max_rss()
+        result = fn(*args)
+        after = max_rss()
+        phase = self.phases.setdefault(op, {"peak": before, "growth": 0})
+        phase["peak"] = max(phase["peak"], after)
+        phase["growth"] = phase["growth"] + after-before
+        return result
+
+def run_config(N, efficient, count, reps, seed, trace, top):
+    """One pass over all phases in a fresh directory; returns the per-operation measurements."""
+    random.seed(seed)
+    meter = Tracer(top) if trace else RSSMeter()
+    if trace:
+        tracemalloc.start()
+    merge = algos.merge
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            meter.call("setup", algos.setup, N, efficient)
+            crs = meter.call("crs", CRS)
+            if trace:
+                # merges cascade from within reg
+                algos.merge = lambda *args: meter.call("merge", merge, *args)
+            sks = {}
+            ids = random.sample(range(crs.n), min(count, crs.n) if count is not None else crs.n)
+            for id in ids:
+                pk,sk,xi = algos.gen(crs, id)
+                meter.call("reg", algos.reg, crs, id, pk, xi, efficient)
+                sks[id] = sk
+            algos.merge = merge
+            for _ in range(reps):
+                id = random.choice(ids)
+                m = GT.generator()**GT.order().random()
+                cts = meter.call("enc", algos.enc, crs, id, m, efficient)
+                u = meter.call("upd", algos.upd, crs, id, efficient)
+                m_prime = meter.call("dec", algos.dec, crs, id, sks[id], u, cts)
+                assert(m == m_prime)
+                del cts, u
+        finally:
+            algos.merge = merge
+            os.chdir(cwd)
+    if trace:
+        tracemalloc.stop()
+        return meter.summary()
+    return meter.phases
+
+def measure(N, efficient, count, reps, seed, top):
+    """Traced and RSS passes for one setting of N and variant, each in a new process."""
+    ctx = multiprocessing.get_context("spawn")
+    out = {}
+    for trace in [True, False]:
+        with ctx.Pool(1) as pool:
+            out["traced" if trace else "rss"] = pool.apply(run_config, (N, efficient, count, reps, seed, trace, top))
+    return out
+
+def compare(baseline, results, threshold):
+    """Print memory regressions of `results` against `baseline`; return how many were found."""
+    found = 0
+    for key, res in results.items():
+        if key not in baseline:
+            continue
+        base = baseline[key]
+        checks = [(op, base["traced"].get(op, {}).get("peak_max"), s.get("peak_max")) for op, s in res["traced"].items()]
+        checks += [("rss " + op, base["rss"].get(op, {}).get("peak"), s["peak"]) for op, s in res["rss"].items()]
+        for name, old, new in checks:
+            if old is None or new is None:
+                continue
+            if new-old > max(threshold*old, MIN_GROWTH):
+                print("REGRESSION {} {}: peak {} -> {} bytes".format(key, name, old, new))
+                found += 1
+    return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="memory footprint of all RBE algorithms")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        nargs='+',
+        default=[100, 10000],
+        dest='N',
+        help='values of N to measure')
+    parser.add_argument('-v','--variants',
+        nargs='+',
+        choices=list(VARIANTS),
+        default=list(VARIANTS),
+        dest='variants',
+        help='scheme variants to measure')
+    parser.add_argument('-c','--count',
+        type=int,
+        default=None,
+        dest='count',
+        help='parties registered in the block (default: all)')
+    parser.add_argument('-r','--reps',
+        type=int,
+        default=10,
+        dest='reps',
+        help='enc/upd/dec calls')
+    parser.add_argument('-s','--sites',
+        type=int,
+        default=5,
+        dest='top',
+        help='allocation sites reported per operation (0: none)')
+    parser.add_argument('--seed',
+        type=int,
+        default=1,
+        dest='seed',
+        help='random seed of the workload')
+    parser.add_argument('-o','--out',
+        default='memory.json',
+        dest='out',
+        help='output json file')
+    parser.add_argument('--compare',
+        default=None,
+        dest='baseline',
+        help='saved json results to check for regressions')
+    parser.add_argument('-t','--threshold',
+        type=float,
+        default=0.1,
+        dest='threshold',
+        help='tolerated relative growth of a peak in compare mode')
+    args = parser.parse_args()
+
+    results = {}
+    for N in args.N:
+        for variant in args.variants:
+            print("N = {}, {} variant".format(N, variant), flush=True)
+            res = measure(N, VARIANTS[variant], args.count, args.reps, args.seed, args.top)
+            results["{}/{}".format(N, variant)] = dict(N=N, variant=variant, **res)
+            for op in OPS:
+                s = res["traced"][op]
+                if s["n"] == 0:
+                    continue
+                line = "    {}:\tpeak {:.1f} KiB (mean {:.1f})\tretained {:.1f} KiB".format(op, s["peak_max"]/1024, s["peak_mean"]/1024, s["retained_mean"]/1024)
+                if op in res["rss"]:
+                    line += "\tRSS {:.1f} MiB (+{:.1f})".format(res["rss"][op]["peak"]/2**20, res["rss"][op]["growth"]/2**20)
+                print(line)
+
+    out = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "reps": args.reps,
+            "count": args.count,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(out, f, indent=2)
+    print("results written to", args.out)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(baseline, results, args.threshold) != 0:
+            exit(1)
+        print("no regressions")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Latency of `enc` and `dec` with worker processes, by number of cores.
+
+Registers `-c` parties in one block (by default all but one, so that the
+efficient variant has up to log n commitments), then times `enc` and `dec` to
+random registered ids serially and with a `parallel.Executor` of each size in
+`-p`. `dec` is given a ciphertext to the current commitments, after the updates
+from `upd`.
+"""
+
+from rbe import algos
+from rbe import stats
+from rbe.objects import *
+from rbe.parallel import Executor
+import argparse
+import json
+import os
+import random
+import tempfile
+from time import perf_counter
+
+def build(N, efficient, count):
+    crs = algos.setup(N, efficient=efficient)
+    ids = random.sample(range(crs.n), min(count, crs.n) if count is not None else crs.n-1)
+    sks = {}
+    for id in ids:
+        pk,sk,xi = algos.gen(crs, id)
+        algos.reg(crs, id, pk, xi, efficient=efficient)
+        sks[id] = sk
+    return crs, sks
+
+def time_ops(crs, sks, efficient, reps, executor=None):
+    samples = {"enc": [], "dec": []}
+    for _ in range(reps):
+        id = random.choice(list(sks))
+        m = GT.generator()**GT.order().random()
+        start = perf_counter()
+        cts = algos.enc(crs, id, m, efficient=efficient, executor=executor)
+        samples["enc"] += [perf_counter()-start]
+        u = algos.upd(crs, id, efficient=efficient)
+        start = perf_counter()
+        m_prime = algos.dec(crs, id, sks[id], u, cts, executor=executor)
+        samples["dec"] += [perf_counter()-start]
+        assert(m == m_prime)
+    return {op: stats.summarize(s) for op, s in samples.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="enc/dec latency with worker processes")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=10000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-c','--count',
+        type=int,
+        default=None,
+        dest='count',
+        help='parties registered in the block (default: all but one)')
+    parser.add_argument('-p','--processes',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8],
+        dest='processes',
+        help='worker process counts')
+    parser.add_argument('-r','--reps',
+        type=int,
+        default=20,
+        dest='reps',
+        help='timed enc/dec pairs per setting')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        crs, sks = build(args.N, args.eff, args.count)
+        results["serial"] = time_ops(crs, sks, args.eff, args.reps)
+        for p in args.processes:
+            with Executor(p) as ex:
+                # (workers load the CRS on their first task)
+                time_ops(crs, sks, args.eff, 1, ex)
+                results["{} processes".format(p)] = time_ops(crs, sks, args.eff, args.reps, ex)
+        os.chdir(cwd)
+
+    for name, res in results.items():
+        print("{:<12}\t".format(name) + "\t".join("{} p50 {:.6f} s p99 {:.6f} s".format(op, s["p50"], s["p99"]) for op, s in res.items()))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
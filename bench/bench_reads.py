@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""Read latency of `enc` and `upd` while registrations are being written.
+
+A block is partly filled, then `enc` and `upd` for a registered id are timed
+twice: while the curator is idle, and during a registration burst run by a
+separate (writer) process. With the databases in WAL mode and snapshot reads
+(the default) the two distributions should be about the same; with
+`-j delete` (sqlite's rollback journal) readers wait for the writer.
+
+Every read of pp.db is also checked for half-applied registrations: in a
+snapshot, block `k` must hold exactly the commitments pp_0 ... pp_{p-1}, where p
+is the number of ones in its registration count (efficient variant).
+"""
+
+from rbe import algos
+from rbe import stats
+from rbe import utils
+from rbe.objects import *
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from time import perf_counter
+
+def writer(workdir, ids, efficient):
+    """Register `ids` (run in the writer process)."""
+    os.chdir(workdir)
+    crs = CRS()
+    for id in ids:
+        pk,sk,xi = algos.gen(crs, id)
+        algos.reg(crs, id, pk, xi, efficient=efficient)
+
+def consistent(crs, k):
+    """Whether the current snapshot of pp.db shows block `k` with no registration half-applied."""
+    con = utils.connect_snapshot("pp.db")
+    cur = con.cursor()
+    cur.execute("SELECT num FROM pp_block_count WHERE rowid = ?", (k,))
+    count = cur.fetchall()[0][0]
+    present = []
+    for i in range(crs.chunks):
+        cur.execute("SELECT count(*) FROM pp_{} WHERE rowid = ?".format(i), (k,))
+        present += [cur.fetchall()[0][0]]
+    con.close()
+    chunks = bin(count).count("1")
+    return present == [1]*chunks + [0]*(len(present)-chunks)
+
+def read_phase(crs, target, efficient, reps=None, busy=None):
+    """Time enc and upd for `target`, `reps` times or for as long as `busy` is alive."""
+    samples = {"enc": [], "upd": []}
+    errors = 0
+    inconsistent = 0
+    m = GT.generator()**GT.order().random()
+    while (busy.is_alive() if busy is not None else len(samples["enc"]) < reps):
+        try:
+            start = perf_counter()
+            algos.enc(crs, target, m, efficient=efficient)
+            samples["enc"] += [perf_counter()-start]
+            start = perf_counter()
+            algos.upd(crs, target, efficient=efficient)
+            samples["upd"] += [perf_counter()-start]
+            if efficient and not consistent(crs, target//crs.n):
+                inconsistent += 1
+        except Exception:
+            # e.g. "database is locked" with the rollback journal
+            errors += 1
+    return samples, errors, inconsistent
+
+def run(N, efficient, journal, reps, burst):
+    cwd = os.getcwd()
+    out = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        crs = algos.setup(N, efficient=efficient)
+        for db in ["pp.db", "aux.db", "aux_count.db"]:
+            con = sqlite3.connect(db)
+            con.execute("PRAGMA journal_mode={}".format(journal))
+            con.close()
+
+        # half of block 0 is registered before reads start, the rest (and further blocks) during the burst
+        ids = list(range(min(burst + crs.n//2, crs.N)))
+        writer(workdir, ids[:crs.n//2], efficient)
+        target = 0
+
+        for phase in ["idle", "burst"]:
+            if phase == "idle":
+                samples, errors, inconsistent = read_phase(crs, target, efficient, reps=reps)
+            else:
+                proc = multiprocessing.Process(target=writer, args=(workdir, ids[crs.n//2:], efficient))
+                proc.start()
+                samples, errors, inconsistent = read_phase(crs, target, efficient, busy=proc)
+                proc.join()
+            out[phase] = {op: stats.summarize(s) for op, s in samples.items()}
+            out[phase]["errors"] = errors
+            out[phase]["inconsistent"] = inconsistent
+        os.chdir(cwd)
+    return out
+
+def print_results(out):
+    for phase, res in out.items():
+        print("{} (errors: {}, inconsistent snapshots: {})".format(phase, res["errors"], res["inconsistent"]))
+        for op in ["enc", "upd"]:
+            s = res[op]
+            if s["n"] == 0:
+                print("    {}:\tno samples".format(op))
+                continue
+            print("    {}:\tn={}\tp50 {:.6f} s\tp99 {:.6f} s\tmax {:.6f} s".format(op, s["n"], s["p50"], s["p99"], s["max"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="enc/upd latency during registration bursts")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=10000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-j','--journal',
+        default='wal',
+        choices=['wal', 'delete'],
+        dest='journal',
+        help='sqlite journal mode of pp/aux/aux_count')
+    parser.add_argument('-r','--reps',
+        type=int,
+        default=50,
+        dest='reps',
+        help='reads while idle')
+    parser.add_argument('-b','--burst',
+        type=int,
+        default=200,
+        dest='burst',
+        help='registrations in the burst')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    out = run(args.N, args.eff, args.journal, args.reps, args.burst)
+    print_results(out)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(out, f, indent=2)
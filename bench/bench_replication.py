@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""Replication lag of a follower (see rbe/changelog.py) during a registration burst.
+
+Sets up a primary with the change log enabled and a follower tailing it in a
+separate process, then registers `-b` parties back to back. A sampler thread
+records the follower's applied position every `-s` seconds; a registration is
+replicated once the follower applied pp's log past it (pp is applied last). The
+replication lag of each registration, the entries behind at worst, and the time
+the follower needs to catch up after the burst are reported, along with the
+registration rate with and without the log (the cost of the triggers).
+"""
+
+from rbe import algos
+from rbe import changelog
+from rbe import stats
+from rbe.objects import *
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+from time import perf_counter, sleep
+
+def follow(primary, replica, efficient, interval, ready, stop):
+    follower = changelog.Follower(primary, replica, efficient)
+    ready.set()
+    follower.run(interval, stop)
+
+def burst(crs, efficient, ids, keys, on_commit=None):
+    """Register `ids`; returns the registrations per second."""
+    start = perf_counter()
+    for id in ids:
+        pk, xi = keys[id]
+        algos.reg(crs, id, pk, xi, efficient=efficient)
+        if on_commit is not None:
+            on_commit()
+    return len(ids)/(perf_counter()-start)
+
+def run(N, efficient, count, interval, period, seed):
+    workdir = os.getcwd()
+    primary, replica = os.path.join(workdir, "primary"), os.path.join(workdir, "replica")
+    res = {}
+
+    for log in [False, True]:
+        # the same burst in both passes
+        random.seed(seed)
+        os.makedirs(primary)
+        os.chdir(primary)
+        crs = algos.setup(N, efficient=efficient)
+        ids = random.sample(range(N), count)
+        keys = {}
+        for id in ids:
+            pk, sk, xi = algos.gen(crs, id)
+            keys[id] = (pk, xi)
+        if not log:
+            res["reg_per_s_without_log"] = burst(crs, efficient, ids, keys)
+            os.chdir(workdir)
+            shutil.rmtree(primary)
+            continue
+
+        changelog.enable(crs, efficient)
+        follower = changelog.Follower(primary, replica, efficient)
+        ctx = multiprocessing.get_context("spawn")
+        ready, stop = ctx.Event(), ctx.Event()
+        process = ctx.Process(target=follow, args=(primary, replica, efficient, interval, ready, stop))
+        process.start()
+        ready.wait()
+
+        # (time, applied position of pp's log)
+        samples = []
+        done = threading.Event()
+
+        def sample():
+            while not done.is_set():
+                samples.append((perf_counter(), follower.position()["pp.db"]))
+                sleep(period)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        # (commit time, last entry of pp's log)
+        commits = []
+        res["reg_per_s"] = burst(crs, efficient, ids, keys, lambda: commits.append((perf_counter(), changelog.last("pp.db"))))
+        end = perf_counter()
+        target = commits[-1][1]
+        while follower.position()["pp.db"] < target:
+            sleep(period)
+        caught_up = perf_counter()
+        done.set()
+        sampler.join()
+        stop.set()
+        process.join()
+        os.chdir(workdir)
+
+        lags = []
+        i = 0
+        for committed, seq in commits:
+            # first sample that shows the registration applied
+            while i < len(samples) and (samples[i][1] < seq or samples[i][0] < committed):
+                i = i + 1
+            lags += [(samples[i][0] if i < len(samples) else caught_up) - committed]
+        behind = [target_at - applied for (t, applied), target_at in zip(samples, _targets(samples, commits))]
+        res["lag"] = stats.summarize(lags)
+        res["max_entries_behind"] = max(behind) if len(behind) != 0 else 0
+        res["catch_up_time"] = caught_up-end
+        res["log_entries"] = {db: changelog.last(os.path.join(primary, db)) for db in changelog.DATABASES}
+    return res
+
+def _targets(samples, commits):
+    """Last entry of pp's log committed at the time of each sample."""
+    i = 0
+    last = 0
+    for t, applied in samples:
+        while i < len(commits) and commits[i][0] <= t:
+            last = commits[i][1]
+            i = i + 1
+        yield last
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replication lag of a change-log follower under a registration burst")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=1000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-b','--burst',
+        type=int,
+        default=None,
+        dest='count',
+        help='registrations in the burst (default: N/2)')
+    parser.add_argument('-i','--interval',
+        type=float,
+        default=0.01,
+        dest='interval',
+        help='polling interval of the follower (s)')
+    parser.add_argument('-s','--sample',
+        type=float,
+        default=0.002,
+        dest='period',
+        help='sampling period of the follower position (s)')
+    parser.add_argument('--seed',
+        type=int,
+        default=1,
+        dest='seed',
+        help='random seed of the workload')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            res = run(args.N, args.eff, args.count if args.count is not None else args.N//2, args.interval, args.period, args.seed)
+        finally:
+            os.chdir(cwd)
+
+    print("N = {} ({} variant), burst of {} registrations".format(args.N, "efficient" if args.eff else "regular", args.count if args.count is not None else args.N//2))
+    print("    reg {:.1f}/s with the log (and the follower), {:.1f}/s without".format(res["reg_per_s"], res["reg_per_s_without_log"]))
+    print("    replication lag p50 {:.4f} s, p99 {:.4f} s, max {:.4f} s".format(res["lag"]["p50"], res["lag"]["p99"], res["lag"]["max"]))
+    print("    at most {} entries behind, caught up {:.4f} s after the burst".format(res["max_entries_behind"], res["catch_up_time"]))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(res, f, indent=2)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Throughput of block-sharded curators (see rbe/shard.py), by number of shards.
+
+For each number of shards, sets up local shard processes (one directory each)
+and a shard map, generates keys for `-c` random ids, then registers them and
+runs `-r` enc+upd calls on random registered ids through routers, one per
+client thread. With `--rebalance`, the shards start with all blocks on half of
+them and `rebalance` is timed as well. Decryption is checked on a sample.
+"""
+
+from rbe import algos
+from rbe import shard
+from rbe.objects import *
+import argparse
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
+from time import perf_counter
+
+def run_clients(map_path, clients, jobs, work):
+    """Run `work(router, job)` on all `jobs` from `clients` threads; returns the elapsed time."""
+    pending = queue.Queue()
+    for job in jobs:
+        pending.put(job)
+    errors = []
+
+    def client():
+        with shard.Router(map_path) as router:
+            while True:
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    work(router, job)
+                except Exception as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = perf_counter()-start
+    if len(errors) != 0:
+        raise errors[0]
+    return elapsed
+
+def run(N, efficient, shards, clients, count, reads, rebalance, seed):
+    random.seed(seed)
+    directories = ["shard{}".format(i) for i in range(shards)]
+    crs = shard.create(directories, N, efficient)
+    servers = [shard.spawn(d) for d in directories]
+    names = {"shard{}".format(i): address for i, (process, address) in enumerate(servers)}
+    # with rebalancing, new blocks go to the first half of the shards only
+    placement = list(names)[:max(1, shards//2)] if rebalance else list(names)
+    shard.write_map("shards.json", crs.n, names, placement)
+    try:
+        ids = random.sample(range(N), count)
+        keys = {}
+        for id in ids:
+            keys[id] = algos.gen(crs, id)
+        res = {}
+        elapsed = run_clients("shards.json", clients, ids, lambda router, id: router.reg(id, keys[id][0], keys[id][2]))
+        res["reg_per_s"] = count/elapsed
+
+        with shard.Router("shards.json") as router:
+            res["parties_per_shard"] = {name: sum(info["blocks"].values()) for name, info in router.info().items()}
+            if rebalance:
+                start = perf_counter()
+                res["moves"] = len(router.rebalance())
+                res["rebalance_time"] = perf_counter()-start
+                res["parties_per_shard"] = {name: sum(info["blocks"].values()) for name, info in router.info().items()}
+
+        m = GT.generator()**GT.order().random()
+        targets = [random.choice(ids) for _ in range(reads)]
+        elapsed = run_clients("shards.json", clients, targets, lambda router, id: (router.enc(id, m), router.upd(id)))
+        res["reads_per_s"] = reads/elapsed
+
+        with shard.Router("shards.json") as router:
+            for id in random.sample(ids, min(10, count)):
+                assert(algos.dec(crs, id, keys[id][1], router.upd(id), router.enc(id, m)) == m)
+            for name in list(router.shards):
+                router.shutdown(name)
+    finally:
+        for process, address in servers:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+    return res
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="throughput of block-sharded curators")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=1024,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-s','--shards',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4],
+        dest='shards',
+        help='numbers of shards')
+    parser.add_argument('-t','--clients',
+        type=int,
+        default=None,
+        dest='clients',
+        help='client threads (default: one per shard)')
+    parser.add_argument('-c','--count',
+        type=int,
+        default=None,
+        dest='count',
+        help='parties registered (default: N/2)')
+    parser.add_argument('-r','--reads',
+        type=int,
+        default=200,
+        dest='reads',
+        help='enc+upd calls')
+    parser.add_argument('--rebalance',
+        action='store_true',
+        default=False,
+        dest='rebalance',
+        help='place new blocks on half of the shards, then rebalance')
+    parser.add_argument('--seed',
+        type=int,
+        default=1,
+        dest='seed',
+        help='random seed of the workload')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    count = args.count if args.count is not None else args.N//2
+    results = {}
+    cwd = os.getcwd()
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                res = run(args.N, args.eff, shards, args.clients or shards, count, args.reads, args.rebalance, args.seed)
+            finally:
+                os.chdir(cwd)
+        results[shards] = res
+        line = "{} shards:\treg {:.1f}/s\tenc+upd {:.1f}/s\tparties per shard {}".format(shards, res["reg_per_s"], res["reads_per_s"], list(res["parties_per_shard"].values()))
+        if args.rebalance:
+            line += "\t{} blocks moved in {:.3f} s".format(res["moves"], res["rebalance_time"])
+        print(line)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
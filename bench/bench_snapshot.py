@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Snapshot size and save/restore time of a deployment.
+
+Registers `-r` parties in a fresh directory, then times `snapshot.save` and
+`snapshot.restore` against copying the databases with sqlite's backup API, and
+compares the snapshot size with that of the databases.
+"""
+
+from rbe import algos
+from rbe import snapshot
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+from time import perf_counter
+
+def build(N, efficient, registrations):
+    crs = algos.setup(N, efficient=efficient)
+    for id in random.sample(range(crs.N), min(registrations, crs.N)):
+        pk,sk,xi = algos.gen(crs, id)
+        algos.reg(crs, id, pk, xi, efficient=efficient)
+
+def backup(src, dst):
+    """Copy the databases in `src` to `dst` with sqlite's online backup."""
+    for db in snapshot.DATABASES:
+        if os.path.exists(os.path.join(src, db)):
+            con = sqlite3.connect(os.path.join(src, db))
+            out = sqlite3.connect(os.path.join(dst, db))
+            con.backup(out)
+            out.close()
+            con.close()
+
+def size(directory):
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+
+def run(N, efficient, registrations):
+    cwd = os.getcwd()
+    out = {}
+    with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as dst, tempfile.TemporaryDirectory() as copy:
+        os.chdir(src)
+        build(N, efficient, registrations)
+        out["databases (bytes)"] = size(src)
+
+        path = os.path.join(copy, "deployment.snap")
+        start = perf_counter()
+        rows = snapshot.save(path)
+        out["save (s)"] = perf_counter()-start
+        out["snapshot (bytes)"] = os.path.getsize(path)
+        out["rows"] = sum(rows.values())
+
+        os.chdir(dst)
+        start = perf_counter()
+        snapshot.restore(path)
+        out["restore (s)"] = perf_counter()-start
+
+        os.remove(path)
+        start = perf_counter()
+        backup(src, copy)
+        out["sqlite backup (s)"] = perf_counter()-start
+        os.chdir(cwd)
+    return out
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="snapshot save/restore")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=10000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-r','--registrations',
+        type=int,
+        default=1000,
+        dest='registrations',
+        help='parties registered before the snapshot')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    out = run(args.N, args.eff, args.registrations)
+    for name, value in out.items():
+        print("{}:\t{}".format(name, round(value, 6) if isinstance(value, float) else value))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(out, f, indent=2)
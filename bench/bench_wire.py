@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Size and encode/parse/decode time of packed registration requests.
+
+Generates `-r` requests (keys and helping values from `gen`) and compares the
+packed format of `rbe/wire.py` with pickling the serialized elements: bytes per
+request, time to encode, to parse a file of requests (zero-copy, from an mmap),
+and to deserialize all helping values.
+"""
+
+from rbe import algos
+from rbe import wire
+from rbe.objects import *
+import argparse
+import json
+import mmap
+import os
+import pickle
+import random
+import tempfile
+from time import perf_counter
+
+def run(N, reps):
+    cwd = os.getcwd()
+    out = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        crs = algos.setup(N)
+        requests = []
+        for id in random.sample(range(crs.N), min(reps, crs.N)):
+            pk,sk,xi = algos.gen(crs, id)
+            requests += [(id, pk, xi)]
+
+        start = perf_counter()
+        with open("requests.bin", "wb") as f:
+            size = wire.write_requests(f, requests)
+        out["encode (s/request)"] = (perf_counter()-start)/len(requests)
+        out["packed (bytes/request)"] = size/len(requests)
+
+        start = perf_counter()
+        pickled = [pickle.dumps((id, pk.to_binary(), [h.to_binary() if h is not None else None for h in xi])) for id, pk, xi in requests]
+        out["pickle encode (s/request)"] = (perf_counter()-start)/len(requests)
+        out["pickle (bytes/request)"] = sum(len(p) for p in pickled)/len(requests)
+
+        with open("requests.bin", "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            start = perf_counter()
+            parsed = list(wire.iter_requests(mm, n=crs.n))
+            out["parse (s/request)"] = (perf_counter()-start)/len(requests)
+            start = perf_counter()
+            for request in parsed:
+                request.decode()
+            out["decode (s/request)"] = (perf_counter()-start)/len(requests)
+            # (the parsed requests are views of the mmap)
+            del parsed, request
+            mm.close()
+
+        start = perf_counter()
+        for p in pickled:
+            id, pk, xi = pickle.loads(p)
+            pk = G1Element.from_binary(pk)
+            xi = [G1Element.from_binary(h) if h is not None else None for h in xi]
+        out["pickle load and decode (s/request)"] = (perf_counter()-start)/len(requests)
+        os.chdir(cwd)
+    return out
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="packed registration requests")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=10000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-r','--requests',
+        type=int,
+        default=100,
+        dest='reps',
+        help='requests to generate')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    out = run(args.N, args.reps)
+    for name, value in out.items():
+        print("{}:\t{:.6g}".format(name, value))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(out, f, indent=2)
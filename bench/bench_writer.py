@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""Registration throughput and acknowledgement latency with group commit.
+
+Registers one block of parties (keys are generated up front) in a fresh
+directory, first with plain `reg` calls (one caller, several commits per
+registration), then through a `RegistrationWriter` fed by concurrent client
+threads, for each combination of batching window and sqlite synchronous mode.
+"""
+
+from rbe import algos
+from rbe import bitmap
+from rbe import stats
+from rbe.writer import RegistrationWriter
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+from time import perf_counter
+
+def fresh(N, efficient):
+    """Set up a new system in the current directory and generate keys for one block."""
+    for db in ["crs.db", "pp.db", "aux.db", "aux_count.db", "keys.db"]:
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(db+suffix):
+                os.remove(db+suffix)
+    if os.path.exists(bitmap.FILENAME):
+        os.remove(bitmap.FILENAME)
+    crs = algos.setup(N, efficient=efficient)
+    ids = random.sample(range(crs.n), crs.n)
+    keys = [(id,)+algos.gen(crs, id) for id in ids]
+    return crs, keys
+
+def bench_plain(N, efficient):
+    crs, keys = fresh(N, efficient)
+    latencies = []
+    start = perf_counter()
+    for id, pk, sk, xi in keys:
+        t = perf_counter()
+        algos.reg(crs, id, pk, xi, efficient=efficient)
+        latencies += [perf_counter()-t]
+    # keys.db, aux.db and pp.db (and aux_count.db in the regular variant) are committed by every reg
+    return len(keys)/(perf_counter()-start), stats.summarize(latencies), len(keys)*(3 if efficient else 4)
+
+def bench_writer(N, efficient, clients, window, max_batch, synchronous):
+    crs, keys = fresh(N, efficient)
+    latencies = []
+    lock = threading.Lock()
+
+    def client(chunk):
+        for id, pk, sk, xi in chunk:
+            t = perf_counter()
+            w.register(id, pk, xi)
+            with lock:
+                latencies.append(perf_counter()-t)
+
+    w = RegistrationWriter(crs, efficient=efficient, window=window, max_batch=max_batch, synchronous=synchronous)
+    threads = [threading.Thread(target=client, args=(keys[c::clients],)) for c in range(clients)]
+    start = perf_counter()
+    with w:
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    return len(keys)/(perf_counter()-start), stats.summarize(latencies), w.batches
+
+def report(name, throughput, summary, commits, results):
+    print("{:<36}\t{:.1f} reg/s\tack p50 {:.6f} s\tp99 {:.6f} s\t{} commits".format(name, throughput, summary["p50"], summary["p99"], commits))
+    results[name] = {"throughput": throughput, "latency": summary, "commits": commits}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="group commit of registrations")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=10000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-c','--clients',
+        type=int,
+        default=8,
+        dest='clients',
+        help='concurrent client threads')
+    parser.add_argument('-w','--window',
+        type=float,
+        nargs='+',
+        default=[0.0, 0.002, 0.01],
+        dest='window',
+        help='batching windows (s)')
+    parser.add_argument('-b','--max_batch',
+        type=int,
+        default=64,
+        dest='max_batch',
+        help='maximum registrations per commit')
+    parser.add_argument('-s','--synchronous',
+        nargs='+',
+        default=['NORMAL', 'FULL'],
+        dest='synchronous',
+        help='sqlite synchronous modes')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        report("plain reg", *bench_plain(args.N, args.eff), results)
+        for sync in args.synchronous:
+            for window in args.window:
+                name = "writer window={} sync={}".format(window, sync)
+                report(name, *bench_writer(args.N, args.eff, args.clients, window, args.max_batch, sync), results)
+        os.chdir(cwd)
+
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+"""Open-loop load generator with trace record and replay.
+
+A schedule of operations is generated from a seed: registrations (`gen` then
+`reg`), encryptions to registered ids, and reads (`upd` then `dec` by the
+recipient of an earlier ciphertext), each arriving as a Poisson process with its
+own rate. Blocks are chosen with Zipf-distributed popularity (`-k`, 0 for
+uniform), for new registrations and for recipients alike. Optionally, `-p`
+parties are registered before the clock starts.
+
+The schedule is run open-loop by `-c` client threads against the library
+(`reg` calls, one at a time, as a single curator would make them) or a
+`RegistrationWriter` (group commit), on a fresh deployment. It can be written to
+a trace file (`--record`) and replayed from it (`--replay`) against other
+targets or storage settings: the same operations, on the same ids, at the same
+offsets (scaled by `--speed`).
+
+Reported per interval (`-i`) and overall: throughput and p50/p99/p999 of the
+service time of gen, reg, enc, upd and dec, and the response time of each
+scheduled operation (from its scheduled time, so queueing is included).
+"""
+
+from rbe import algos
+from rbe import stats
+from rbe.objects import *
+from rbe.writer import RegistrationWriter
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil, sqrt
+from time import perf_counter, sleep
+
+TRACE_VERSION = 1
+OPS = ["gen", "reg", "enc", "upd", "dec"]
+EVENTS = ["reg", "enc", "read"]
+
+def _poisson(rng, rate, duration):
+    times = []
+    t = rng.expovariate(rate) if rate > 0 else duration
+    while t < duration:
+        times += [t]
+        t = t + rng.expovariate(rate)
+    return times
+
+class _Blocks:
+    """Blocks with Zipf(`skew`) popularity; the most popular blocks are spread at random."""
+
+    def __init__(self, rng, B, skew):
+        ranks = list(range(B))
+        rng.shuffle(ranks)
+        self.weight = {k: 1/(rank+1)**skew for k, rank in zip(range(B), ranks)}
+        self.rng = rng
+        self.blocks = []
+        self.cum = None
+
+    def add(self, k):
+        self.blocks += [k]
+        self.cum = None
+
+    def remove(self, k):
+        self.blocks.remove(k)
+        self.cum = None
+
+    def choose(self):
+        if len(self.blocks) == 0:
+            return None
+        if self.cum is None:
+            self.cum = []
+            total = 0.0
+            for k in self.blocks:
+                total = total + self.weight[k]
+                self.cum += [total]
+        return self.rng.choices(self.blocks, cum_weights=self.cum)[0]
+
+def generate(N, rates, duration, skew=0.0, prefill=0, seed=0, recent=100, n=None):
+    """Generate a schedule.
+
+    Parameters
+    ----------
+    N : int
+        maximum number of parties
+    rates : dict
+        arrivals per second of "reg", "enc" and "read"
+    duration : float
+        length of the schedule (s)
+    skew : float (optional)
+        Zipf exponent of block popularity (0: uniform)
+    prefill : int (optional)
+        registrations made before the clock starts
+    seed : int (optional)
+        random seed
+    recent : int (optional)
+        a read decrypts one of the last `recent` ciphertexts
+    n : int (optional)
+        block size of the CRS (default `ceil(sqrt(N))`)
+
+    Returns
+    -------
+    (dict, array of dict)
+        trace header, and events (`t`: offset in s, `None` for prefill; `op`;
+        `id` for reg and enc; `ct`: index of the ciphertext for enc and read)
+    """
+    rng = random.Random(seed)
+    n = int(ceil(sqrt(N))) if n is None else n
+    B = ceil(N/n)
+    header = {"trace": TRACE_VERSION, "N": N, "n": n, "rates": rates, "duration": duration, "skew": skew, "prefill": prefill, "seed": seed}
+
+    free = {}
+    open_blocks = _Blocks(rng, B, skew)
+    for k in range(B):
+        open_blocks.add(k)
+    registered = {}
+    used_blocks = _Blocks(rng, B, 0.0)
+    used_blocks.weight = open_blocks.weight
+
+    def new_id():
+        k = open_blocks.choose()
+        if k is None:
+            return None
+        if k not in free:
+            free[k] = list(range(k*n, min(k*n+n, N)))
+            rng.shuffle(free[k])
+        id = free[k].pop()
+        if len(free[k]) == 0:
+            open_blocks.remove(k)
+        if k not in registered:
+            registered[k] = []
+            used_blocks.add(k)
+        registered[k] += [id]
+        return id
+
+    events = []
+    for _ in range(min(prefill, N)):
+        events += [{"t": None, "op": "reg", "id": new_id()}]
+
+    arrivals = sorted([(t, op) for op in EVENTS for t in _poisson(rng, rates.get(op, 0), duration)])
+    cts = 0
+    for t, op in arrivals:
+        if op == "reg":
+            id = new_id()
+            if id is not None:
+                events += [{"t": t, "op": "reg", "id": id}]
+        elif op == "enc":
+            k = used_blocks.choose()
+            if k is not None:
+                events += [{"t": t, "op": "enc", "id": rng.choice(registered[k]), "ct": cts}]
+                cts = cts + 1
+        elif cts > 0:
+            events += [{"t": t, "op": "read", "ct": rng.randrange(max(0, cts-recent), cts)}]
+    return header, events
+
+def write_trace(path, header, events):
+    with open(path, 'w') as f:
+        f.write(json.dumps(header) + "\n")
+        for ev in events:
+            f.write(json.dumps(ev) + "\n")
+
+def read_trace(path):
+    with open(path) as f:
+        header = json.loads(f.readline())
+        if header.get("trace") != TRACE_VERSION:
+            raise ValueError("{} is not a version {} trace".format(path, TRACE_VERSION))
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+class Runner:
+    """Runs a schedule against the library or a `RegistrationWriter`."""
+
+    def __init__(self, crs, efficient, target, clients, window, synchronous):
+        self.crs = crs
+        self.efficient = efficient
+        self.clients = clients
+        self.writer = RegistrationWriter(crs, efficient=efficient, window=window, synchronous=synchronous) if target == "writer" else None
+        # plain `reg` calls must not overlap (they read, then write, each block's state)
+        self.reg_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.reg_done = {}
+        self.cts = {}
+        self.enc_done = {}
+        # (op, end offset, service time)
+        self.service = []
+        # (event, end offset, response time)
+        self.response = []
+        self.errors = 0
+        self.failed_decs = 0
+
+    def _record(self, op, start, end):
+        with self.lock:
+            self.service += [(op, end-self.clock, end-start)]
+
+    def _register(self, id):
+        start = perf_counter()
+        pk, sk, xi = algos.gen(self.crs, id)
+        mid = perf_counter()
+        self._record("gen", start, mid)
+        if self.writer is not None:
+            self.writer.register(id, pk, xi)
+        else:
+            with self.reg_lock:
+                algos.reg(self.crs, id, pk, xi, efficient=self.efficient)
+        self._record("reg", mid, perf_counter())
+        self.keys[id] = sk
+
+    def _run(self, ev, scheduled):
+        op = ev["op"]
+        try:
+            if op == "reg":
+                try:
+                    self._register(ev["id"])
+                finally:
+                    self.reg_done[ev["id"]].set()
+            elif op == "enc":
+                self.reg_done[ev["id"]].wait()
+                m = GT.generator()**GT.order().random()
+                start = perf_counter()
+                cts = algos.enc(self.crs, ev["id"], m, efficient=self.efficient)
+                self._record("enc", start, perf_counter())
+                self.cts[ev["ct"]] = (ev["id"], m, cts)
+                self.enc_done[ev["ct"]].set()
+            else:
+                self.enc_done[ev["ct"]].wait()
+                id, m, cts = self.cts[ev["ct"]]
+                start = perf_counter()
+                u = algos.upd(self.crs, id, efficient=self.efficient)
+                mid = perf_counter()
+                self._record("upd", start, mid)
+                m_prime = algos.dec(self.crs, id, self.keys[id], u, cts)
+                self._record("dec", mid, perf_counter())
+                if m_prime != m:
+                    with self.lock:
+                        self.failed_decs += 1
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            if op == "enc":
+                self.enc_done[ev["ct"]].set()
+            return
+        end = perf_counter()
+        with self.lock:
+            self.response += [(op, end-self.clock, end-scheduled)]
+
+    def run(self, events, speed=1.0):
+        for ev in events:
+            if ev["op"] == "reg":
+                self.reg_done[ev["id"]] = threading.Event()
+            elif ev["op"] == "enc":
+                self.enc_done[ev["ct"]] = threading.Event()
+        if self.writer is not None:
+            self.writer.start()
+
+        # prefill, before the clock starts (and not measured)
+        timed = [ev for ev in events if ev["t"] is not None]
+        self.clock = perf_counter()
+        for ev in events:
+            if ev["t"] is None:
+                self._run(ev, perf_counter())
+        self.service = []
+        self.response = []
+
+        self.clock = perf_counter()
+        with ThreadPoolExecutor(max_workers=self.clients) as pool:
+            for ev in timed:
+                scheduled = self.clock + ev["t"]/speed
+                delay = scheduled - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                pool.submit(self._run, ev, scheduled)
+        elapsed = perf_counter() - self.clock
+        if self.writer is not None:
+            self.writer.stop()
+        return elapsed
+
+def _summaries(records, names, interval, elapsed):
+    """Overall and per-interval throughput and percentiles of `(name, end, latency)` records."""
+    overall = {}
+    for name in names:
+        samples = [lat for op, end, lat in records if op == name]
+        overall[name] = stats.summarize(samples)
+        overall[name]["throughput"] = len(samples)/elapsed if elapsed > 0 else None
+    timeline = []
+    for i in range(int(ceil(elapsed/interval))):
+        window = {}
+        for name in names:
+            samples = [lat for op, end, lat in records if op == name and i*interval <= end < (i+1)*interval]
+            if len(samples) != 0:
+                window[name] = stats.summarize(samples)
+                window[name]["throughput"] = len(samples)/interval
+        timeline += [{"t": i*interval, "ops": window}]
+    return overall, timeline
+
+def run(header, events, efficient, target, clients, window, synchronous, journal, interval, speed):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            crs = algos.setup(header["N"], efficient=efficient, n=header["n"])
+            for db in ["pp.db", "aux.db", "aux_count.db"]:
+                con = sqlite3.connect(db)
+                con.execute("PRAGMA journal_mode={}".format(journal))
+                con.close()
+            runner = Runner(crs, efficient, target, clients, window, synchronous)
+            elapsed = runner.run(events, speed)
+        finally:
+            os.chdir(cwd)
+
+    service, service_timeline = _summaries(runner.service, OPS, interval, elapsed)
+    response, response_timeline = _summaries(runner.response, EVENTS, interval, elapsed)
+    return {
+        "config": {"efficient": efficient, "target": target, "clients": clients, "window": window, "synchronous": synchronous, "journal": journal, "speed": speed},
+        "trace": header,
+        "elapsed": elapsed,
+        "errors": runner.errors,
+        "failed_decs": runner.failed_decs,
+        "service": service,
+        "response": response,
+        "timeline": [{"t": s["t"], "service": s["ops"], "response": r["ops"]} for s, r in zip(service_timeline, response_timeline)],
+    }
+
+def print_results(out):
+    print("{:.1f} s, {} errors, {} failed decryptions".format(out["elapsed"], out["errors"], out["failed_decs"]))
+    for kind in ["service", "response"]:
+        print(kind)
+        for name, s in out[kind].items():
+            if s["n"] == 0:
+                continue
+            print("    {}:\t{:.1f} op/s\tp50 {:.6f} s\tp99 {:.6f} s\tp999 {:.6f} s\t(n={})".format(name, s["throughput"], s["p50"], s["p99"], s["p999"], s["n"]))
+    print("over time (response p99 (s), op/s)")
+    for w in out["timeline"]:
+        print("    {:>6.1f} s\t".format(w["t"]) + "\t".join("{} {:.6f} {:.1f}".format(name, s["p99"], s["throughput"]) for name, s in w["response"].items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="open-loop load generator")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=10000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-n','--block-size',
+        type=int,
+        default=None,
+        dest='n',
+        help='block size (default: sqrt(N); a replayed trace has its own)')
+    parser.add_argument('--reg-rate',
+        type=float,
+        default=5.0,
+        dest='reg_rate',
+        help='registrations per second')
+    parser.add_argument('--enc-rate',
+        type=float,
+        default=20.0,
+        dest='enc_rate',
+        help='encryptions per second')
+    parser.add_argument('--read-rate',
+        type=float,
+        default=20.0,
+        dest='read_rate',
+        help='reads (upd and dec) per second')
+    parser.add_argument('-d','--duration',
+        type=float,
+        default=30.0,
+        dest='duration',
+        help='length of the schedule (s)')
+    parser.add_argument('-k','--skew',
+        type=float,
+        default=1.0,
+        dest='skew',
+        help='Zipf exponent of block popularity (0: uniform)')
+    parser.add_argument('-p','--prefill',
+        type=int,
+        default=100,
+        dest='prefill',
+        help='parties registered before the clock starts')
+    parser.add_argument('--seed',
+        type=int,
+        default=0,
+        dest='seed',
+        help='random seed of the schedule')
+    parser.add_argument('--record',
+        default=None,
+        dest='record',
+        help='write the schedule to this trace file')
+    parser.add_argument('--replay',
+        default=None,
+        dest='replay',
+        help='run the schedule in this trace file (instead of generating one)')
+    parser.add_argument('--speed',
+        type=float,
+        default=1.0,
+        dest='speed',
+        help='replay speed-up')
+    parser.add_argument('-t','--target',
+        default='library',
+        choices=['library', 'writer'],
+        dest='target',
+        help='plain reg calls, or a RegistrationWriter')
+    parser.add_argument('-c','--clients',
+        type=int,
+        default=8,
+        dest='clients',
+        help='client threads')
+    parser.add_argument('-w','--window',
+        type=float,
+        default=0.002,
+        dest='window',
+        help='batching window of the writer (s)')
+    parser.add_argument('-s','--synchronous',
+        default='NORMAL',
+        dest='synchronous',
+        help='sqlite synchronous mode of the writer')
+    parser.add_argument('-j','--journal',
+        default='wal',
+        choices=['wal', 'delete'],
+        dest='journal',
+        help='sqlite journal mode of pp/aux/aux_count')
+    parser.add_argument('-i','--interval',
+        type=float,
+        default=5.0,
+        dest='interval',
+        help='reporting interval (s)')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        header, events = read_trace(args.replay)
+        if args.n is not None and args.n != header["n"]:
+            parser.error("the trace is for blocks of {} ids, not {}".format(header["n"], args.n))
+    else:
+        rates = {"reg": args.reg_rate, "enc": args.enc_rate, "read": args.read_rate}
+        header, events = generate(args.N, rates, args.duration, args.skew, args.prefill, args.seed, n=args.n)
+    if args.record is not None:
+        write_trace(args.record, header, events)
+
+    out = run(header, events, args.eff, args.target, args.clients, args.window, args.synchronous, args.journal, args.interval, args.speed)
+    print_results(out)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(out, f, indent=2)
@@ -1,108 +1,128 @@
 #!/usr/bin/env python
 
-"""Simulate parameters when all N parties are registered.
+"""Estimate parameter sizes when all N parties are registered.
 
-Outputs: 
+Outputs:
 - sizes of elements of G1, G2, GT, and scalar (sk)
-- size of aux and pp for both regular and efficient construction
+- size of crs, pp, aux and keys for both regular and efficient construction
+
+Sizes come from two sources (see rbe/costmodel.py for the table layouts):
+- an exact per-record accounting of each storage backend: the stored values
+  only ("payload"), sqlite b-tree cells on full pages ("sqlite"), and the
+  packed ("compact") and rowid-addressed ("mmap") binary layouts;
+- a sampled build: a small sqlite database is built for every table, and the
+  measured bytes per row (including sqlite's page and fill overhead) are
+  extrapolated to the full number of rows ("sqlite sampled").
 """
 
-from petrelic.multiplicative.pairing import G1,G2,GT,G1Element,G2Element,GTElement
-# from petrelic import bn
-import sqlite3
-from math import ceil,log2,sqrt
+from rbe import costmodel
+import argparse
 import os
+import random
+import sqlite3
+import tempfile
 
-def print_element_sizes():
-    print("G1 element size:\t",len(G1Element.to_binary(G1.generator()**G1.order().random())))
-    print("G2 element size:\t",len(G2Element.to_binary(G2.generator()**G2.order().random())))
-    print("GT element size:\t",len(GTElement.to_binary(GT.generator()**GT.order().random())))
-    print("SK size:\t",len(G1.order().random().binary()))
+BACKENDS = ["payload", "sqlite", "compact", "mmap"]
 
-def print_aux_size(N, n, t, eff=False):
-    g1_rand = G1Element.to_binary(G1.generator()**G1.order().random())
-    # efficient update construction
-    if eff:
-        filename = "aux_size_eff_{}.db".format(N)
-        con = sqlite3.connect(filename)
-        cur = con.cursor()
-        cur.execute('''CREATE TABLE L (upd BLOB)''')
-        cur.execute('''CREATE TABLE L_upd_num (upd INTEGER)''')
-        for j in range(N):
-            cur.execute('''INSERT INTO L_upd_num (rowid, upd) VALUES (?,?)''',(j,0))
-        for i in range(t):
-            # decoms for each block, broken into tables by update "chunk" (<= logn due to merge)
-            cur.execute('''CREATE TABLE aux_{} (upd BLOB)'''.format(i))
-            cur.execute('''CREATE TABLE aux_reg_count_{} (num INTEGER)'''.format(i))
-            for j in range(N):
-                cur.execute('''INSERT INTO aux_reg_count_{} (rowid, num) VALUES (?,?)'''.format(i),(j,0))
-                cur.execute('''INSERT INTO aux_{} (rowid, upd) VALUES (?,?)'''.format(i),(j,g1_rand))
-        con.commit()
-        con.close()
-        print("aux size (efficient):\t",os.path.getsize(filename))
-        #os.remove(filename)
-    # regular construction
-    else:
-        filename = "aux_size_not_eff_{}.db".format(N)
-        con = sqlite3.connect(filename)
-        cur = con.cursor()
-        cur.execute('''CREATE TABLE aux (upd BLOB)''')
-        for i in range(N*n):
-            cur.execute('''INSERT INTO aux (rowid, upd) VALUES (?,?)''',(i,g1_rand))
-        con.commit()
-        con.close()
-        print("aux size (regular):\t",os.path.getsize(filename))
-        # os.remove(filename)
+def element_sizes():
+    """Measured element sizes, or the BLS12-381 defaults if petrelic is not available."""
+    try:
+        from petrelic.multiplicative.pairing import G1,G2,GT,G1Element,G2Element,GTElement
+    except ImportError:
+        return dict(costmodel.DEFAULT_SIZES)
+    return dict(costmodel.DEFAULT_SIZES,
+        g1=len(G1Element.to_binary(G1.generator()**G1.order().random())),
+        g2=len(G2Element.to_binary(G2.generator()**G2.order().random())),
+        gt=len(GTElement.to_binary(GT.generator()**GT.order().random())),
+        scalar=len(G1.order().random().binary()))
+
+def print_element_sizes(elem):
+    print("G1 element size:\t",elem["g1"])
+    print("G2 element size:\t",elem["g2"])
+    print("GT element size:\t",elem["gt"])
+    print("SK size:\t",elem["scalar"])
 
-def print_pp_size(N, n, t, eff=False):
-    g1_rand = G1Element.to_binary(G1.generator()**G1.order().random())
-    # efficient update construction
-    if eff:
-        filename = "pp_size_eff_{}.db".format(N)
-        con = sqlite3.connect(filename)
-        cur = con.cursor()
-        for i in range(t):
-            # coms for each block, broken into tables by update "chunk" (<= logn due to merge)
-            cur.execute('''CREATE TABLE pp_{} (commitment BLOB)'''.format(i))
-            for j in range(n):
-                cur.execute("INSERT INTO PP_{}(rowid, commitment) VALUES(?,?)".format(i),(j,g1_rand))
-        # n rows with each row corresponding to a block of commitments C^i_1 ... C^i_log n; row i stores the number of parties registered in block i (the sum of the parties in each commitment in that block, i.e. the sum of a block in pp_com_count)
-        cur.execute(''' CREATE TABLE pp_block_count (num INTEGER)''')
-        # nlogn rows with each row corresponding to a commitment; row i stores number of parties registered under commitment i (pk's contained in that commitment)
-        cur.execute(''' CREATE TABLE pp_com_count (num INTEGER)''')
-        # initialise all counts to zero
-        for i in range(n):
-            cur.execute("INSERT INTO pp_block_count(rowid, num) VALUES (?,?)",(i,0))
-            for j in range(t):
-                cur.execute("INSERT INTO pp_com_count(rowid, num) VALUES (?,?)",(i*n+j,0))
-        con.commit()
-        con.close()
-        print("pp size (efficient):\t",os.path.getsize(filename))
-        #os.remove(filename)
-    # regular construction
+def sample_table_bytes(spec, sample, workdir):
+    """Measure bytes per row of a table by building it with (at most) `sample` rows.
+
+    Rowids follow the table's layout: consecutive for dense tables, otherwise
+    spread over the whole rowid range (inserted in random order for tables that
+    are filled out of order).
+    """
+    rows = min(spec["rows"], sample)
+    if rows == 0:
+        return 0.0
+    filename = os.path.join(workdir, "sample.db")
+    con = sqlite3.connect(filename)
+    cur = con.cursor()
+    columns = ["c{} INTEGER".format(i) for i in range(len(spec["ints"]))]
+    columns += ["v BLOB"] if spec["blob"] else []
+    cur.execute("CREATE TABLE t ({})".format(", ".join(columns)))
+    con.commit()
+    empty = os.path.getsize(filename)
+
+    if spec["dense"]:
+        rowids = list(range(rows))
     else:
-        filename = "pp_size_not_eff_{}.db".format(N)
-        con = sqlite3.connect(filename)
-        cur = con.cursor()
-        cur.execute('''CREATE TABLE pp (commitment BLOB)''')
-        for i in range(n):
-            cur.execute('''INSERT INTO pp (rowid, commitment) VALUES (?,?)''',(i,g1_rand))
-        con.commit()
-        con.close()
-        print("pp size (regular):\t",os.path.getsize(filename))
-        #os.remove(filename)
+        # same rowid density as the full table
+        span = min(spec["max_rowid"]+1, max(rows, (spec["max_rowid"]+1)*rows//spec["rows"]))
+        rowids = sorted(random.sample(range(span), rows))
+        if spec["scattered"]:
+            random.shuffle(rowids)
+    values = spec["ints"] + ([os.urandom(spec["blob"])] if spec["blob"] else [])
+    names = "".join(", "+c.split()[0] for c in columns)
+    marks = ",".join("?"*(len(values)+1))
+    cur.executemany("INSERT INTO t(rowid{}) VALUES ({})".format(names, marks), ((r, *values) for r in rowids))
+    con.commit()
+    con.close()
+    size = os.path.getsize(filename)
+    os.remove(filename)
+    return (size-empty)/rows
+
+def sampled_sizes(N, efficient, elem, sample=20000):
+    """sqlite sizes extrapolated from sampled builds of every table (bytes per database)."""
+    specs = costmodel.tables(N, efficient, elem)
+    out = {}
+    roots = set()
+    with tempfile.TemporaryDirectory() as workdir:
+        for spec in specs:
+            per_row = sample_table_bytes(spec, sample, workdir)
+            # plus the schema page of the database and the root page of each table
+            out[spec["db"]] = out.get(spec["db"], 4096) + per_row*spec["rows"]
+            if (spec["db"], spec["table"]) not in roots:
+                roots.add((spec["db"], spec["table"]))
+                out[spec["db"]] += 4096
+    out["aux"] = out.get("aux", 0) + out.pop("aux_count", 0)
+    return {db: int(size) for db, size in out.items()}
+
+def print_sizes(N, efficient, elem, sample):
+    variant = "efficient" if efficient else "regular"
+    reports = {b: costmodel.sizes(N, efficient, elem, backend=b) for b in BACKENDS}
+    reports["sqlite sampled"] = sampled_sizes(N, efficient, elem, sample)
+    for name in ["pp", "aux", "crs", "keys"]:
+        print("{} size ({}):".format(name, variant))
+        for backend, report in reports.items():
+            print("    {:<16}\t{}".format(backend, report[name]))
 
 if __name__ == "__main__":
-    print_element_sizes()
+    parser = argparse.ArgumentParser(description="estimate parameter sizes for a full system")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        nargs='+',
+        default=[10000, 100000, 1000000, 10000000, 100000000],
+        dest='N',
+        help='values of N')
+    parser.add_argument('-s','--sample',
+        type=int,
+        default=20000,
+        dest='sample',
+        help='rows per table in the sampled builds')
+    args = parser.parse_args()
 
-    # 10K ... 10M
-    N_arr = [10000, 100000, 1000000, 10000000]
-    for N in N_arr:
-        n = ceil(sqrt(N))
-        t = ceil(log2(n))
+    elem = element_sizes()
+    print_element_sizes(elem)
 
+    for N in args.N:
         print("\nN = {}".format(N))
-        print_aux_size(N, n, t, eff=True)
-        print_pp_size(N, n, t, eff=True)
-        print_aux_size(N, n, t, eff=False)
-        print_pp_size(N, n, t, eff=False)
+        print_sizes(N, True, elem, args.sample)
+        print_sizes(N, False, elem, args.sample)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Predict runtimes and parameter sizes at scale with the analytical cost model.
+
+Takes per-primitive costs measured by bench-ops/ops-micro.py and predicts, for
+any N, the latency of each algorithm, the total time to register all N users
+(including merge cascades), and the sizes of crs/pp/aux/keys, without running
+the scheme. Predictions are written as JSON.
+
+With `--validate N`, the scheme is actually run at a small N (one block is
+filled, then enc/upd/dec are run) under `rbe.instrument`, and the measured
+operation counts and times are compared with the model's predictions.
+"""
+
+from rbe import costmodel
+import argparse
+import json
+import os
+import random
+import tempfile
+
+def print_prediction(pred):
+    print("N = {}, n = {} ({} variant)".format(pred["N"], pred["n"], pred["variant"]))
+    for alg, t in pred["latency"].items():
+        print("    {}:\t{:.6f} s".format(alg, t))
+    print("    registration of all N:\t{:.1f} s".format(pred["reg_total"]))
+    for name in ["crs", "pp", "aux", "keys"]:
+        print("    {} size:\t{} bytes".format(name, pred["sizes"][name]))
+
+def validate(N, efficient, costs, n=None):
+    """Run the scheme at small `N` and compare operation counts (and times) with the model."""
+    # imported here so that predictions work without petrelic
+    from rbe import algos, instrument
+    from rbe.objects import GT
+
+    cwd = os.getcwd()
+    predicted = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            with instrument.Recorder() as rec:
+                crs = algos.setup(N, efficient=efficient, n=n)
+                predicted["setup"] = costmodel.ops_setup(N, efficient, n)
+                predicted["reg"] = costmodel._ops()
+                predicted["merge"] = costmodel._ops()
+                predicted["gen"] = costmodel.add(costmodel._ops(), costmodel.ops_gen(N, n), crs.n)
+                sks = {}
+                ids = random.sample(range(crs.n), crs.n)
+                for c in range(crs.n):
+                    pk,sk,xi = algos.gen(crs, ids[c])
+                    algos.reg(crs, ids[c], pk, xi, efficient=efficient)
+                    sks[ids[c]] = sk
+                    predicted["reg"] = costmodel.add(predicted["reg"], costmodel.ops_reg(N, c, efficient, ids[c] % crs.n, c == 0, n))
+                    if efficient:
+                        predicted["merge"] = costmodel.add(predicted["merge"], costmodel.ops_merge(N, c, n))
+                target = ids[0]
+                m = GT.generator()**GT.order().random()
+                ct = algos.enc(crs, target, m, efficient=efficient)
+                u = algos.upd(crs, target, efficient=efficient)
+                assert(algos.dec(crs, target, sks[target], u, ct) == m)
+                predicted["enc"] = costmodel.ops_enc(N, crs.n, efficient, n)
+                predicted["upd"] = costmodel.ops_upd(N, efficient, n)
+                predicted["dec"] = costmodel.ops_dec_expected(N, crs.n, efficient, n=n)
+        finally:
+            os.chdir(cwd)
+
+    mismatches = 0
+    for alg, pred in predicted.items():
+        measured = rec.algorithms.get(alg, {"ops": {}, "time": 0.0})
+        line = "{}:".format(alg)
+        for p in costmodel.PRIMITIVES:
+            got = measured["ops"].get(p, {"count": 0})["count"]
+            if got != pred[p]:
+                line += "  {} {} (model {:g})".format(p, got, pred[p])
+                # dec depends on where the matching update is, which the model only knows in expectation
+                mismatches += alg != "dec"
+        if costs is not None:
+            line += "  time {:.6f} s (model {:.6f} s)".format(measured["time"], costmodel.cost(pred, costs))
+        print(line)
+    print("counts match the model" if mismatches == 0 else "{} count mismatches".format(mismatches))
+    return mismatches
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="predict RBE runtimes and sizes with the cost model")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        nargs='+',
+        default=[10000, 100000, 1000000, 10000000, 100000000],
+        dest='N',
+        help='values of N to predict')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-n','--block-size',
+        type=int,
+        default=None,
+        dest='n',
+        help='block size (default: sqrt(N))')
+    parser.add_argument('-c','--costs',
+        default=None,
+        dest='costs',
+        help='primitive costs (json output of bench-ops/ops-micro.py)')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write predictions to this json file')
+    parser.add_argument('--validate',
+        type=int,
+        default=None,
+        dest='validate',
+        help='run the scheme at this (small) N and compare with the model')
+    args = parser.parse_args()
+
+    costs = None
+    elem = costmodel.DEFAULT_SIZES
+    if args.costs is not None:
+        with open(args.costs) as f:
+            micro = json.load(f)
+        costs = costmodel.load_costs(micro)
+        elem = dict(elem, **micro.get("sizes", {}))
+
+    if args.validate is not None:
+        exit(1 if validate(args.validate, args.eff, costs, args.n) else 0)
+
+    if costs is None:
+        print("primitive costs are required for predictions (-c ops.json)")
+        exit(1)
+    preds = [costmodel.predict(N, costs, args.eff, elem, args.n) for N in args.N]
+    for pred in preds:
+        print_prediction(pred)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(preds, f, indent=2)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""Benchmark suite for the RBE algorithms.
+
+Times setup, gen, reg, enc, upd, dec and merge for both variants with
+`time.perf_counter`, warmup calls and repetitions. Every configuration runs in
+its own temporary directory, so no database in the current directory is touched.
+Summary statistics (mean, stdev, p50/p95/p99, 95% confidence interval of the
+mean) are written as JSON, keyed by "N/variant/backend".
+
+With `--compare baseline.json`, the results are checked against a saved run and
+regressions are reported (exit status 1 if there are any).
+"""
+
+from rbe import algos
+from rbe import stats
+from rbe.objects import *
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from time import perf_counter
+
+VARIANTS = {"regular": False, "efficient": True}
+BACKENDS = ["sqlite"]
+OPS = ["setup", "gen", "reg", "merge", "enc", "upd", "dec"]
+
+def result_key(N, variant, backend):
+    return "{}/{}/{}".format(N, variant, backend)
+
+class MergeTimer:
+    """Times the outermost `algos.merge` calls made from within `reg`."""
+    def __init__(self):
+        self.samples = []
+        self.depth = 0
+        self.merge = algos.merge
+
+    def __call__(self, *args):
+        self.depth += 1
+        start = perf_counter()
+        try:
+            return self.merge(*args)
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.samples += [perf_counter()-start]
+
+    def __enter__(self):
+        algos.merge = self
+        return self
+
+    def __exit__(self, *exc):
+        algos.merge = self.merge
+
+def bench_setup(N, efficient, reps, warmup):
+    """Time `setup`, each call in a fresh directory."""
+    samples = []
+    cwd = os.getcwd()
+    for i in range(warmup+reps):
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                start = perf_counter()
+                algos.setup(N, efficient=efficient)
+                elapsed = perf_counter()-start
+            finally:
+                os.chdir(cwd)
+        if i >= warmup:
+            samples += [elapsed]
+    return samples
+
+def bench_config(N, efficient, reps, warmup):
+    """Time all algorithms for one setting of N and variant.
+
+    One block is filled with registrations (each `reg` is a sample, the first
+    `warmup` are discarded); enc/upd/dec are then timed on registered ids.
+    """
+    samples = {op: [] for op in OPS}
+    samples["setup"] = bench_setup(N, efficient, reps, warmup)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            crs = algos.setup(N, efficient=efficient)
+
+            samples["gen"] = stats.measure(lambda: algos.gen(crs, random.randrange(crs.N)), reps, warmup)
+
+            sks = {}
+            ids = random.sample(range(crs.n), crs.n)
+            with MergeTimer() as merges:
+                for i in range(len(ids)):
+                    pk,sk,xi = algos.gen(crs, ids[i])
+                    start = perf_counter()
+                    algos.reg(crs, ids[i], pk, xi, efficient=efficient)
+                    elapsed = perf_counter()-start
+                    sks[ids[i]] = sk
+                    if i >= warmup:
+                        samples["reg"] += [elapsed]
+            samples["merge"] = merges.samples
+
+            targets = [random.choice(ids) for _ in range(warmup+reps)]
+            msgs = [GT.generator()**GT.order().random() for _ in targets]
+            cts = [None]*len(targets)
+            upds = [None]*len(targets)
+            for op in ["enc", "upd", "dec"]:
+                for i in range(len(targets)):
+                    start = perf_counter()
+                    if op == "enc":
+                        cts[i] = algos.enc(crs, targets[i], msgs[i], efficient=efficient)
+                    elif op == "upd":
+                        upds[i] = algos.upd(crs, targets[i], efficient=efficient)
+                    else:
+                        m = algos.dec(crs, targets[i], sks[targets[i]], upds[i], cts[i])
+                    elapsed = perf_counter()-start
+                    if op == "dec":
+                        assert(m == msgs[i])
+                    if i >= warmup:
+                        samples[op] += [elapsed]
+        finally:
+            os.chdir(cwd)
+
+    return {op: stats.summarize(samples[op]) for op in OPS}
+
+def compare(baseline, results, threshold):
+    """Print regressions of `results` against `baseline`; return how many were found."""
+    found = 0
+    for key, res in results.items():
+        if key not in baseline:
+            continue
+        for op, slowdown in stats.regressions(baseline[key]["ops"], res["ops"], threshold):
+            print("REGRESSION {} {}: p50 {:+.1%}".format(key, op, slowdown))
+            found += 1
+    return found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark suite for all RBE algorithms")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        nargs='+',
+        default=[100, 1000],
+        dest='N',
+        help='values of N to benchmark')
+    parser.add_argument('-v','--variants',
+        nargs='+',
+        choices=list(VARIANTS),
+        default=list(VARIANTS),
+        dest='variants',
+        help='scheme variants to benchmark')
+    parser.add_argument('-b','--backend',
+        choices=BACKENDS,
+        default=BACKENDS[0],
+        dest='backend',
+        help='storage backend')
+    parser.add_argument('-r','--reps',
+        type=int,
+        default=10,
+        dest='reps',
+        help='timed repetitions per operation')
+    parser.add_argument('-w','--warmup',
+        type=int,
+        default=2,
+        dest='warmup',
+        help='untimed warmup repetitions per operation')
+    parser.add_argument('-o','--out',
+        default='bench.json',
+        dest='out',
+        help='output json file')
+    parser.add_argument('-c','--compare',
+        default=None,
+        dest='baseline',
+        help='saved json results to check for regressions')
+    parser.add_argument('-t','--threshold',
+        type=float,
+        default=0.1,
+        dest='threshold',
+        help='tolerated relative slowdown of the median in compare mode')
+    args = parser.parse_args()
+
+    results = {}
+    for N in args.N:
+        for variant in args.variants:
+            print("N = {}, {} variant, {} backend".format(N, variant, args.backend), flush=True)
+            ops = bench_config(N, VARIANTS[variant], args.reps, args.warmup)
+            results[result_key(N, variant, args.backend)] = {
+                "N": N,
+                "variant": variant,
+                "backend": args.backend,
+                "ops": ops,
+            }
+            for op in OPS:
+                s = ops[op]
+                if s["n"] != 0:
+                    print("    {}:\tp50 {:.6f}\tp99 {:.6f}\tmean {:.6f} +- {:.6f}\t(n={})".format(op, s["p50"], s["p99"], s["mean"], s["ci95"], s["n"]))
+
+    out = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "reps": args.reps,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(out, f, indent=2)
+    print("results written to", args.out)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(baseline, results, args.threshold) != 0:
+            exit(1)
+        print("no regressions")
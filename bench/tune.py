@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""Recommend a block size `n` for a workload mix.
+
+The block size trades gen/reg cost (O(n) helping values, pairing checks and aux
+updates) against the number of blocks and the cost of enc, upd and dec. For a
+mix of operation rates (registrations, encryptions and reads, i.e. upd+dec, per
+second), the cost model (see rbe/costmodel.py) predicts for every candidate `n`
+the busy time per second of workload
+
+    reg-rate*(gen + reg) + enc-rate*enc + read-rate*(upd + dec)
+
+(reg includes its share of merges; enc/upd/dec are for a full block), from
+primitive costs measured by bench-ops/ops-micro.py. Computation alone favours
+small blocks; what bounds them is the size of the public parameters (the crs
+grows with n, pp with the number of blocks N/n), which encryptors need. So
+candidates whose crs+pp exceed `--max-params` (by default, their size at
+n = sqrt(N)) or whose aux exceeds `--max-aux` (with all N registered) are left
+out. Candidates are spread geometrically over `[--min-n, --max-n]` and refined
+around the best one. The candidates with the lowest predicted cost can then be
+measured (`-m`): one block is filled and enc/upd/dec timed at that `n`.
+"""
+
+from rbe import costmodel
+import argparse
+import json
+import os
+import random
+import tempfile
+from math import ceil, sqrt
+from time import perf_counter
+
+def grid(lo, hi, count):
+    """About `count` integers spread geometrically over [lo, hi]."""
+    if hi <= lo or count < 2:
+        return [lo]
+    return sorted(set(round(lo*(hi/lo)**(i/(count-1))) for i in range(count)))
+
+def objective(latency, mix):
+    """Busy time (s) per second of workload, from per-operation latencies."""
+    return mix["reg"]*(latency["gen"]+latency["reg"]) + mix["enc"]*latency["enc"] + mix["read"]*(latency["upd"]+latency["dec"])
+
+def model(N, n, efficient, costs, elem, mix):
+    pred = costmodel.predict(N, costs, efficient, elem, n)
+    return {
+        "latency": pred["latency"],
+        "objective": objective(pred["latency"], mix),
+        "params": pred["sizes"]["crs"] + pred["sizes"]["pp"],
+        "aux": pred["sizes"]["aux"],
+    }
+
+def fits(res, max_params, max_aux):
+    return (max_params is None or res["params"] <= max_params) and (max_aux is None or res["aux"] <= max_aux)
+
+def search(N, efficient, costs, elem, mix, lo, hi, count, max_params, max_aux):
+    """Model every candidate (with one refinement around the best); returns them by `n`."""
+    evaluated = {}
+    candidates = grid(lo, hi, count) + [ceil(sqrt(N))]
+    for _ in range(2):
+        for n in candidates:
+            if n not in evaluated:
+                evaluated[n] = model(N, n, efficient, costs, elem, mix)
+        feasible = sorted(n for n in evaluated if fits(evaluated[n], max_params, max_aux))
+        if len(feasible) == 0:
+            break
+        best = min(feasible, key=lambda n: evaluated[n]["objective"])
+        # between the neighbouring candidates of the best one
+        i = feasible.index(best)
+        candidates = grid(feasible[max(i-1, 0)], feasible[min(i+1, len(feasible)-1)], count)
+    return evaluated
+
+def measure(N, n, efficient, reps):
+    """Mean latency of each operation at block size `n` (one block filled)."""
+    # imported here so that the model works without petrelic
+    from rbe import algos
+    from rbe.objects import GT
+
+    cwd = os.getcwd()
+    samples = {op: [] for op in ["gen", "reg", "enc", "upd", "dec"]}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            crs = algos.setup(N, efficient=efficient, n=n)
+            sks = {}
+            ids = random.sample(range(crs.n), crs.n)
+            for id in ids:
+                start = perf_counter()
+                pk,sk,xi = algos.gen(crs, id)
+                samples["gen"] += [perf_counter()-start]
+                start = perf_counter()
+                algos.reg(crs, id, pk, xi, efficient=efficient)
+                samples["reg"] += [perf_counter()-start]
+                sks[id] = sk
+            for _ in range(reps):
+                id = random.choice(ids)
+                m = GT.generator()**GT.order().random()
+                start = perf_counter()
+                cts = algos.enc(crs, id, m, efficient=efficient)
+                samples["enc"] += [perf_counter()-start]
+                start = perf_counter()
+                u = algos.upd(crs, id, efficient=efficient)
+                samples["upd"] += [perf_counter()-start]
+                start = perf_counter()
+                assert(algos.dec(crs, id, sks[id], u, cts) == m)
+                samples["dec"] += [perf_counter()-start]
+        finally:
+            os.chdir(cwd)
+    return {op: sum(s)/len(s) for op, s in samples.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="recommend a block size for a workload mix")
+    parser.add_argument('-N','--max_parties',
+        type=int,
+        default=1000000,
+        dest='N',
+        help='maximum number of parties')
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-c','--costs',
+        required=True,
+        dest='costs',
+        help='primitive costs (json output of bench-ops/ops-micro.py)')
+    parser.add_argument('--reg-rate',
+        type=float,
+        default=1.0,
+        dest='reg_rate',
+        help='registrations per second')
+    parser.add_argument('--enc-rate',
+        type=float,
+        default=10.0,
+        dest='enc_rate',
+        help='encryptions per second')
+    parser.add_argument('--read-rate',
+        type=float,
+        default=10.0,
+        dest='read_rate',
+        help='upd+dec per second')
+    parser.add_argument('--min-n',
+        type=int,
+        default=2,
+        dest='min_n',
+        help='smallest block size considered')
+    parser.add_argument('--max-n',
+        type=int,
+        default=None,
+        dest='max_n',
+        help='largest block size considered (default: 16*sqrt(N), at most N)')
+    parser.add_argument('-k','--candidates',
+        type=int,
+        default=24,
+        dest='count',
+        help='block sizes modelled per pass')
+    parser.add_argument('--max-params',
+        type=int,
+        default=None,
+        dest='max_params',
+        help='largest crs+pp allowed (bytes; default: their size at n = sqrt(N); 0: no bound)')
+    parser.add_argument('--max-aux',
+        type=int,
+        default=None,
+        dest='max_aux',
+        help='largest aux allowed (bytes, with all N registered)')
+    parser.add_argument('-m','--measure',
+        type=int,
+        default=0,
+        dest='measure',
+        help='measure the best this many candidates by running the scheme')
+    parser.add_argument('-r','--reps',
+        type=int,
+        default=10,
+        dest='reps',
+        help='enc/upd/dec calls per measured candidate')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write results to this json file')
+    args = parser.parse_args()
+
+    with open(args.costs) as f:
+        micro = json.load(f)
+    costs = costmodel.load_costs(micro)
+    elem = dict(costmodel.DEFAULT_SIZES, **micro.get("sizes", {}))
+    mix = {"reg": args.reg_rate, "enc": args.enc_rate, "read": args.read_rate}
+    max_n = args.max_n if args.max_n is not None else min(args.N, 16*ceil(sqrt(args.N)))
+    sqrt_n = ceil(sqrt(args.N))
+    if args.max_params is None:
+        args.max_params = model(args.N, sqrt_n, args.eff, costs, elem, mix)["params"]
+    elif args.max_params == 0:
+        args.max_params = None
+
+    evaluated = search(args.N, args.eff, costs, elem, mix, max(args.min_n, 1), max_n, args.count, args.max_params, args.max_aux)
+    feasible = [n for n in evaluated if fits(evaluated[n], args.max_params, args.max_aux)]
+    if len(feasible) == 0:
+        print("no block size in [{}, {}] keeps crs+pp within {} bytes and aux within {} bytes".format(args.min_n, max_n, args.max_params, args.max_aux))
+        exit(1)
+    ranked = sorted(feasible, key=lambda n: evaluated[n]["objective"])
+
+    candidates = []
+    for n in ranked:
+        res = dict(n=n, **evaluated[n])
+        if len(candidates) < args.measure:
+            res["measured"] = measure(args.N, n, args.eff, args.reps)
+            res["measured_objective"] = objective(res["measured"], mix)
+        candidates += [res]
+    measured = [c for c in candidates if "measured" in c]
+    recommended = min(measured, key=lambda c: c["measured_objective"]) if len(measured) != 0 else candidates[0]
+
+    print("N = {} ({} variant), {} reg/s, {} enc/s, {} upd+dec/s".format(args.N, "efficient" if args.eff else "regular", args.reg_rate, args.enc_rate, args.read_rate))
+    for c in candidates[:10]:
+        line = "    n = {:<8}\tmodel {:.6f} s/s\tgen+reg {:.6f} s\tenc {:.6f} s\tupd+dec {:.6f} s\tcrs+pp {} bytes\taux {} bytes".format(
+            c["n"], c["objective"], c["latency"]["gen"]+c["latency"]["reg"], c["latency"]["enc"], c["latency"]["upd"]+c["latency"]["dec"], c["params"], c["aux"])
+        if "measured" in c:
+            line += "\tmeasured {:.6f} s/s".format(c["measured_objective"])
+        print(line)
+    if sqrt_n in evaluated:
+        print("sqrt(N) = {}:\tmodel {:.6f} s/s".format(sqrt_n, evaluated[sqrt_n]["objective"]))
+    print("recommended block size: n = {}".format(recommended["n"]))
+
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump({"N": args.N, "variant": "efficient" if args.eff else "regular", "mix": mix,
+                "recommended": recommended["n"], "candidates": candidates}, f, indent=2)
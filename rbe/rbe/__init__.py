@@ -42,5 +42,10 @@ User 42 decrypts the message (gets any updates first):
 >>> upds = upd(crs, 42, efficient=False)
 >>> m_prime = dec(crs, 42, sk, upds, c)
 
+A user with many queued ciphertexts can decrypt them together, sharing the pairings:
+
+>>> from algos import dec_many
+>>> ms = dec_many(crs, 42, sk, upds, [c, c_2, c_3])
+
 The efficient variant of our construction can be run by setting `efficient` to `True` in the above.
 """
@@ -9,10 +9,24 @@ from operator import mod
 # from more_itertools import last
 from rbe.objects import *
 from rbe import utils
+from rbe import instrument
+from rbe import notify
+from rbe import bitmap
+from rbe import cache
 import sqlite3
 from os.path import exists
 
-def setup(N, efficient=False):
+def l_rowid(crs, id, i):
+    """Rowid of the `i`-th old decommitment of `id` in table L (efficient variant).
+
+    Every merge a party takes part in doubles its chunk, so it has at most
+    `log_n` entries; the rowids do not depend on `N`, so blocks can be added
+    (see `CRS.grow`) without moving existing rows.
+    """
+    return id*(crs.log_n+1) + i
+
+@instrument.algorithm
+def setup(N, efficient=False, elastic=False, n=None):
     """Generate CRS and initialise auxiliary information and public parameters over the BLS12-381 curve.
 
     Parameters
@@ -21,6 +35,10 @@ def setup(N, efficient=False):
         maximum number of users
     efficient : bool (optional)
         use efficient update variant
+    elastic : bool (optional)
+        grow the capacity when ids beyond `N` register (new blocks are added on demand)
+    n : int (optional)
+        block size (default `ceil(sqrt(N))`, see bench/tune.py)
 
     Returns
     -------
@@ -32,17 +50,37 @@ def setup(N, efficient=False):
     The pp and aux are not returned but instead initialised as databases.
     """
 
+    crs = CRS(N, elastic=elastic, n=n)
+    init_storage(crs, efficient)
+    return crs
+
+def init_storage(crs, efficient=False):
+    """Create the (empty) pp, aux and aux_count databases and the bitmap of registered ids, where they do not exist yet.
+
+    `setup` does this for the CRS it generates; a curator given an existing CRS
+    (crs.db), e.g. a shard (see shard.py), calls it directly.
+
+    Parameters
+    ----------
+    crs : CRS
+        common reference string
+    efficient : bool (optional)
+        use efficient update variant
+    """
+
     # Note: For the efficient variant, consider the public parameter as a matrix of commitments, with log n rows and n columns. For each row, we create a (potential) seperate Aux table.
 
-    crs = CRS(N)
+    n = crs.n
+    # (a block of n parties is split into at most floor(log2(n))+1 chunks)
+    t = crs.chunks
 
-    n = ceil(sqrt(N))
-    t = ceil(log2(n))
+    # Note: pp, aux and aux_count are in WAL mode, so that `enc` and `upd` read from a snapshot (see `utils.connect_snapshot`) while `reg` writes.
 
     # stores number of parties registered in each block
     if exists("aux_count.db") == False:
         con = sqlite3.connect('aux_count.db')
         cur = con.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
         cur.execute('''CREATE TABLE auxCount (totalCount INTEGER)''')
         con.commit()
         con.close()
@@ -51,51 +89,50 @@ def setup(N, efficient=False):
     if exists("aux.db") == False:
         con = sqlite3.connect("aux.db")
         cur = con.cursor()
+        if not efficient:
+            # pages freed by compaction (see compact.py) can be returned to the file system; must precede WAL and the tables
+            cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cur.execute("PRAGMA journal_mode=WAL")
 
         if efficient:
+            # old decommitments of each id (see `l_rowid`), and how many each id has
             cur.execute('''CREATE TABLE L (upd BLOB)''')
             cur.execute('''CREATE TABLE L_upd_num (upd INTEGER)''')
-            for j in range(N):
-                 cur.execute('''INSERT INTO L_upd_num (rowid, upd) VALUES (?,?)''',(j,0))
             for i in range(t):
                 # decoms for each block, broken into tables by update "chunk" (<= logn due to merge)
                 cur.execute('''CREATE TABLE aux_{} (upd BLOB)'''.format(i))
                 cur.execute('''CREATE TABLE aux_reg_count_{} (num INTEGER)'''.format(i))
-                # NOTE the current benchmarks only register one block of parties, so we do it for n
-                # for the general case this range would be N
-                for j in range(crs.n):
-                    cur.execute('''INSERT INTO aux_reg_count_{} (rowid, num) VALUES (?,?)'''.format(i),(j,0))
+            # NOTE count rows (here and in pp) are created when first written and a missing row counts as 0,
+            # so nothing is sized by N and new blocks need no initialisation
         else:
             # the regular variant just has one aux table
             cur.execute('''CREATE TABLE aux (upd BLOB)''')
 
+        # version of each block's aux information, bumped by every registration in the block (see notify.py)
+        cur.execute('''CREATE TABLE block_version (version INTEGER)''')
+
         con.commit()
         con.close()
 
+    # registered ids (see bitmap.py)
+    if exists(bitmap.FILENAME) == False:
+        bitmap.IdBitmap(crs.n).close()
+
     # create pp database
     if exists("pp.db") == False:
         con = sqlite3.connect("pp.db")
         cur = con.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
 
         if efficient:
             for i in range(t):
                 # coms for each block, broken into tables by update "chunk" (<= logn due to merge)
                 cur.execute('''CREATE TABLE pp_{} (commitment BLOB)'''.format(i))
 
-            # n rows with each row corresponding to a block of commitments C^i_1 ... C^i_log n; row i stores the number of parties registered in block i (the sum of the parties in each commitment in that block, i.e. the sum of a block in pp_com_count)
+            # one row per block of commitments C^i_1 ... C^i_log n; row i stores the number of parties registered in block i (the sum of the parties in each commitment in that block, i.e. the sum of a block in pp_com_count)
             cur.execute(''' CREATE TABLE pp_block_count (num INTEGER)''')
-            # nlogn rows with each row corresponding to a commitment; row i stores number of parties registered under commitment i (pk's contained in that commitment)
+            # one row per non-empty commitment (rowid k*n + index); stores number of parties registered under that commitment (pk's contained in that commitment)
             cur.execute(''' CREATE TABLE pp_com_count (num INTEGER)''')
-
-            # initialise all counts to zero
-            for i in range(crs.n):
-                cur.execute("INSERT INTO pp_block_count(rowid, num) VALUES (?,?)",(i,0))
-            # TODO the current benchmark only registers n parties, so we do it for 1 commitment, for general case the range must be N
-            # for i in range((crs.n+1)*(crs.n+1)):
-            #    cur.execute("INSERT INTO pp_com_count(rowid, num) VALUES (?,?)",(i,0))
-            for i in range(crs.n):
-                for j in range(t+1):
-                    cur.execute("INSERT INTO pp_com_count(rowid, num) VALUES (?,?)",(i*crs.n+j,0))
         else:
             # the regular variant just has one pp table
             cur.execute('''CREATE TABLE pp (commitment BLOB)''')
@@ -103,8 +140,7 @@ def setup(N, efficient=False):
         con.commit()
         con.close()
 
-    return crs
-
+@instrument.algorithm
 def gen(crs, id):
     """Generate keypair and auxiliary information for user `id`
 
@@ -138,7 +174,8 @@ def gen(crs, id):
         helping_values[i] = crs.h_parameters_g1[id_index+j+1]**sk
     return pk,sk,helping_values
 
-def reg(crs, id, pk, helping_values, efficient=False):
+@instrument.algorithm
+def reg(crs, id, pk, helping_values, efficient=False, con=None):
     """Register a new user (aux and pp are read from database)
 
     Parameters
@@ -146,20 +183,33 @@ def reg(crs, id, pk, helping_values, efficient=False):
     crs : CRS
         common reference string
     id : int
-        user identifier (between 0 and `crs.N`-1, inclusive)
+        user identifier (between 0 and `crs.N`-1, inclusive, unless the CRS is elastic)
     pk : element of G1
         user's public key
     helping_values : array of elements of G1
         helping values (xi)
     efficient : bool (optional)
         use efficient update variant
+    con : sqlite3.Connection (optional)
+        connection to pp.db with aux.db, aux_count.db and keys.db attached (see
+        `writer.RegistrationWriter`); the registration is then written in the
+        caller's transaction, which the caller commits (and publishes)
+
+    Raises
+    ------
+    ValueError
+        if `id` is already registered, or the helping values are not consistent
+        with `pk`
 
     Notes
     -----
     Unlike the syntax in the paper, this returns no pp and aux. Instead, 
     we update them directly in their respective databases. 
     """
-    utils.write_pk_to_db(id,pk)
+    # a second registration of an id would corrupt its block's commitments
+    with bitmap.IdBitmap(crs.n) as registered:
+        if registered.is_registered(id):
+            raise ValueError("user {} is already registered".format(id))
 
     # block index
     k = floor(id/crs.n)
@@ -176,11 +226,17 @@ def reg(crs, id, pk, helping_values, efficient=False):
             continue
 
         if e != helping_values[iteration+1].pair(h_parameters[iteration]):
-            print("Helping values are not consistent!")
-            exit(-1)
+            raise ValueError("helping values are not consistent")
+
+    # written only once the registration is accepted, so keys.db holds exactly the registered keys (see audit.py)
+    utils.write_pk_to_db(id,pk,con)
+
+    if crs.elastic and id >= crs.N:
+        # add blocks up to (and including) id's
+        crs.grow((k+1)*crs.n)
 
     ### Update the public parameter
-    con_pp = sqlite3.connect('pp.db')
+    con_pp = con if con is not None else sqlite3.connect('pp.db')
     cur_pp = con_pp.cursor()
 
     if not efficient:
@@ -188,7 +244,7 @@ def reg(crs, id, pk, helping_values, efficient=False):
         cur_pp.execute("SELECT * FROM pp WHERE rowid=?", (k,))
         com_ser = cur_pp.fetchall()
         try:
-            com = G1Element.from_binary(com_ser[0][0])
+            com = cache.decode("pp", k, com_ser[0][0])
         except:
             com = G1.neutral_element()
         new_com = com * pk
@@ -197,13 +253,16 @@ def reg(crs, id, pk, helping_values, efficient=False):
             cur_pp.execute(" INSERT INTO pp(rowid, commitment) VALUES(?,?)",(k,new_com_ser))
         else:
             cur_pp.execute(" UPDATE pp SET commitment = ? WHERE rowid = ?",(new_com_ser,k))
+        cache.put("pp", k, new_com_ser, new_com)
     else:
         ### Find the last full commitment in C^(k)_1, C^(k)_2, ...., then write to the next index
 
         # get number of parties in block
         cur_pp.execute('''SELECT num FROM pp_block_count WHERE rowid = ?''',(k,))
         num_parties_in_block = cur_pp.fetchall()
-        num_parties_bin = bin(num_parties_in_block[0][0])[2:] # chop off '0b'
+        # count rows are created on first use (a new block has none)
+        block_count = num_parties_in_block[0][0] if len(num_parties_in_block) != 0 else 0
+        num_parties_bin = bin(block_count)[2:] # chop off '0b'
 
         # find index after the last nonempty element
         # equivalent to finding last index of 1 in binary representation of num_parties (first index of 1 in little-endian); then pick next index
@@ -223,32 +282,31 @@ def reg(crs, id, pk, helping_values, efficient=False):
         # commit to new pk
         # print("INSERT INTO pp_{} (rowid, commitment) VALUES({},{})".format(new_com_index,k,G1Element.to_binary(pk)))
         # print("registering party ----", id, " --- block is --- ", k, " new com index is ",new_com_index)
-        cur_pp.execute("INSERT INTO pp_{} (rowid, commitment) VALUES(?,?)".format(new_com_index),(k,G1Element.to_binary(pk)))
+        pk_ser = G1Element.to_binary(pk)
+        cur_pp.execute("INSERT INTO pp_{} (rowid, commitment) VALUES(?,?)".format(new_com_index),(k,pk_ser))
+        cache.put("pp_{}".format(new_com_index), k, pk_ser, pk)
 
         # Update num ids in block (pp_block_count) for block k
-        cur_pp.execute("SELECT * FROM pp_block_count WHERE rowid= ?",(k,))
-        block_count = cur_pp.fetchall()
-        cur_pp.execute("UPDATE pp_block_count SET num = ? WHERE rowid = ?",(block_count[0][0]+1,k))
+        cur_pp.execute("INSERT OR REPLACE INTO pp_block_count(rowid, num) VALUES (?,?)",(k,block_count+1))
         # Set count of ids in the new commitment (pp_com_count) to 1
-        cur_pp.execute("UPDATE pp_com_count SET num = ? WHERE rowid = ?",(1,k*crs.n+new_com_index))
+        cur_pp.execute("INSERT OR REPLACE INTO pp_com_count(rowid, num) VALUES (?,?)",(k*crs.n+new_com_index,1))
 
         num_parties_last_com = 1
         prev_com_index = max(new_com_index-1,0)
         # print("k is --- " , k, " ---- ",k*crs.n+prev_com_index)
         cur_pp.execute("SELECT * FROM pp_com_count WHERE rowid = ?",(k*(crs.n)+prev_com_index,))
         temp = cur_pp.fetchall()
-        num_parties_prev_com = temp[0][0]
+        num_parties_prev_com = temp[0][0] if len(temp) != 0 else 0
 
-    con_pp.commit()
-    con_pp.close()
+    # pp is committed last (after aux), so a commitment is never visible to encryptors before its decommitments are visible to updaters
     
     ### Update the auxiliary information
-    con_aux = sqlite3.connect("aux.db")
+    con_aux = con if con is not None else sqlite3.connect("aux.db")
     cur_aux = con_aux.cursor()
 
     if not efficient:
         # find total number of registered party in k-th portion of the aux database
-        con_aux_count = sqlite3.connect('aux_count.db')
+        con_aux_count = con if con is not None else sqlite3.connect('aux_count.db')
         cur_aux_count = con_aux_count.cursor()
         cur_aux_count.execute("SELECT * FROM auxCount WHERE rowid=?", (k,))
         total_count = cur_aux_count.fetchall()
@@ -256,8 +314,6 @@ def reg(crs, id, pk, helping_values, efficient=False):
             num_upd = total_count[0][0]
         except:
             num_upd = 0
-        con_aux_count.commit()
-        con_aux_count.close()
 
         # for each helping value
         for i in range(crs.n):
@@ -271,14 +327,14 @@ def reg(crs, id, pk, helping_values, efficient=False):
             try:
                 cur_aux.execute("SELECT * FROM aux WHERE rowid=?", (j+num_upd-1,))
                 last_upd_ser = cur_aux.fetchall()[0][0]
-                last_upd = G1Element.from_binary(last_upd_ser)
+                last_upd = cache.decode("aux", j+num_upd-1, last_upd_ser)
                 new_aux_index = j+num_upd
             except:
                 # fetch second-to-last update only if necessary (last update is empty)
                 try:
                     cur_aux.execute("SELECT * FROM aux WHERE rowid=?", (j+num_upd-2,))
                     last_upd_ser = cur_aux.fetchall()[0][0]
-                    last_upd = G1Element.from_binary(last_upd_ser)
+                    last_upd = cache.decode("aux", j+num_upd-2, last_upd_ser)
                     new_aux_index = j+num_upd-1
                 except:
                     # if it doesn't exist or is empty
@@ -286,24 +342,28 @@ def reg(crs, id, pk, helping_values, efficient=False):
                     # new_aux_index = j+num_upd
                     new_aux_index = j
 
-            new_aux_value = G1Element.to_binary(last_upd * helping_values[i])
+            new_aux = last_upd * helping_values[i]
+            new_aux_value = G1Element.to_binary(new_aux)
             cur_aux.execute(" INSERT INTO aux(rowid, upd) VALUES(?,?) ",(new_aux_index,new_aux_value))
-        
-        con_aux.commit()
-        con_aux.close()
+            # the next registration in the block builds on it
+            cache.put("aux", new_aux_index, new_aux_value, new_aux)
+
+        version = notify.bump_version(cur_aux,k)
 
         ## add the newly registered party into aux_count database
-        con_aux_count = sqlite3.connect('aux_count.db')
-        cur_aux_count = con_aux_count.cursor()
-        cur_aux_count.execute("SELECT * FROM auxCount WHERE rowid=?", (k,))
-        total_count = cur_aux_count.fetchall()
         total_count_num = (total_count[0][0] if (len(total_count) !=  0) else 0)+1
         if(utils.insert_or_update(total_count)):
             cur_aux_count.execute(" INSERT INTO auxCount(rowid, totalCount) VALUES(?,?)",(k,total_count_num))
         else:
             cur_aux_count.execute("UPDATE auxCount SET totalCount = ? WHERE rowid = ?",(total_count_num,k))
-        con_aux_count.commit()
-        con_aux_count.close()
+
+        if con is None:
+            con_aux.commit()
+            con_aux.close()
+            con_aux_count.commit()
+            con_aux_count.close()
+            con_pp.commit()
+            con_pp.close()
     
     else: # efficient variant
         for i in range(crs.n):
@@ -311,19 +371,28 @@ def reg(crs, id, pk, helping_values, efficient=False):
             new_aux_value = helping_values[i] if j != id else G1.neutral_element()
             # TODO this sometimes results in an error (sqlite3.IntegrityError: UNIQUE constraint failed: aux_{}.rowid), even though there should have been a delete done before inserting. So I added this hacky try/except.
             # print(" INSERT INTO aux_{}(rowid, upd) VALUES({},{}) ".format(new_com_index,j,new_aux_value))
+            new_aux_ser = G1Element.to_binary(new_aux_value)
             try:
-                cur_aux.execute(" INSERT INTO aux_{}(rowid, upd) VALUES(?,?) ".format(new_com_index),(j,G1Element.to_binary(new_aux_value)))
+                cur_aux.execute(" INSERT INTO aux_{}(rowid, upd) VALUES(?,?) ".format(new_com_index),(j,new_aux_ser))
             except:
-                cur_aux.execute(" UPDATE aux_{} SET upd=? WHERE rowid=?".format(new_com_index),(G1Element.to_binary(new_aux_value),j))
-            cur_aux.execute("UPDATE aux_reg_count_{} SET num = ? WHERE rowid = ?".format(new_com_index),(1,id))
+                cur_aux.execute(" UPDATE aux_{} SET upd=? WHERE rowid=?".format(new_com_index),(new_aux_ser,j))
+            cache.put("aux_{}".format(new_com_index), j, new_aux_ser, new_aux_value)
+        # id is (so far alone) in the new chunk
+        cur_aux.execute("INSERT OR REPLACE INTO aux_reg_count_{}(rowid, num) VALUES (?,?)".format(new_com_index),(id,1))
 
-        con_aux.commit()
-        con_aux.close()
+        version = notify.bump_version(cur_aux,k)
 
         ### merge
         # Check if merge is needed i.e. the last two commitments C^(k)_{last} and C^(k)_{last-1} have same number of parties registered in them (can be checked from pp_com_count)
+        # the whole cascade runs in this registration's transactions, so readers never see a half-merged block
         if new_com_index > 0 and num_parties_prev_com == num_parties_last_com:
-            merge(crs,k,new_com_index)
+            merge(crs,k,new_com_index,con_pp,con_aux)
+
+        if con is None:
+            con_aux.commit()
+            con_aux.close()
+            con_pp.commit()
+            con_pp.close()
 
         # # for debugging
         # con_pp = sqlite3.connect('pp.db')
@@ -366,7 +435,16 @@ def reg(crs, id, pk, helping_values, efficient=False):
         # con_aux.commit()
         # con_aux.close()
 
-def enc(crs, id, m, efficient=False):
+    # the id counts as registered once its registration is written (for a caller passing `con`: before it commits)
+    with bitmap.IdBitmap(crs.n) as registered:
+        registered.mark(id)
+
+    # the block's aux (including any merges) is final, tell its subscribers (a caller passing `con` does this after its commit)
+    if con is None:
+        notify.publish(k,version)
+
+@instrument.algorithm
+def enc(crs, id, m, efficient=False, executor=None):
     """Encrypt a message to a user (an identity).
 
     Parameters
@@ -379,6 +457,8 @@ def enc(crs, id, m, efficient=False):
         message to encrypt
     efficient : bool (optional)
         use efficient update variant
+    executor : parallel.Executor (optional)
+        encrypt to the commitments in worker processes (efficient variant)
 
     Returns
     -------
@@ -390,7 +470,8 @@ def enc(crs, id, m, efficient=False):
     h_parameters_g2 = crs.h_parameters_g2 
     g2 = crs.g2 
 
-    con = sqlite3.connect("pp.db")
+    # all commitments of the block are read from one snapshot (never from the middle of a merge)
+    con = utils.connect_snapshot("pp.db")
     cur = con.cursor()
 
     # array with all the commitments to encrypt to
@@ -402,11 +483,16 @@ def enc(crs, id, m, efficient=False):
     # decoms = []
     if efficient:
         # for each commitment in block k (this is the dimension coms are merged in)
-        for i in range(ceil(log2(crs.n))):
+        for i in range(crs.chunks):
             # fetch the ith commitment in id's block (block k)
             cur.execute('''SELECT commitment FROM pp_{} WHERE rowid = ?'''.format(i),(k,))
+            fetched = cur.fetchall()
+            if executor is not None:
+                # workers deserialize them
+                coms += [fetched[0][0] if len(fetched) != 0 else None]
+                continue
             try:
-                com = G1Element.from_binary(cur.fetchall()[0][0])
+                com = cache.decode("pp_{}".format(i), k, fetched[0][0])
             except:
                 com = G1.neutral_element()
             coms += [com]
@@ -421,7 +507,11 @@ def enc(crs, id, m, efficient=False):
     else:
         # make a single-element array with the commitment
         cur.execute('''SELECT commitment FROM pp WHERE rowid = ?''', (k,))
-        coms = [G1Element.from_binary(cur.fetchall()[0][0])]
+        coms = [cache.decode("pp", k, cur.fetchall()[0][0])]
+    con.close()
+
+    if executor is not None and efficient:
+        return executor.encrypt(crs, id, coms, m)
 
     # encrypt wrt each commitment
     # for com in coms:
@@ -469,6 +559,7 @@ def enc(crs, id, m, efficient=False):
 #     con.close()
 #     return max(upd_num-2,0)
 
+@instrument.algorithm
 def upd(crs, id, efficient=False):
     """Get updating information for a user.
 
@@ -483,66 +574,54 @@ def upd(crs, id, efficient=False):
     
     Returns
     -------
-    array of G1 elements
-        updating information (list of decommitments)
+    LazyUpdates
+        updating information (list of decommitments); each G1 element is 
+        deserialized on first access
     """
 
     k = floor(id/crs.n) # block index
     id_index = mod(id,crs.n)
 
     if efficient:
-        t = ceil(log2(crs.n))
-        upds = [G1.neutral_element()]*(2*t)
+        t = crs.chunks
+        upds_ser = [None]*(2*t)
 
-        con = sqlite3.connect("aux.db")
+        con = utils.connect_snapshot("aux.db")
         cur = con.cursor()
 
-        for i in range(t):
-            cur.execute("SELECT * FROM L WHERE rowid=?",(i*crs.N + k*crs.n + id_index,))
-            upd_fetched = cur.fetchall()
-            upds[i] = G1Element.from_binary(upd_fetched[0][0]) if len(upd_fetched) != 0 else G1.neutral_element()
+        # id's old decommitments are stored contiguously in L, from index 0 on
+        cur.execute("SELECT upd FROM L WHERE rowid BETWEEN ? AND ?",(l_rowid(crs,id,0),l_rowid(crs,id,t-1)))
+        for i, row in enumerate(cur.fetchall()):
+            upds_ser[i] = row[0]
         for i in range(t):
             cur.execute("SELECT * FROM aux_{} WHERE rowid = ?".format(i),(id,))
             upd_fetched = cur.fetchall()
-            upds[t+i] = G1Element.from_binary(upd_fetched[0][0]) if len(upd_fetched) != 0 else G1.neutral_element()
-        con.commit()
+            upds_ser[t+i] = upd_fetched[0][0] if len(upd_fetched) != 0 else None
         con.close()
     else:
-        upds = [G1.neutral_element()]
-
-        # fetch number of updates in block
-        con_aux_count = sqlite3.connect('aux_count.db')
-        cur_aux_count = con_aux_count.cursor()
-        cur_aux_count.execute("SELECT * FROM auxCount WHERE rowid=?", (k,))
-        try:
-            count = cur_aux_count.fetchall()[0][0]
-        except:
-            count = 0
-        con_aux_count.commit()
-        con_aux_count.close()
-
-        con = sqlite3.connect("aux.db")
+        con = utils.connect_snapshot("aux.db")
         cur = con.cursor()
         # index of first update for id in the block (k)
         id_updates_index = int(k * (crs.n**2) + crs.n*id_index)
 
-        # fetch all the updates for id (there are at most `count` of them)
-        cur.execute("SELECT * FROM aux WHERE rowid BETWEEN ? and ?", (id_updates_index, id_updates_index+(count-1))) # both ends are inclusive
+        # fetch all the updates for id: there are fewer than n of them, and id's range holds nothing else,
+        # so the block's count in aux_count.db (a separate snapshot) is not needed
+        cur.execute("SELECT rowid, upd FROM aux WHERE rowid BETWEEN ? and ?", (id_updates_index, id_updates_index+(crs.n-1))) # both ends are inclusive
         resp = cur.fetchall()
-        upds = [G1.neutral_element()] * len(resp)
-        for i in range(len(resp)):
-            try:
-                upds[i] = G1Element.from_binary(resp[i][0])
-            except:
-                pass
-        upds = [G1.neutral_element()] + upds
-
-        con.commit()
         con.close()
 
-    return upds
+        # the first update is always the neutral element; update p is at position p+1
+        # (the oldest updates may have been compacted away, see compact.py: they are skipped, and later ones keep their positions)
+        first = resp[0][0]-id_updates_index if len(resp) != 0 else 0
+        upds_ser = [None]*(1+first) + [row[1] for row in resp]
+        return cache.fill(LazyUpdates(upds_ser, skip=range(1, 1+first)), [None]*(1+first) + [("aux", row[0]) for row in resp])
 
-def dec(crs, id, sk, upds, cts, upd_idx=-1):
+    # elements are only deserialized when `dec` actually touches them
+    locations = [("L", l_rowid(crs,id,i)) for i in range(t)] + [("aux_{}".format(i), id) for i in range(t)]
+    return cache.fill(LazyUpdates(upds_ser), locations)
+
+@instrument.algorithm
+def dec(crs, id, sk, upds, cts, upd_idx=-1, executor=None):
     """Decrypt a ciphertext encrypted to a particular user.
 
     Parameters
@@ -553,19 +632,23 @@ def dec(crs, id, sk, upds, cts, upd_idx=-1):
         user identifier
     sk : element of ZR
         secret key
-    upds : array of G1 elements
+    upds : array of G1 elements or LazyUpdates
         updating information (decommitments)
     cts : array of Ciphertexts
         ciphertext to decrypt
     upd_idx : int (optional)
         exact update index, if known, to use for decryption
+    executor : parallel.Executor (optional)
+        check the (ciphertext, update) combinations in worker processes
 
     Returns
     -------
     element of GT
         a message or a special symbol GetUpd (`0`) indicating updating information is required
     """
-    m = None
+    if executor is not None:
+        return executor.decrypt(crs, id, sk, upds, cts, upd_idx)
+
     if upd_idx >= 0:
         upds = [upds[upd_idx]]
 
@@ -578,17 +661,84 @@ def dec(crs, id, sk, upds, cts, upd_idx=-1):
 
                 # print("found successful update at index {}".format(i))
                 m = ct.ct3/((u.pair(ct.ct2)**(-1)*(ct.ct1))**(sk.mod_pow(-1,GT.order())))
-        
-    if m!= None:
-        return m
+                # stop at the first match so the remaining updates are never deserialized
+                return m
 
     # if none of them work, ciphertext is not well-formed or update is necessary
     print("Decryption cannot be done, you need to get update first.")
     return 0
 
+@instrument.algorithm
+def dec_many(crs, id, sk, upds, mailbox):
+    """Decrypt a mailbox of ciphertexts encrypted to the same user.
+
+    Equivalent to calling `dec` on every ciphertext (list) in `mailbox`, but the
+    pairing work is shared: `e(h_id^sk, h_{n-1-id})` is computed once, each update
+    `u` is paired with `g2` at most once, and each distinct `ct0` (commitment)
+    is paired and matched to an update only once.
+
+    Parameters
+    ----------
+    crs : CRS
+        common reference string
+    id : int
+        user identifier
+    sk : element of ZR
+        secret key
+    upds : array of G1 elements or LazyUpdates
+        updating information (decommitments)
+    mailbox : array of arrays of Ciphertexts
+        ciphertexts to decrypt (each as returned by `enc`)
+
+    Returns
+    -------
+    array of elements of GT
+        for each entry of `mailbox`, the message or GetUpd (`0`) if no update matches
+    """
+    id_index = mod(id,crs.n)
+    h = crs.h_parameters_g2[crs.n-1-id_index]
+    pk_pair = (crs.h_parameters_g1[id_index]**sk).pair(h)
+    sk_inv = sk.mod_pow(-1,GT.order())
+
+    # e(u, g2) * e(pk, h) for each update, computed on first use
+    upd_pairs = [None]*len(upds)
+    positions = upds.positions() if isinstance(upds, LazyUpdates) else range(len(upds))
+    # serialized ct0 -> index of the update that opens it (None if there is none)
+    matches = {}
+
+    ms = []
+    # entries of `mailbox` without a matching update
+    failed = []
+    for cts in mailbox:
+        m = None
+        for ct in cts:
+            ct0_ser = G1Element.to_binary(ct.ct0)
+            if ct0_ser not in matches:
+                matches[ct0_ser] = None
+                ct0_pair = ct.ct0.pair(h)
+                for i in positions:
+                    if upd_pairs[i] is None:
+                        upd_pairs[i] = upds[i].pair(crs.g2) * pk_pair
+                    if ct0_pair == upd_pairs[i]:
+                        matches[ct0_ser] = i
+                        break
+            i = matches[ct0_ser]
+            if i is not None:
+                m = ct.ct3/((upds[i].pair(ct.ct2)**(-1)*(ct.ct1))**sk_inv)
+                break
+        if m is None:
+            failed += [len(ms)]
+            m = 0
+        ms += [m]
+
+    if len(failed) != 0:
+        print("Decryption cannot be done for {} of {} ciphertexts, you need to get update first.".format(len(failed), len(ms)))
+    return ms
+
 # row refers to the row of pp and column refers to the column of pp
 # TODO save space by not saving single-element decommitments
-def merge(crs,k,last_index):
+@instrument.algorithm
+def merge(crs,k,last_index,con_pp=None,con_aux=None):
     """
     Parameters
     ----------
@@ -598,27 +748,39 @@ def merge(crs,k,last_index):
         pp/aux block of id, ranges from 0 to `crs.n`-1
     last_index : int
         last non-empty index of the `k`th block of pp (index after newest commitment)
+    con_pp, con_aux : sqlite3.Connection (optional)
+        open connections to pp.db and aux.db; if given, the merge is part of the
+        caller's transactions and is not committed here (as in `reg`)
     """
     # base case for the recursive merge
     if last_index == 0:
         return 0
+
+    # standalone merge: commit the whole cascade at once
+    if con_pp is None:
+        con_pp = sqlite3.connect("pp.db")
+        con_aux = sqlite3.connect("aux.db")
+        merge(crs,k,last_index,con_pp,con_aux)
+        con_aux.commit()
+        con_aux.close()
+        con_pp.commit()
+        con_pp.close()
+        return 0
     
     ### First, check if a merge is needed -- i.e. if the last two commitments C^(k)_{last} and C^(k)_{last-1} have same number of parties registered in them
     
-    # connect to pp database
-    con_pp = sqlite3.connect("pp.db")
     cur_pp = con_pp.cursor()
 
     # indices of the last two non-empty elements of C^(k)
     cur_pp.execute("SELECT * FROM pp_com_count WHERE rowid = ?", (k*crs.n+last_index,))
-    num_parties_last_com = cur_pp.fetchall()[0][0]
+    fetched = cur_pp.fetchall()
+    num_parties_last_com = fetched[0][0] if len(fetched) != 0 else 0
     cur_pp.execute("SELECT * FROM pp_com_count WHERE rowid = ?", (k*crs.n+last_index-1,))
-    num_parties_prev_com = cur_pp.fetchall()[0][0]
+    fetched = cur_pp.fetchall()
+    num_parties_prev_com = fetched[0][0] if len(fetched) != 0 else 0
 
     if num_parties_last_com != num_parties_prev_com:
         # print("merge ended!")
-        con_pp.commit()
-        con_pp.close()
         return 0
 
     ### A merge is needed, so fetch from pp the commitments to merge...
@@ -628,19 +790,20 @@ def merge(crs,k,last_index):
     prev_com_ser = cur_pp.fetchall()[0][0]
 
     # ...and merge them
-    merged_com = G1Element.to_binary(G1Element.from_binary(last_com_ser)*G1Element.from_binary(prev_com_ser))
+    merged = cache.decode("pp_{}".format(last_index), k, last_com_ser)*cache.decode("pp_{}".format(last_index-1), k, prev_com_ser)
+    merged_com = G1Element.to_binary(merged)
     cur_pp.execute("UPDATE pp_{} SET commitment = ? WHERE rowid = ?".format(last_index-1),(merged_com,k))
     # print("DELETE FROM pp_{} WHERE rowid = {}".format(last_index,k))
     cur_pp.execute("DELETE FROM pp_{} WHERE rowid = ?".format(last_index),(k,))
+    cache.put("pp_{}".format(last_index-1), k, merged_com, merged)
+    cache.invalidate("pp_{}".format(last_index), k)
 
     # update pp_com_count after merge; notice that pp_block_count will remain unchanged (was updated in reg)
-    cur_pp.execute("UPDATE pp_com_count SET num = ? WHERE rowid = ?",(num_parties_last_com+num_parties_prev_com, (k*crs.n+last_index-1)))
-    cur_pp.execute("UPDATE pp_com_count SET num = ? WHERE rowid = ?",(0, (k*crs.n+last_index)))
-    con_pp.commit()
-    con_pp.close()
+    # (an empty commitment has no count row)
+    cur_pp.execute("INSERT OR REPLACE INTO pp_com_count(rowid, num) VALUES (?,?)",((k*crs.n+last_index-1), num_parties_last_com+num_parties_prev_com))
+    cur_pp.execute("DELETE FROM pp_com_count WHERE rowid = ?",((k*crs.n+last_index),))
 
     ### merge aux info
-    con_aux = sqlite3.connect("aux.db")
     cur_aux = con_aux.cursor()
     # fetch elements of last aux at block k
     block_k_idxs = [k*crs.n, k*crs.n + (crs.n-1)]
@@ -652,7 +815,7 @@ def merge(crs,k,last_index):
         if len(val) == 0:
             last_aux[i] = G1.neutral_element()
         else:
-            last_aux[i] = G1Element.from_binary(val)
+            last_aux[i] = cache.decode("aux_{}".format(last_index), k*crs.n+i, val)
 
     # fetch elements of previous aux at block k
     cur_aux.execute("SELECT * FROM aux_{} WHERE rowid BETWEEN ? AND ?".format(last_index-1),(block_k_idxs[0], block_k_idxs[1]))
@@ -663,7 +826,7 @@ def merge(crs,k,last_index):
         if len(val) == 0:
             prev_aux[i] = G1.neutral_element()
         else:
-            prev_aux[i] = G1Element.from_binary(val)
+            prev_aux[i] = cache.decode("aux_{}".format(last_index-1), k*crs.n+i, val)
 
         # print("DELETE FROM aux_{} WHERE rowid = {}".format(last_index, k*crs.n+i))
 
@@ -678,8 +841,10 @@ def merge(crs,k,last_index):
         p = p_fetched[0][0] if len(p_fetched) != 0 else 0
         # if so, append its upd to L_i
         if(p==1):
-            cur_aux.execute("INSERT INTO L(rowid,upd) VALUES(?,?)",(L_upd_num*crs.N + crs.n*k+i ,G1Element.to_binary(prev_aux[i])))
-            cur_aux.execute("UPDATE L_upd_num SET upd = ? WHERE rowid = ?",(L_upd_num+1,crs.n*k+i))
+            prev_ser = G1Element.to_binary(prev_aux[i])
+            cur_aux.execute("INSERT INTO L(rowid,upd) VALUES(?,?)",(l_rowid(crs,k*crs.n+i,L_upd_num) ,prev_ser))
+            cache.put("L", l_rowid(crs,k*crs.n+i,L_upd_num), prev_ser, prev_aux[i])
+            cur_aux.execute("INSERT OR REPLACE INTO L_upd_num(rowid, upd) VALUES (?,?)",(crs.n*k+i,L_upd_num+1))
 
         cur_aux.execute("SELECT * FROM aux_reg_count_{} WHERE rowid = ? ".format(last_index),(k*crs.n+i,))
         q_fetched = cur_aux.fetchall()
@@ -688,13 +853,18 @@ def merge(crs,k,last_index):
 
         # merge the prev and last aux info at this index
         # (append elements of last into prev; only for the final element, we multiply: last[2*final] := last[final]*prev[final])
-        cur_aux.execute("UPDATE aux_{} SET upd = ? WHERE rowid = ?".format(last_index-1),(G1Element.to_binary(prev_aux[i]*last_aux[i]),k*crs.n+i))
-
-        cur_aux.execute("UPDATE aux_reg_count_{} SET num=? WHERE rowid = ?".format(last_index-1),(porq,k*crs.n+i))
-        cur_aux.execute("UPDATE aux_reg_count_{} SET num=? WHERE rowid = ?".format(last_index),(0,k*crs.n+i))
+        merged_aux = prev_aux[i]*last_aux[i]
+        merged_aux_ser = G1Element.to_binary(merged_aux)
+        cur_aux.execute("UPDATE aux_{} SET upd = ? WHERE rowid = ?".format(last_index-1),(merged_aux_ser,k*crs.n+i))
+        cache.put("aux_{}".format(last_index-1), k*crs.n+i, merged_aux_ser, merged_aux)
+
+        # (count rows only exist for ids in the chunk)
+        if porq:
+            cur_aux.execute("INSERT OR REPLACE INTO aux_reg_count_{}(rowid, num) VALUES (?,?)".format(last_index-1),(k*crs.n+i,porq))
+        else:
+            cur_aux.execute("DELETE FROM aux_reg_count_{} WHERE rowid = ?".format(last_index-1),(k*crs.n+i,))
+        cur_aux.execute("DELETE FROM aux_reg_count_{} WHERE rowid = ?".format(last_index),(k*crs.n+i,))
         cur_aux.execute("DELETE FROM aux_{} WHERE rowid = ?".format(last_index), (k*crs.n+i,))
+        cache.invalidate("aux_{}".format(last_index), k*crs.n+i)
 
-    con_aux.commit()
-    con_aux.close()
-
-    return merge(crs,k,last_index-1)
+    return merge(crs,k,last_index-1,con_pp,con_aux)
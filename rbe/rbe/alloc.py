@@ -0,0 +1,141 @@
+"""Block-aware allocation of ids to new parties.
+
+`reg` registers whatever id it is given, so callers that pick ids arbitrarily
+(e.g. a random permutation, as bench.py does) pile registrations onto arbitrary
+blocks, and in the efficient variant registrations into a block holding
+`c = ...0111` (binary) parties trigger a cascade of merges, one per trailing 1,
+each rewriting the decommitments of twice as many parties as the one before.
+An `Allocator` hands out unregistered ids by a policy:
+
+* "round_robin": the next block (in order) with a free id;
+* "least_loaded": the block with the fewest registered parties;
+* "merge_cost": the block where the next registration merges least (fewest
+  trailing 1s in its count; ties go to the least loaded). In the regular variant
+  there are no merges and this is "least_loaded";
+* "random": a random free id (the baseline).
+
+Block loads are read from pp_block_count (auxCount in the regular variant) and
+free ids from the bitmap of registered ids (see bitmap.py). Ids handed out count
+as taken until they are registered or `release`d, so concurrent callers of one
+allocator never get the same id; `refresh` reloads the loads after other
+registrars wrote.
+
+Examples
+--------
+>>> from rbe import alloc
+>>> ids = alloc.Allocator(crs, "merge_cost", efficient=True)
+>>> id = ids.next()
+>>> pk,sk,xi = algos.gen(crs, id)
+>>> algos.reg(crs, id, pk, xi, efficient=True)
+"""
+
+import random
+import sqlite3
+import threading
+from rbe import bitmap
+
+POLICIES = ["round_robin", "least_loaded", "merge_cost", "random"]
+
+def merges(count):
+    """Merges triggered by a registration into a block of `count` parties (efficient variant)."""
+    trailing = 0
+    while count & 1:
+        trailing = trailing + 1
+        count = count >> 1
+    return trailing
+
+class Allocator:
+    """Hands out unregistered ids of `crs` (ids 0 to `crs.N`-1) by a policy.
+
+    Parameters
+    ----------
+    crs : CRS
+        common reference string
+    policy : str (optional)
+        one of `POLICIES`
+    efficient : bool (optional)
+        efficient update variant
+    """
+
+    def __init__(self, crs, policy="least_loaded", efficient=False):
+        if policy not in POLICIES:
+            raise ValueError("unknown policy {} (expected one of {})".format(policy, ", ".join(POLICIES)))
+        self.crs = crs
+        self.policy = policy
+        self.efficient = efficient
+        self.blocks = (crs.N + crs.n-1)//crs.n
+        # ids handed out but not registered yet
+        self.reserved = set()
+        self._next = 0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def capacity(self, k):
+        """Number of ids in block `k` (the last block may be partial)."""
+        return min(self.crs.n, self.crs.N - k*self.crs.n)
+
+    def refresh(self):
+        """Reload the number of registered parties per block."""
+        table = "pp_block_count" if self.efficient else "auxCount"
+        db = "pp.db" if self.efficient else "aux_count.db"
+        con = sqlite3.connect(db)
+        rows = con.execute("SELECT rowid, * FROM {}".format(table)).fetchall()
+        con.close()
+        with self._lock:
+            self.load = [0]*self.blocks
+            for k, count in rows:
+                if k < self.blocks:
+                    self.load[k] = count
+            with bitmap.IdBitmap(self.crs.n) as registered:
+                self.reserved = set(id for id in self.reserved if not registered.is_registered(id))
+            for id in self.reserved:
+                self.load[id // self.crs.n] += 1
+
+    def _open(self, k):
+        return self.load[k] < self.capacity(k)
+
+    def _block(self):
+        """Block of the next id, by policy (`None` if all are full)."""
+        open_blocks = [k for k in range(self.blocks) if self._open(k)]
+        if len(open_blocks) == 0:
+            return None
+        if self.policy == "round_robin":
+            k = next((k for k in open_blocks if k >= self._next), open_blocks[0])
+            self._next = (k+1) % self.blocks
+            return k
+        if self.policy == "merge_cost" and self.efficient:
+            return min(open_blocks, key=lambda k: (merges(self.load[k]), self.load[k]))
+        if self.policy == "random":
+            # weighted by free ids, i.e. a uniformly random free id
+            return random.choices(open_blocks, weights=[self.capacity(k)-self.load[k] for k in open_blocks])[0]
+        return min(open_blocks, key=lambda k: self.load[k])
+
+    def next(self):
+        """An unregistered id (reserved until it is registered or released); raises `ValueError` if there is none."""
+        with self._lock:
+            while True:
+                k = self._block()
+                if k is None:
+                    raise ValueError("all {} ids are registered".format(self.crs.N))
+                with bitmap.IdBitmap(self.crs.n) as registered:
+                    free = [id for id in registered.free_ids(k) if id < self.crs.N and id not in self.reserved]
+                if len(free) != 0:
+                    break
+                # filled by other registrars since the last refresh
+                self.load[k] = self.capacity(k)
+            id = random.choice(free) if self.policy == "random" else free[0]
+            self.reserved.add(id)
+            self.load[k] += 1
+            return id
+
+    def registered(self, id):
+        """`id` (handed out by `next`) is registered."""
+        with self._lock:
+            self.reserved.discard(id)
+
+    def release(self, id):
+        """`id` (handed out by `next`) will not be registered."""
+        with self._lock:
+            if id in self.reserved:
+                self.reserved.remove(id)
+                self.load[id // self.crs.n] -= 1
@@ -0,0 +1,326 @@
+"""Integrity audit of pp and aux against the registered public keys.
+
+The registered keys (keys.db, in registration order) are first copied into a
+temporary database indexed by id. Blocks are then audited in parallel worker
+processes:
+
+- commitments: each block's commitment(s) are recomputed from its public keys
+  (in the efficient variant, chunk `i` holds the next `2^b` registrants of the
+  block, for the `i`-th highest bit `b` of its registration count) and compared
+  with pp (and pp_block_count);
+- decommitments: for a registered or unregistered slot `idx` of a block and a
+  commitment `C` of that block, the decommitment `u` in aux must satisfy
+  `e(C / pk_idx, h_{n-1-idx}) = e(u, g2)` (`pk_idx` only if `idx` is in `C`).
+  In the regular variant, every stored update of the slot is checked, each
+  against the commitment after the registration that wrote it (a prefix
+  product of the block's keys in registration order); in the efficient
+  variant, the current decommitments in aux_i (the old ones in L are not
+  checked).
+  All checks of a batch of blocks are combined with random 64-bit exponents
+  `r` into a single equation
+  `prod_idx e(prod (C / pk_idx)^r, h_{n-1-idx}) = e(prod u^r, g2)`, which costs
+  `n+1` pairings however many blocks are in the batch; a failing batch is
+  bisected down to the blocks at fault.
+
+With `sample`, only that fraction of the slots of each block is checked against
+aux (commitments are always recomputed in full).
+
+Examples
+--------
+>>> from rbe import audit
+>>> report = audit.audit(efficient=True, processes=8, sample=0.01)
+>>> report["commitment_mismatches"], report["decommitment_mismatches"]
+
+From the command line, in the directory holding the databases:
+
+    python3 -m rbe.audit [-e] [-p processes] [-s sample] [-o report.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+from time import perf_counter
+from petrelic.multiplicative.pairing import G1,G1Element
+from petrelic.bn import Bn
+from rbe import utils
+from rbe.objects import CRS, LazyUpdates
+
+# per-worker state (see `_init`)
+_worker = {}
+
+def index_keys(path, keys="keys.db"):
+    """Copy the registered keys into `path`, indexed by id, keeping the registration order.
+
+    Returns
+    -------
+    (int, int)
+        number of keys, and number of ids registered more than once (only the first is kept)
+    """
+    # a URI connection, so that keys.db can be attached read-only
+    con = sqlite3.connect("file:{}".format(path), uri=True)
+    cur = con.cursor()
+    cur.execute("CREATE TABLE keys_by_id (id INTEGER PRIMARY KEY, pk BLOB, ord INTEGER)")
+    cur.execute("ATTACH DATABASE ? AS src", ("file:{}?mode=ro".format(keys),))
+    cur.execute("INSERT OR IGNORE INTO keys_by_id (id, pk, ord) SELECT id, pk, rowid FROM src.key_pairs ORDER BY rowid")
+    con.commit()
+    cur.execute("SELECT count(*) FROM src.key_pairs")
+    total = cur.fetchall()[0][0]
+    cur.execute("SELECT count(*) FROM keys_by_id")
+    unique = cur.fetchall()[0][0]
+    con.close()
+    return total, total-unique
+
+def chunks(ids):
+    """Split a block's ids (in registration order) into its commitments' chunks (efficient variant)."""
+    c = len(ids)
+    out = []
+    start = 0
+    for b in range(c.bit_length()-1, -1, -1):
+        if c >> b & 1:
+            out += [ids[start:start+2**b]]
+            start += 2**b
+    return out
+
+def _init(keys_index, efficient, sample, seed):
+    _worker["crs"] = CRS()
+    _worker["efficient"] = efficient
+    _worker["sample"] = sample
+    _worker["rng"] = random.Random(seed ^ os.getpid())
+    _worker["keys"] = sqlite3.connect("file:{}?mode=ro".format(keys_index), uri=True)
+    _worker["pp"] = utils.connect_snapshot("pp.db")
+    _worker["aux"] = utils.connect_snapshot("aux.db")
+
+def _fetch_one(cur, query, args):
+    cur.execute(query, args)
+    fetched = cur.fetchall()
+    return fetched[0][0] if len(fetched) != 0 else None
+
+def _audit_block(k):
+    """Recompute block `k`'s commitments and accumulate its decommitment checks.
+
+    Returns
+    -------
+    (bool, dict, element of G1)
+        whether the commitments match, and the block's combined decommitment
+        check: slot -> prod (C / pk)^r, and prod u^r
+    """
+    crs = _worker["crs"]
+    n = crs.n
+    efficient = _worker["efficient"]
+    rng = _worker["rng"]
+    cur_pp = _worker["pp"].cursor()
+    cur_aux = _worker["aux"].cursor()
+
+    cur = _worker["keys"].cursor()
+    cur.execute("SELECT id, pk FROM keys_by_id WHERE id BETWEEN ? AND ? ORDER BY ord", (k*n, k*n+n-1))
+    rows = cur.fetchall()
+    pks = {id: G1Element.from_binary(pk) for id, pk in rows}
+    ids = [id for id, pk in rows]
+
+    ### commitments
+    members = chunks(ids) if efficient else [ids]
+    computed = []
+    for chunk in members:
+        com = G1.neutral_element()
+        for id in chunk:
+            com = com * pks[id]
+        computed += [com]
+
+    if efficient:
+        ok = _fetch_one(cur_pp, "SELECT num FROM pp_block_count WHERE rowid = ?", (k,)) == len(ids)
+        stored = [_fetch_one(cur_pp, "SELECT commitment FROM pp_{} WHERE rowid = ?".format(i), (k,)) for i in range(crs.chunks)]
+        ok = ok and all(s is None for s in stored[len(computed):])
+        stored = stored[:len(computed)]
+    else:
+        stored = [_fetch_one(cur_pp, "SELECT commitment FROM pp WHERE rowid = ?", (k,))]
+        ok = True
+    stored = [LazyUpdates._decode(s) for s in stored]
+    ok = ok and stored == computed
+
+    ### decommitments (against the published commitments; regular variant: against those after each registration)
+    slots = range(n)
+    if _worker["sample"] is not None:
+        slots = sorted(rng.sample(range(n), max(1, round(_worker["sample"]*n))))
+    lhs = {}
+    rhs = G1.neutral_element()
+
+    def check(idx, a, u):
+        nonlocal rhs
+        r = Bn.from_num(rng.getrandbits(64) | 1)
+        lhs[idx] = lhs[idx] * a**r if idx in lhs else a**r
+        rhs = rhs * LazyUpdates._decode(u)**r
+
+    if not efficient:
+        _audit_history(k, ids, pks, slots, check)
+        return ok, lhs, rhs
+    for i, (com, chunk) in enumerate(zip(stored, members)):
+        chunk = set(chunk)
+        for idx in slots:
+            id = k*n + idx
+            u = _fetch_one(cur_aux, "SELECT upd FROM aux_{} WHERE rowid = ?".format(i), (id,))
+            check(idx, com / pks[id] if id in chunk else com, u)
+    return ok, lhs, rhs
+
+def _audit_history(k, ids, pks, slots, check):
+    """Pass every stored update of `slots` of block `k` (regular variant) to `check(idx, C / pk_idx, u)`.
+
+    Update `p` of a slot (row `k*n*n + idx*n + p`) opens the commitment to the
+    first `p+1` registrants of the block (`ids`, in registration order) other
+    than the slot's own id, i.e. the commitment after the registration that
+    wrote it, without `pk_idx`.
+    """
+    n = _worker["crs"].n
+    cur_aux = _worker["aux"].cursor()
+    # prefix[t]: commitment after the first t+1 registrations
+    prefix = []
+    com = G1.neutral_element()
+    for id in ids:
+        com = com * pks[id]
+        prefix += [com]
+    position = {id: t for t, id in enumerate(ids)}
+    for idx in slots:
+        id = k*n + idx
+        base = k*n*n + idx*n
+        others = len(ids) - (1 if id in position else 0)
+        cur_aux.execute("SELECT rowid, upd FROM aux WHERE rowid BETWEEN ? AND ?", (base, base+n-1))
+        upds = {rowid-base: u for rowid, u in cur_aux.fetchall()}
+        # older updates may have been compacted away (see compact.py), never the latest
+        if others != 0:
+            upds.setdefault(others-1, None)
+        for p, u in sorted(upds.items()):
+            if p >= others:
+                # no registration wrote this row
+                a = G1.neutral_element()
+            elif id in position and p >= position[id]:
+                a = prefix[p+1] / pks[id]
+            else:
+                a = prefix[p]
+            check(idx, a, u)
+
+def _pairing_check(parts):
+    """Check the combined decommitment equation of several blocks' `(lhs, rhs)`."""
+    crs = _worker["crs"]
+    lhs = {}
+    rhs = G1.neutral_element()
+    for block_lhs, block_rhs in parts:
+        for idx, a in block_lhs.items():
+            lhs[idx] = lhs[idx] * a if idx in lhs else a
+        rhs = rhs * block_rhs
+    if len(lhs) == 0:
+        return True
+    e = None
+    for idx, a in lhs.items():
+        p = a.pair(crs.h_parameters_g2[crs.n-1-idx])
+        e = p if e is None else e * p
+    return e == rhs.pair(crs.g2)
+
+def _bisect(blocks, parts):
+    """Blocks whose decommitments fail (`parts` is known to fail as a whole)."""
+    if len(blocks) == 1:
+        return blocks
+    half = len(blocks)//2
+    bad = []
+    for bs, ps in [(blocks[:half], parts[:half]), (blocks[half:], parts[half:])]:
+        if not _pairing_check(ps):
+            bad += _bisect(bs, ps)
+    return bad
+
+def _audit_blocks(blocks):
+    """Audit a batch of blocks (run in a worker process)."""
+    commitment_bad = []
+    parts = []
+    for k in blocks:
+        ok, lhs, rhs = _audit_block(k)
+        if not ok:
+            commitment_bad += [k]
+        parts += [(lhs, rhs)]
+    decommitment_bad = [] if _pairing_check(parts) else _bisect(blocks, parts)
+    return commitment_bad, decommitment_bad
+
+def audit(efficient=False, processes=None, sample=None, batch=16, seed=None):
+    """Audit pp and aux in the current directory against keys.db.
+
+    Parameters
+    ----------
+    efficient : bool (optional)
+        efficient update variant
+    processes : int (optional)
+        worker processes (default: one per core)
+    sample : float (optional)
+        fraction of the slots of each block whose decommitments are checked
+        (default: all)
+    batch : int (optional)
+        blocks per worker task (and per combined pairing check)
+    seed : int (optional)
+        seed of the random exponents and of the sampling
+
+    Returns
+    -------
+    dict
+        `keys`, `duplicate_keys`, `blocks` (number audited), sorted lists of
+        `commitment_mismatches` and `decommitment_mismatches` (block indices),
+        and `time` (s)
+    """
+    start = perf_counter()
+    seed = random.getrandbits(32) if seed is None else seed
+    crs = CRS()
+    with tempfile.TemporaryDirectory() as workdir:
+        keys_index = os.path.join(workdir, "keys_by_id.db")
+        total, duplicates = index_keys(keys_index)
+        con = sqlite3.connect(keys_index)
+        blocks = [k for (k,) in con.execute("SELECT DISTINCT id / ? FROM keys_by_id ORDER BY 1", (crs.n,))]
+        con.close()
+
+        tasks = [blocks[i:i+batch] for i in range(0, len(blocks), batch)]
+        commitment_bad = []
+        decommitment_bad = []
+        with multiprocessing.Pool(processes, initializer=_init, initargs=(keys_index, efficient, sample, seed)) as pool:
+            for c_bad, d_bad in pool.imap_unordered(_audit_blocks, tasks):
+                commitment_bad += c_bad
+                decommitment_bad += d_bad
+
+    return {
+        "keys": total,
+        "duplicate_keys": duplicates,
+        "blocks": len(blocks),
+        "commitment_mismatches": sorted(commitment_bad),
+        "decommitment_mismatches": sorted(decommitment_bad),
+        "sample": sample,
+        "time": perf_counter()-start,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="audit pp/aux against the registered keys")
+    parser.add_argument('-e','--efficient',
+        action='store_true',
+        default=False,
+        dest='eff',
+        help='efficient update variant')
+    parser.add_argument('-p','--processes',
+        type=int,
+        default=None,
+        dest='processes',
+        help='worker processes (default: one per core)')
+    parser.add_argument('-s','--sample',
+        type=float,
+        default=None,
+        dest='sample',
+        help='fraction of slots per block whose decommitments are checked (default: all)')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write the report to this json file')
+    args = parser.parse_args()
+
+    report = audit(args.eff, args.processes, args.sample)
+    print("{} keys ({} duplicate ids), {} blocks audited in {:.1f} s".format(report["keys"], report["duplicate_keys"], report["blocks"], report["time"]))
+    print("commitment mismatches:", report["commitment_mismatches"] or "none")
+    print("decommitment mismatches:", report["decommitment_mismatches"] or "none")
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    exit(1 if report["commitment_mismatches"] or report["decommitment_mismatches"] or report["duplicate_keys"] else 0)
@@ -0,0 +1,168 @@
+"""Persistent bitmap of registered ids, with per-block popcounts.
+
+The file "registered.bin" (next to the databases) holds a 16-byte header
+(magic, block size `n`) followed by one record per block, in block order: the
+number of registered ids of the block (4 bytes, little endian) and `n` bits,
+one per id of the block. The file is memory-mapped, so "is `id` registered?"
+and "how full is block `k`?" are O(1) reads with no sqlite involved, and the
+file grows by whole blocks when ids beyond it are registered (elastic CRS).
+
+`reg` rejects ids that are already set and sets the bit once the registration
+is written. For databases created before the bitmap existed, `rebuild` fills it
+from keys.db.
+
+Examples
+--------
+>>> from rbe import bitmap
+>>> registered = bitmap.IdBitmap(crs.n)
+>>> registered.is_registered(42), registered.block_fill(0)
+>>> next(registered.free_ids(0))
+"""
+
+import mmap
+import os
+import sqlite3
+import struct
+
+FILENAME = "registered.bin"
+MAGIC = b"RBEBITS\0"
+HEADER = struct.Struct("<8sII")
+COUNT = struct.Struct("<I")
+
+class IdBitmap:
+    """Memory-mapped bitmap of registered ids.
+
+    Parameters
+    ----------
+    n : int
+        block size (ids per block)
+    path : str (optional)
+        bitmap file, created if it does not exist
+    """
+
+    def __init__(self, n, path=FILENAME):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, n, 0))
+        self._file = open(path, "r+b")
+        magic, self.n, _ = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC or self.n != n:
+            self._file.close()
+            raise ValueError("{} is not a bitmap for blocks of {} ids".format(path, n))
+        self.record = COUNT.size + (self.n+7)//8
+        self._mm = None
+        self._map()
+
+    def _map(self):
+        size = os.fstat(self._file.fileno()).st_size
+        self.blocks = (size-HEADER.size)//self.record
+        if self._mm is not None:
+            self._mm.close()
+        # an empty map cannot be created, so there is none until the first block is added
+        self._mm = mmap.mmap(self._file.fileno(), size) if self.blocks > 0 else None
+
+    def _grow(self, blocks):
+        """Make room for (at least) `blocks` blocks."""
+        if blocks <= self.blocks:
+            return
+        # grow geometrically, so that registering block after block stays cheap
+        blocks = max(blocks, 2*self.blocks)
+        self._file.truncate(HEADER.size + blocks*self.record)
+        self._map()
+
+    def _locate(self, id):
+        k, i = divmod(id, self.n)
+        return k, HEADER.size + k*self.record + COUNT.size + i//8, 1 << (i % 8)
+
+    def is_registered(self, id):
+        k, pos, mask = self._locate(id)
+        if k >= self.blocks:
+            return False
+        return bool(self._mm[pos] & mask)
+
+    def block_fill(self, k):
+        """Number of registered ids in block `k`."""
+        if k >= self.blocks:
+            return 0
+        return COUNT.unpack_from(self._mm, HEADER.size + k*self.record)[0]
+
+    def mark(self, id):
+        """Set the bit of `id`; returns `False` if it was already set."""
+        k, pos, mask = self._locate(id)
+        self._grow(k+1)
+        if self._mm[pos] & mask:
+            return False
+        self._mm[pos] |= mask
+        offset = HEADER.size + k*self.record
+        COUNT.pack_into(self._mm, offset, COUNT.unpack_from(self._mm, offset)[0]+1)
+        return True
+
+    def clear(self, id):
+        """Unset the bit of `id` (e.g. when its registration was rolled back)."""
+        k, pos, mask = self._locate(id)
+        if k >= self.blocks or not self._mm[pos] & mask:
+            return
+        self._mm[pos] &= ~mask & 0xff
+        offset = HEADER.size + k*self.record
+        COUNT.pack_into(self._mm, offset, COUNT.unpack_from(self._mm, offset)[0]-1)
+
+    def free_ids(self, k):
+        """Ids of block `k` that are not registered, in increasing order."""
+        if self.block_fill(k) == self.n:
+            return
+        for i in range(self.n):
+            if not self.is_registered(k*self.n + i):
+                yield k*self.n + i
+
+    def registered_ids(self, k):
+        """Registered ids of block `k`, in increasing order."""
+        if self.block_fill(k) == 0:
+            return
+        for i in range(self.n):
+            if self.is_registered(k*self.n + i):
+                yield k*self.n + i
+
+    def total(self):
+        """Number of registered ids."""
+        return sum(self.block_fill(k) for k in range(self.blocks))
+
+    def flush(self):
+        if self._mm is not None:
+            self._mm.flush()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def rebuild(n, path=FILENAME, keys="keys.db"):
+    """Recreate the bitmap from the registered keys in `keys`.
+
+    Returns
+    -------
+    IdBitmap
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    bm = IdBitmap(n, path)
+    if os.path.exists(keys):
+        con = sqlite3.connect(keys)
+        cur = con.cursor()
+        cur.execute("SELECT id FROM key_pairs")
+        while True:
+            rows = cur.fetchmany(10000)
+            if len(rows) == 0:
+                break
+            for (id,) in rows:
+                bm.mark(id)
+        con.close()
+    bm.flush()
+    return bm
@@ -0,0 +1,150 @@
+"""LRU cache of deserialized group elements, by storage location.
+
+`reg`, `merge`, `enc` and `upd` deserialize the same rows again and again: the
+block commitments, the latest aux entries of a block, old decommitments in L.
+With a cache enabled, elements are kept by (table, rowid), together with their
+serialized form: a row whose stored bytes are still the cached ones is not
+deserialized again. `reg` and `merge` put the elements they write into the cache
+(so the next registration in the block finds them) and drop the rows they
+delete.
+
+Since a hit requires the bytes just read from the database to equal the cached
+ones, the cache never returns an element for a row that was changed elsewhere
+(another process, a rolled back registration, a restored snapshot); such rows
+count as stale misses.
+
+The cache is off by default and process-wide once enabled:
+
+>>> from rbe import cache
+>>> elements = cache.enable(capacity=100000)
+>>> ...  # reg, enc, upd, dec
+>>> elements.stats()
+{'size': ..., 'hits': ..., 'misses': ..., 'stale': ..., 'evictions': ..., 'invalidations': ...}
+"""
+
+import threading
+from collections import OrderedDict
+from petrelic.multiplicative.pairing import G1Element
+
+DEFAULT_CAPACITY = 65536
+
+class ElementCache:
+    """Bounded LRU map from (table, rowid) to (serialized, deserialized) element.
+
+    Parameters
+    ----------
+    capacity : int (optional)
+        maximum number of cached elements
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def _insert(self, key, raw, element):
+        self._items[key] = (raw, element)
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, table, rowid, raw):
+        """Cached element of the row, if its stored bytes are `raw` (else `None`)."""
+        key = (table, rowid)
+        raw = bytes(raw)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == raw:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is None:
+                self.misses += 1
+            else:
+                self.stale += 1
+            return None
+
+    def decode(self, table, rowid, raw, decoder=None):
+        """Element stored as `raw` in the row, deserialized (by `decoder`, default G1) only if not cached."""
+        element = self.lookup(table, rowid, raw)
+        if element is None:
+            element = decoder(raw) if decoder is not None else G1Element.from_binary(raw)
+            self.put(table, rowid, raw, element)
+        return element
+
+    def put(self, table, rowid, raw, element):
+        """Cache `element`, written (serialized as `raw`) to the row."""
+        with self._lock:
+            self._insert((table, rowid), bytes(raw), element)
+
+    def invalidate(self, table, rowid):
+        """Forget the row (e.g. it was deleted)."""
+        with self._lock:
+            if self._items.pop((table, rowid), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses, "stale": self.stale, "evictions": self.evictions, "invalidations": self.invalidations}
+
+# the process-wide cache (`None` while disabled)
+_active = None
+
+def enable(capacity=DEFAULT_CAPACITY):
+    """Start caching elements (with a new, empty cache); returns the cache."""
+    global _active
+    _active = ElementCache(capacity)
+    return _active
+
+def disable():
+    global _active
+    _active = None
+
+def get():
+    return _active
+
+def decode(table, rowid, raw, decoder=None):
+    """Deserialize the element stored as `raw` in the row, through the cache if enabled."""
+    if _active is None:
+        return decoder(raw) if decoder is not None else G1Element.from_binary(raw)
+    return _active.decode(table, rowid, raw, decoder)
+
+def lookup(table, rowid, raw):
+    """Cached element of the row (see `ElementCache.lookup`), `None` if disabled."""
+    if _active is None or raw is None:
+        return None
+    return _active.lookup(table, rowid, raw)
+
+def fill(upds, locations):
+    """Take the elements of a `LazyUpdates` that are cached from the cache (if enabled).
+
+    `locations[i]` is the (table, rowid) that `upds.raw[i]` was read from (or
+    `None`); the elements found are not deserialized (or counted as decoded) again.
+    """
+    if _active is None:
+        return upds
+    for i, location in enumerate(locations):
+        if location is not None and upds.elements[i] is None:
+            upds.elements[i] = lookup(location[0], location[1], upds.raw[i])
+    return upds
+
+def put(table, rowid, raw, element):
+    if _active is not None:
+        _active.put(table, rowid, raw, element)
+
+def invalidate(table, rowid):
+    if _active is not None:
+        _active.invalidate(table, rowid)
@@ -0,0 +1,288 @@
+"""Change log of pp, aux and the counts, for read replicas (followers).
+
+Once enabled, every write that `reg` and `merge` (and compaction, or block moves
+between shards) make to pp.db, aux.db and aux_count.db is also appended to a
+`changelog` table in the same database, by sqlite triggers, so it is committed in
+the same transaction as the change itself. Entries are compact: sequence number,
+block, table, rowid, and the new value (or a deletion).
+
+A `Follower` keeps a replica of those databases in its own directory (with a copy
+of crs.db) by tailing the logs of the primary and applying the new entries,
+each database in one transaction, aux before pp: as on the primary, a replica
+never shows a commitment before its decommitments. `upd` and `enc` can then be
+served from the replica (run with the replica's directory as working directory),
+from WAL snapshots that do not block the follower. A replica is stale by at most
+one polling interval plus the time to apply; `version(k)` reports the version of
+block `k` it holds (see notify.py), to compare with the primary's, and `lag` the
+log entries it has not applied yet.
+
+Examples
+--------
+On the primary, after setup (rows already stored are logged as well):
+
+>>> from rbe import changelog
+>>> changelog.enable(crs, efficient=True)
+
+In a follower process:
+
+>>> follower = changelog.Follower("/srv/primary", "/srv/replica", efficient=True)
+>>> follower.run(interval=0.05)
+
+From the command line:
+
+    python3 -m rbe.changelog enable [-e]                     # in the primary's directory
+    python3 -m rbe.changelog follow PRIMARY REPLICA [-e] [-i interval]
+    python3 -m rbe.changelog status [REPLICA ...]            # in the primary's directory
+    python3 -m rbe.changelog trim REPLICA [REPLICA ...]      # drop entries all replicas applied
+
+Notes
+-----
+Registrations written by a `RegistrationWriter` commit pp, aux and aux_count in
+one transaction over attached databases, which sqlite does not make atomic
+across them in WAL mode; a follower may then see pp's entries of a batch before
+the others (for as long as one poll).
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+from time import sleep
+from rbe import notify
+from rbe import shard
+from rbe.objects import CRS
+
+TABLE = "changelog"
+POSITION = "changelog_position"
+# applied in this order (`reg` commits pp last)
+DATABASES = ["aux.db", "aux_count.db", "pp.db"]
+WRITE = 0
+DELETE = 1
+
+def tables(crs, efficient=False):
+    """Logged tables, by database: (table, rows per block) pairs."""
+    n = crs.n
+    if efficient:
+        return {
+            "pp.db": [("pp_{}".format(i), 1) for i in range(crs.chunks)] + [("pp_block_count", 1), ("pp_com_count", n)],
+            "aux.db": [("aux_{}".format(i), n) for i in range(crs.chunks)] + [("aux_reg_count_{}".format(i), n) for i in range(crs.chunks)]
+                + [("L", (crs.log_n+1)*n), ("L_upd_num", n), ("block_version", 1)],
+            "aux_count.db": [],
+        }
+    return {
+        "pp.db": [("pp", 1)],
+        "aux.db": [("aux", n*n), ("block_version", 1)],
+        "aux_count.db": [("auxCount", 1)],
+    }
+
+def _column(con, table):
+    """Name of the value column of `table` (every logged table has one)."""
+    return con.execute("PRAGMA table_info({})".format(table)).fetchall()[0][1]
+
+def enable(crs, efficient=False):
+    """Start logging the changes to the databases in the current directory.
+
+    The rows already stored are logged first (as writes), so a follower can start
+    from empty databases. Does nothing for databases that already have a log.
+    """
+    for db, logged in tables(crs, efficient).items():
+        con = sqlite3.connect(db, isolation_level=None)
+        con.execute("BEGIN IMMEDIATE")
+        if len(con.execute("SELECT name FROM sqlite_master WHERE name = ?", (TABLE,)).fetchall()) != 0:
+            con.execute("ROLLBACK")
+            con.close()
+            continue
+        # no AUTOINCREMENT (snapshot.py does not restore sqlite_sequence); `trim` keeps the last entry instead
+        con.execute("CREATE TABLE {} (seq INTEGER PRIMARY KEY, block INTEGER, tbl TEXT, row INTEGER, op INTEGER, value)".format(TABLE))
+        for table, per_block in logged:
+            column = _column(con, table)
+            con.execute("INSERT INTO {} (block, tbl, row, op, value) SELECT rowid / ?, ?, rowid, ?, {} FROM {} ORDER BY rowid".format(TABLE, column, table),
+                (per_block, table, WRITE))
+            for event, record, op, value in [("INSERT", "NEW", WRITE, "NEW."+column), ("UPDATE", "NEW", WRITE, "NEW."+column), ("DELETE", "OLD", DELETE, "NULL")]:
+                con.execute('''CREATE TRIGGER {table}_{event}_log AFTER {event} ON {table} BEGIN
+                    INSERT INTO {log} (block, tbl, row, op, value) VALUES ({record}.rowid / {per_block}, '{table}', {record}.rowid, {op}, {value});
+                    END'''.format(table=table, event=event.lower(), log=TABLE, record=record, per_block=per_block, op=op, value=value))
+        con.execute("COMMIT")
+        con.close()
+
+def disable(crs, efficient=False):
+    """Stop logging (the log itself is kept)."""
+    for db, logged in tables(crs, efficient).items():
+        con = sqlite3.connect(db)
+        for table, per_block in logged:
+            for event in ["insert", "update", "delete"]:
+                con.execute("DROP TRIGGER IF EXISTS {}_{}_log".format(table, event))
+        con.commit()
+        con.close()
+
+def last(path):
+    """Sequence number of the last entry in the log of database `path` (0 if none)."""
+    con = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+    try:
+        seq = con.execute("SELECT max(seq) FROM {}".format(TABLE)).fetchall()[0][0]
+    except sqlite3.OperationalError:
+        # no log
+        seq = None
+    con.close()
+    return seq or 0
+
+def trim(positions):
+    """Delete the entries up to `positions` (database -> sequence number, e.g. the least applied by any follower).
+
+    The last entry is always kept, so sequence numbers keep growing. A follower
+    that still needs deleted entries (e.g. one created afterwards) refuses to
+    apply the rest and must be re-seeded.
+    """
+    deleted = 0
+    for db, seq in positions.items():
+        con = sqlite3.connect(db)
+        cur = con.execute("DELETE FROM {log} WHERE seq <= ? AND seq < (SELECT max(seq) FROM {log})".format(log=TABLE), (seq,))
+        deleted = deleted + cur.rowcount
+        con.commit()
+        con.close()
+    return deleted
+
+class Follower:
+    """A read replica of the databases of `primary`, kept in `directory` from their change logs.
+
+    Parameters
+    ----------
+    primary : str
+        directory of the primary (with the log enabled)
+    directory : str
+        directory of the replica; created (with a copy of the primary's crs.db
+        and empty databases) if it holds no crs.db
+    efficient : bool (optional)
+        efficient update variant
+
+    Attributes
+    ----------
+    applied : int
+        entries applied so far
+    """
+
+    def __init__(self, primary, directory, efficient=False):
+        self.primary = primary
+        self.directory = directory
+        if not os.path.exists(os.path.join(directory, "crs.db")):
+            shard.prepare(directory, os.path.join(primary, "crs.db"), efficient)
+        for db in DATABASES:
+            con = sqlite3.connect(os.path.join(directory, db))
+            con.execute("CREATE TABLE IF NOT EXISTS {} (seq INTEGER)".format(POSITION))
+            con.commit()
+            con.close()
+        self.applied = 0
+        self._columns = {}
+
+    def position(self):
+        """Sequence number of the last applied entry, by database."""
+        out = {}
+        for db in DATABASES:
+            con = sqlite3.connect("file:{}?mode=ro".format(os.path.join(self.directory, db)), uri=True)
+            fetched = con.execute("SELECT seq FROM {} WHERE rowid = 0".format(POSITION)).fetchall()
+            con.close()
+            out[db] = fetched[0][0] if len(fetched) != 0 else 0
+        return out
+
+    def lag(self):
+        """Log entries of the primary not applied yet, by database."""
+        return {db: last(os.path.join(self.primary, db)) - seq for db, seq in self.position().items()}
+
+    def version(self, k):
+        """Version of block `k` in the replica (see `notify.version`)."""
+        con = sqlite3.connect("file:{}?mode=ro".format(os.path.join(self.directory, "aux.db")), uri=True)
+        fetched = con.execute("SELECT version FROM block_version WHERE rowid = ?", (k,)).fetchall()
+        con.close()
+        return fetched[0][0] if len(fetched) != 0 else 0
+
+    def _read(self, db, since):
+        con = sqlite3.connect("file:{}?mode=ro".format(os.path.join(self.primary, db)), uri=True)
+        entries = con.execute("SELECT seq, block, tbl, row, op, value FROM {} WHERE seq > ? ORDER BY seq".format(TABLE), (since,)).fetchall()
+        con.close()
+        # sequence numbers have no holes, except for entries deleted by `trim`
+        if len(entries) != 0 and entries[0][0] != since+1:
+            raise ValueError("the log of {} was trimmed past entry {} (first entry {}): re-seed the replica in {}, e.g. from a snapshot of the primary".format(
+                db, since+1, entries[0][0], self.directory))
+        return entries
+
+    def _apply(self, db, entries):
+        con = sqlite3.connect(os.path.join(self.directory, db), isolation_level=None)
+        con.execute("BEGIN IMMEDIATE")
+        for seq, block, table, row, op, value in entries:
+            if op == DELETE:
+                con.execute("DELETE FROM {} WHERE rowid = ?".format(table), (row,))
+                continue
+            if table not in self._columns:
+                self._columns[table] = _column(con, table)
+            con.execute("INSERT OR REPLACE INTO {} (rowid, {}) VALUES (?, ?)".format(table, self._columns[table]), (row, value))
+        con.execute("INSERT OR REPLACE INTO {} (rowid, seq) VALUES (0, ?)".format(POSITION), (entries[-1][0],))
+        con.execute("COMMIT")
+        con.close()
+
+    def poll(self):
+        """Apply the entries logged since the last call; returns how many were applied.
+
+        Raises
+        ------
+        ValueError
+            if entries the replica has not applied were trimmed (nothing is applied)
+        """
+        since = self.position()
+        # pp's entries are read first: the aux and aux_count entries of every registration they hold were committed before
+        pending = {"pp.db": self._read("pp.db", since["pp.db"])}
+        for db in DATABASES[:-1]:
+            pending[db] = self._read(db, since[db])
+        count = 0
+        for db in DATABASES:
+            if len(pending[db]) == 0:
+                continue
+            self._apply(db, pending[db])
+            count = count + len(pending[db])
+        # the blocks' aux is final in the replica, tell its subscribers
+        for seq, block, table, row, op, value in pending["aux.db"]:
+            if table == "block_version" and op == WRITE:
+                notify.publish(block, value)
+        self.applied = self.applied + count
+        return count
+
+    def run(self, interval=0.05, stop=None):
+        """Poll every `interval` seconds (when there was nothing to apply) until `stop` (a `threading.Event`) is set."""
+        stop = stop if stop is not None else threading.Event()
+        while not stop.is_set():
+            if self.poll() == 0:
+                sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="change log and read replicas")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for command, text in [('enable', 'log the changes (in the primary directory)'), ('disable', 'stop logging (in the primary directory)')]:
+        p = sub.add_parser(command, help=text)
+        p.add_argument('-e','--efficient', action='store_true', default=False, dest='eff', help='efficient update variant')
+    p = sub.add_parser('follow', help='keep a replica up to date')
+    p.add_argument('primary')
+    p.add_argument('replica')
+    p.add_argument('-e','--efficient', action='store_true', default=False, dest='eff', help='efficient update variant')
+    p.add_argument('-i','--interval', type=float, default=0.05, dest='interval', help='polling interval (s)')
+    p = sub.add_parser('status', help='log entries and lag of replicas (in the primary directory)')
+    p.add_argument('replicas', nargs='*')
+    p = sub.add_parser('trim', help='drop the entries applied by all replicas (in the primary directory)')
+    p.add_argument('replicas', nargs='+')
+    args = parser.parse_args()
+
+    if args.command in ('enable', 'disable'):
+        (enable if args.command == 'enable' else disable)(CRS(), args.eff)
+    elif args.command == 'follow':
+        Follower(args.primary, args.replica, args.eff).run(args.interval)
+    else:
+        positions = []
+        for replica in args.replicas:
+            if not os.path.exists(os.path.join(replica, "crs.db")):
+                raise FileNotFoundError("no replica in {}".format(replica))
+            follower = Follower(".", replica)
+            positions += [follower.position()]
+            if args.command == 'status':
+                print("{}\tbehind by {}".format(replica, follower.lag()))
+        if args.command == 'status':
+            print("last entries", {db: last(db) for db in DATABASES})
+        else:
+            print("{} entries deleted".format(trim({db: min(p[db] for p in positions) for db in DATABASES})))
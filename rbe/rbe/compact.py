@@ -0,0 +1,167 @@
+"""Compaction of the update history in aux (regular variant).
+
+In the regular variant every registration in block `k` appends an update for
+every other id of the block, so aux grows to about `n` rows per id. `upd`
+returns all of them, but only recent ones are needed: a ciphertext made when
+block `k` had `c` registrations is decrypted with the `c`-th update. Compaction
+keeps the last `keep` updates of every id and deletes the older ones.
+
+Rows are deleted in place (kept rows keep their rowids), so `reg` still finds
+each id's latest update and `upd` still returns updates at their positions
+(the compacted ones are skipped, see `LazyUpdates`); `dec` then fails (asks for
+an update) only for ciphertexts older than `keep` registrations in the block.
+
+Blocks are compacted one at a time, each in its own short transaction, so a
+registration waits at most for one block, and reads (WAL snapshots) not at all.
+Freed pages are returned to the file system with incremental vacuum, for aux.db
+created with `auto_vacuum=INCREMENTAL` (as `setup` does); otherwise they are
+reused by later registrations.
+
+Examples
+--------
+>>> from rbe import compact
+>>> report = compact.compact(crs, keep=4)
+>>> report["rows_deleted"], report["bytes_reclaimed"]
+
+From the command line, in the directory holding the databases:
+
+    python3 -m rbe.compact [-w keep] [-p pause]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from time import perf_counter, sleep
+from rbe.objects import CRS
+
+def compact_block(con, crs, k, keep=1):
+    """Delete all but the last `keep` updates of each id of block `k`.
+
+    Parameters
+    ----------
+    con : sqlite3.Connection
+        connection to aux.db in autocommit mode (`isolation_level=None`)
+    crs : CRS
+        common reference string
+    k : int
+        block index
+    keep : int (optional)
+        updates to keep per id
+
+    Returns
+    -------
+    int
+        number of deleted rows
+    """
+    n = crs.n
+    base = k*n*n
+    cur = con.cursor()
+    # a write lock up front: the latest updates read here cannot change before they are used
+    cur.execute("BEGIN IMMEDIATE")
+    # the updates of the id at index i of the block are at rowids base + i*n, base + i*n + 1, ... (see `reg`)
+    cur.execute("SELECT (rowid - ?) / ?, max(rowid) FROM aux WHERE rowid BETWEEN ? AND ? GROUP BY 1", (base, n, base, base+n*n-1))
+    ranges = [(base+i*n, last-keep) for i, last in cur.fetchall() if last-keep >= base+i*n]
+    before = con.total_changes
+    cur.executemany("DELETE FROM aux WHERE rowid BETWEEN ? AND ?", ranges)
+    deleted = con.total_changes - before
+    cur.execute("COMMIT")
+    return deleted
+
+def _pages(cur):
+    cur.execute("PRAGMA page_count")
+    pages = cur.fetchall()[0][0]
+    cur.execute("PRAGMA freelist_count")
+    return pages, cur.fetchall()[0][0]
+
+def compact(crs, keep=1, blocks=None, pause=0.0, timeout=30.0):
+    """Compact aux in the current directory, block by block.
+
+    Parameters
+    ----------
+    crs : CRS
+        common reference string
+    keep : int (optional)
+        updates to keep per id (at least 1: `reg` builds on the latest)
+    blocks : array of int (optional)
+        blocks to compact (default: all blocks with registrations)
+    pause : float (optional)
+        seconds to sleep between blocks (to leave room for registrations)
+    timeout : float (optional)
+        seconds to wait for a registration holding the write lock
+
+    Returns
+    -------
+    dict
+        `blocks` (compacted), `rows_deleted`, `bytes_freed` (pages no longer
+        used by aux), `bytes_reclaimed` (pages returned to the file system),
+        `auto_vacuum` and `time` (s)
+    """
+    if keep < 1:
+        raise ValueError("at least the latest update of each id must be kept")
+    start = perf_counter()
+    con = sqlite3.connect("aux.db", isolation_level=None, timeout=timeout)
+    cur = con.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='aux'")
+    if len(cur.fetchall()) == 0:
+        con.close()
+        raise ValueError("aux.db has no update history to compact (efficient variant?)")
+    cur.execute("PRAGMA auto_vacuum")
+    incremental = cur.fetchall()[0][0] == 2
+    cur.execute("PRAGMA page_size")
+    page_size = cur.fetchall()[0][0]
+    pages_before, free_before = _pages(cur)
+
+    if blocks is None:
+        con_count = sqlite3.connect("file:aux_count.db?mode=ro", uri=True)
+        blocks = [k for (k,) in con_count.execute("SELECT rowid FROM auxCount ORDER BY rowid")]
+        con_count.close()
+
+    deleted = 0
+    for j, k in enumerate(blocks):
+        deleted = deleted + compact_block(con, crs, k, keep)
+        if incremental:
+            # frees the pages of this block's deleted rows (its own short transaction)
+            cur.execute("PRAGMA incremental_vacuum").fetchall()
+        if pause > 0 and j < len(blocks)-1:
+            sleep(pause)
+
+    pages_after, free_after = _pages(cur)
+    # move the pages back from the WAL, so that aux.db itself shrinks (without waiting for readers)
+    cur.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    con.close()
+    return {
+        "blocks": len(blocks),
+        "rows_deleted": deleted,
+        "bytes_freed": ((pages_before-free_before) - (pages_after-free_after))*page_size,
+        "bytes_reclaimed": (pages_before-pages_after)*page_size,
+        "auto_vacuum": "incremental" if incremental else "none",
+        "time": perf_counter()-start,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compact the update history in aux (regular variant)")
+    parser.add_argument('-w','--keep',
+        type=int,
+        default=1,
+        dest='keep',
+        help='updates to keep per id')
+    parser.add_argument('-p','--pause',
+        type=float,
+        default=0.0,
+        dest='pause',
+        help='seconds between blocks')
+    parser.add_argument('-o','--out',
+        default=None,
+        dest='out',
+        help='write the report to this json file')
+    args = parser.parse_args()
+
+    size = os.path.getsize("aux.db")
+    report = compact(CRS(), args.keep, pause=args.pause)
+    print("{} rows deleted in {} blocks ({:.1f} s)".format(report["rows_deleted"], report["blocks"], report["time"]))
+    print("freed {} bytes, returned {} bytes to the file system (auto_vacuum: {}); aux.db: {} -> {} bytes".format(
+        report["bytes_freed"], report["bytes_reclaimed"], report["auto_vacuum"], size, os.path.getsize("aux.db")))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
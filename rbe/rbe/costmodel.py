@@ -0,0 +1,497 @@
+"""Analytical cost model of the RBE algorithms.
+
+Counts exactly how many primitive operations (pairings, exponentiations,
+multiplications, (de)serializations, sqlite statements and commits) each
+algorithm performs, as a function of N and of the state of the block it works
+on, and turns these counts into runtime predictions using measured
+per-primitive costs (see bench-ops/ops-micro.py). Merge cascades follow the
+binary counter of the efficient variant: the `c`-th registration in a block
+triggers as many merges as `c` has trailing one bits.
+
+The primitive classes are the ones counted by `rbe.instrument`, so predicted
+counts can be compared directly with instrumented runs (bench/simulate.py).
+
+This module has no dependencies besides the standard library.
+"""
+
+from math import ceil,sqrt,log2
+
+PRIMITIVES = ["pair", "exp_g1", "exp_g2", "exp_gt", "mul_g1", "mul_gt",
+              "serialize", "deserialize", "sql_connect", "sql_execute", "sql_commit"]
+
+# primitive class -> key in the microbenchmark output (bench-ops/ops-micro.py)
+MICRO_KEYS = {
+    "pair": "pair",
+    "exp_g1": "exp_g1",
+    "exp_g2": "exp_g2",
+    "exp_gt": "exp_gt",
+    "mul_g1": "mul_g1",
+    "mul_gt": "mul_gt",
+    "serialize": "serialize_g1",
+    "deserialize": "deserialize_g1",
+    "sql_connect": "sql_connect",
+    "sql_execute": "sql_execute",
+    "sql_commit": "sql_commit",
+}
+
+# BLS12-381 element sizes in bytes (compressed), used if no measured sizes are given
+DEFAULT_SIZES = {"g1": 48, "g2": 96, "gt": 576, "scalar": 32, "int": 4}
+# integer columns (ids and counts, below 2**32) in the non-sqlite layouts
+INT_BYTES = 4
+
+def dims(N, n=None):
+    """Block size `n` (default `sqrt(N)`), number of chunk tables `t` and number of blocks `B` for `N` users.
+
+    `t = floor(log2(n))+1` (see `CRS.chunks`), i.e. `log n` unless `n` is a power of two.
+    """
+    n = ceil(sqrt(N)) if n is None else n
+    t = n.bit_length()
+    B = ceil(N/n)
+    return n, t, B
+
+def trailing_ones(c):
+    """Number of merges triggered by registering into a block that holds `c` parties."""
+    m = 0
+    while c & 1:
+        m = m + 1
+        c = c >> 1
+    return m
+
+def popcount(c):
+    return bin(c).count("1")
+
+def _ops(**counts):
+    out = dict.fromkeys(PRIMITIVES, 0)
+    out.update(counts)
+    return out
+
+def add(a, b, scale=1):
+    """`a + scale*b` for operation counts."""
+    return {p: a.get(p, 0) + scale*b.get(p, 0) for p in PRIMITIVES}
+
+def ops_setup(N, efficient=False, n=None):
+    """Operations of `setup` (on a fresh directory)."""
+    n, t, B = dims(N, n)
+    # (N, block size and mode, generators, h_i)
+    crs = _ops(exp_g1=2*n-1, exp_g2=2*n-1, serialize=4*n, sql_connect=1, sql_execute=4*n+5, sql_commit=1)
+    if efficient:
+        # aux_count, aux (L, L_upd_num, t aux and count tables, block versions), pp (t+2 tables); count rows are created lazily
+        tables = _ops(sql_connect=3, sql_execute=3 + 1 + 3+2*t + t+2, sql_commit=3)
+    else:
+        # aux_count, aux (incremental auto-vacuum, aux table, block versions), pp
+        tables = _ops(sql_connect=3, sql_execute=3 + 5, sql_commit=3)
+    return add(crs, tables)
+
+def ops_gen(N, n=None):
+    """Operations of `gen`."""
+    n, t, B = dims(N, n)
+    return _ops(exp_g1=n)
+
+def ops_reg(N, c, efficient=False, id_index=1, first=False, n=None):
+    """Operations of `reg` (without the merges it triggers).
+
+    Parameters
+    ----------
+    N : int
+        maximum number of users
+    c : int
+        number of parties already registered in the block
+    efficient : bool (optional)
+        efficient update variant
+    id_index : int (optional)
+        index of the registering id in its block (only `0` vs. other matters)
+    first : bool (optional)
+        first registration overall (creates the key table, in WAL mode)
+    """
+    n, t, B = dims(N, n)
+    # key database, and the consistency check of the helping values
+    ops = _ops(serialize=1, sql_connect=1, sql_execute=3 if first else 1, sql_commit=1, pair=n if id_index == 0 else n-1)
+    if efficient:
+        # pp: commitment to pk at index popcount(c), block and com counts (committed with the merges)
+        ops = add(ops, _ops(serialize=1, sql_connect=1, sql_execute=5, sql_commit=1))
+        # aux: decommitments (helping values) for the whole block, id's chunk count, and the block version
+        ops = add(ops, _ops(serialize=n, sql_connect=1, sql_execute=n+3, sql_commit=1))
+    else:
+        # pp: fetch commitment and multiply pk into it
+        ops = add(ops, _ops(deserialize=1 if c > 0 else 0, mul_g1=1, serialize=1, sql_connect=1, sql_execute=2, sql_commit=1))
+        # aux: fetch the latest update of every other id, multiply in its helping value; bump the block version
+        selects = 2*(n-1) if c == 0 else (n-1)+c
+        decoded = 0 if c == 0 else (n-2 if c == 1 else n-1)
+        ops = add(ops, _ops(deserialize=decoded, mul_g1=n-1, serialize=n-1, sql_connect=1, sql_execute=selects+(n-1)+2, sql_commit=1))
+        # aux_count, read before and updated after (one transaction)
+        ops = add(ops, _ops(sql_connect=1, sql_execute=2, sql_commit=1))
+    return ops
+
+def ops_merge(N, c, n=None):
+    """Operations of the merge cascade triggered by the `c`-th registration in a block.
+
+    Parameters
+    ----------
+    N : int
+        maximum number of users
+    c : int
+        number of parties in the block before the registration
+    """
+    n, t, B = dims(N, n)
+    merges = trailing_ones(c)
+    if merges == 0:
+        return _ops()
+    # (the cascade runs on the connections of `reg` and is committed by it)
+    ops = _ops()
+    for m in range(merges):
+        # the previous chunk holds 2**m parties, whose decommitments are appended to L
+        moved = 2**m
+        pp = _ops(deserialize=2, mul_g1=1, serialize=1, sql_execute=8)
+        aux = _ops(deserialize=2*n, mul_g1=n, serialize=n+moved, sql_execute=2+7*n+2*moved)
+        ops = add(ops, add(pp, aux))
+    # the last call finds two chunks of different size (unless it reached index 0)
+    if popcount(c+1) > 1:
+        ops = add(ops, _ops(sql_execute=2))
+    return ops
+
+def ops_enc(N, c, efficient=False, n=None):
+    """Operations of `enc` to an id whose block holds `c` parties."""
+    n, t, B = dims(N, n)
+    coms = t if efficient else 1
+    decoded = popcount(c) if efficient else 1
+    # (a snapshot read: BEGIN, then the commitments)
+    return _ops(deserialize=decoded, sql_connect=1, sql_execute=1+coms,
+                pair=2*coms, exp_gt=2*coms, exp_g2=coms, mul_gt=coms)
+
+def ops_upd(N, efficient=False, n=None):
+    """Operations of `upd` (elements are deserialized later, by `dec`)."""
+    n, t, B = dims(N, n)
+    # (a snapshot read: BEGIN, then the updates)
+    if efficient:
+        # (one range read of L, one read per aux table)
+        return _ops(sql_connect=1, sql_execute=2+t)
+    return _ops(sql_connect=1, sql_execute=2)
+
+def ops_dec(tries, decoded=None):
+    """Operations of `dec` that succeeds at the `tries`-th (ciphertext, update) combination.
+
+    `decoded` is the number of updates deserialized on the way (default: `tries`);
+    empty (neutral) updates are not deserialized.
+    """
+    check = _ops(pair=3, exp_g1=1, mul_gt=1)
+    decoded = tries if decoded is None else decoded
+    return add(_ops(pair=1, exp_gt=2, mul_gt=2, deserialize=decoded), check, tries)
+
+def expected_dec_tries(N, c, efficient=False, upd_idx=False, n=None):
+    """Expected number of combinations `dec` checks, for a random id of a block with `c` parties.
+
+    In the efficient variant ciphertext `j` matches update `t+j` (the current
+    decommitment for the `j`-th commitment); a random party is in chunk `j` with
+    probability proportional to its size.
+    """
+    n, t, B = dims(N, n)
+    if not efficient:
+        # the update list has (about) one entry per registration in the block,
+        # and a ciphertext to the current commitment matches the last one
+        return 1 if upd_idx else max(c, 1)
+    chunks = [2**b for b in range(c.bit_length()-1, -1, -1) if c >> b & 1]
+    return sum(size/c * (j*2*t + t+j+1) for j, size in enumerate(chunks)) if c > 0 else 1
+
+def ops_dec_expected(N, c, efficient=False, upd_idx=False, n=None):
+    """Expected operations of `dec` for a random id of a block with `c` parties.
+
+    Only non-empty updates are deserialized: in the regular variant all but the
+    leading neutral element; in the efficient variant the `popcount(c)` current
+    decommitments and (on average) `t/2` older ones in L.
+    """
+    n, t, B = dims(N, n)
+    tries = expected_dec_tries(N, c, efficient, upd_idx, n)
+    if efficient:
+        return ops_dec(tries, min(tries, popcount(c) + t/2))
+    return ops_dec(tries, tries if upd_idx else tries-1)
+
+def cost(ops, costs):
+    """Predicted time (s) of the operation counts `ops` under per-primitive `costs`."""
+    return sum(ops[p]*costs.get(p, 0.0) for p in PRIMITIVES)
+
+def load_costs(micro):
+    """Per-primitive costs (s) from the output of bench-ops/ops-micro.py.
+
+    Parameters
+    ----------
+    micro : dict
+        parsed microbenchmark json
+
+    Returns
+    -------
+    dict
+        primitive class -> mean time (s)
+    """
+    ops = micro["ops"]
+    costs = {p: ops[k]["mean"] for p, k in MICRO_KEYS.items() if k in ops}
+    # the commit benchmark includes one statement
+    if "sql_commit" in costs and "sql_execute" in costs:
+        costs["sql_commit"] = max(costs["sql_commit"]-costs["sql_execute"], 0.0)
+    return costs
+
+def block_sizes(N, n=None):
+    """Number of parties in each block when all `N` users are registered."""
+    n, t, B = dims(N, n)
+    return [n]*(B-1) + [N-(B-1)*n]
+
+def fill_block(N, size, efficient=False, n=None):
+    """Operation counts of registering `size` parties into an empty block.
+
+    Returns
+    -------
+    reg, merge : dict
+        summed operation counts of all `reg` calls (excluding merges) and of all merges
+    merges : int
+        number of merges done
+    """
+    reg = _ops()
+    merge = _ops()
+    merges = 0
+    n, t, B = dims(N, n)
+    for c in range(size):
+        # one in n registering parties has index 0 and checks one more pairing
+        reg = add(add(reg, ops_reg(N, c, efficient, n=n)), _ops(pair=1/n))
+        if efficient:
+            merge = add(merge, ops_merge(N, c, n))
+            merges = merges + trailing_ones(c)
+    return reg, merge, merges
+
+def l_entries(c):
+    """Entries appended to L while `c` parties register into one block (efficient variant)."""
+    return sum(2**trailing_ones(i)-1 for i in range(c))
+
+def l_parties(c):
+    """Parties with at least one entry in L after `c` parties register into one block (efficient variant)."""
+    # chunks as [parties, parties with entries]; the older chunk of a merge moves all its parties to L
+    chunks = []
+    for i in range(c):
+        chunks += [[1, 0]]
+        while len(chunks) > 1 and chunks[-1][0] == chunks[-2][0]:
+            last = chunks.pop()
+            chunks[-1] = [chunks[-1][0]+last[0], chunks[-1][0]+last[1]]
+    return sum(with_entries for parties, with_entries in chunks)
+
+def chunk_size(c, i):
+    """Parties in the `i`-th chunk (commitment) of a block with `c` parties (efficient variant)."""
+    chunks = [2**b for b in range(c.bit_length()-1, -1, -1) if c >> b & 1]
+    return chunks[i] if i < len(chunks) else 0
+
+def _per_block(N, fn, n=None):
+    """Sum of `fn(c)` over the block sizes of a full system (computed once per distinct size)."""
+    blocks = block_sizes(N, n)
+    return sum(blocks.count(c)*fn(c) for c in set(blocks))
+
+def tables(N, efficient=False, elem=DEFAULT_SIZES, n=None):
+    """Layout of every stored table when all `N` users are registered.
+
+    Returns
+    -------
+    array of dict
+        one entry per (part of a) table: `db` and `table` name, number of `rows`,
+        `blob` (bytes of the blob column, 0 if none), `ints` (representative values
+        of the integer columns), `max_rowid`, `dense` (rowids are exactly
+        0..rows-1, so a packed layout needs no rowids) and `scattered` (rows are
+        inserted in random rowid order)
+    """
+    n, t, B = dims(N, n)
+    g1, g2 = elem["g1"], elem["g2"]
+
+    def table(db, name, rows, blob=0, ints=[], max_rowid=None, scattered=False):
+        max_rowid = rows-1 if max_rowid is None else max_rowid
+        return {"db": db, "table": name, "rows": rows, "blob": blob, "ints": ints,
+                "max_rowid": max_rowid, "dense": max_rowid == rows-1, "scattered": scattered}
+
+    out = [
+        table("crs", "crs", 3, ints=[N]),
+        table("crs", "crs", 2*n, blob=g1, max_rowid=4*n+2),
+        table("crs", "crs", 2*n, blob=g2, max_rowid=4*n+2),
+        table("keys", "key_pairs", N, blob=g1, ints=[N//2], max_rowid=N),
+        table("aux", "block_version", B, ints=[n]),
+    ]
+    if efficient:
+        for i in range(t):
+            blocks_with_chunk = _per_block(N, lambda c: 1 if popcount(c) > i else 0, n)
+            out += [table("pp", "pp_{}".format(i), blocks_with_chunk, blob=g1, max_rowid=B-1)]
+            out += [table("aux", "aux_{}".format(i), blocks_with_chunk*n, blob=g1, max_rowid=N-1)]
+            # count rows only exist for the parties of the chunk
+            out += [table("aux", "aux_reg_count_{}".format(i), _per_block(N, lambda c: chunk_size(c, i), n), ints=[1], max_rowid=N-1)]
+        out += [
+            table("pp", "pp_block_count", B, ints=[n]),
+            table("pp", "pp_com_count", _per_block(N, popcount, n), ints=[n//2], max_rowid=B*n+t),
+            table("aux", "L", _per_block(N, l_entries, n), blob=g1, max_rowid=(t+1)*N, scattered=True),
+            table("aux", "L_upd_num", _per_block(N, l_parties, n), ints=[t//2], max_rowid=N-1, scattered=True),
+        ]
+    else:
+        # every registration writes an update for each of the n-1 other slots of its block
+        out += [
+            table("pp", "pp", B, blob=g1),
+            table("aux", "aux", _per_block(N, lambda c: c*(n-1), n), blob=g1, max_rowid=B*n*n, scattered=True),
+            table("aux_count", "auxCount", B, ints=[n]),
+        ]
+    return out
+
+def _varint(v):
+    """Bytes of sqlite's variable-length integer encoding of `v`."""
+    size = 1
+    while v >= 128 and size < 9:
+        v = v >> 7
+        size = size + 1
+    return size
+
+def _int_bytes(v):
+    """Bytes sqlite uses to store integer `v` in a record."""
+    if v in (0, 1):
+        return 0
+    for size, bound in [(1, 2**7), (2, 2**15), (3, 2**23), (4, 2**31), (6, 2**47)]:
+        if -bound <= v < bound:
+            return size
+    return 8
+
+def _sqlite_cell(spec):
+    """Bytes of one table b-tree leaf cell (including its cell pointer)."""
+    header = 1 + len(spec["ints"]) + (_varint(2*spec["blob"]+12) if spec["blob"] else 0)
+    payload = header + sum(_int_bytes(v) for v in spec["ints"]) + spec["blob"]
+    return _varint(payload) + _varint(spec["max_rowid"]) + payload + 2
+
+def sqlite_table_bytes(rows, cell, max_rowid, page_size=4096):
+    """Bytes of a sqlite rowid table with `rows` cells of `cell` bytes, with full pages."""
+    if rows == 0:
+        return page_size
+    leaves = ceil(rows / max((page_size-8)//cell, 1))
+    pages = leaves
+    # interior pages: 4-byte child pointer, rowid, cell pointer
+    fanout = (page_size-12) // (4 + _varint(max_rowid) + 2)
+    level = leaves
+    while level > 1:
+        level = ceil(level/fanout)
+        pages = pages + level
+    return pages*page_size
+
+def storage_bytes(specs, backend="sqlite", page_size=4096):
+    """Exact per-record size accounting of table `specs` (see `tables`) per database.
+
+    Parameters
+    ----------
+    specs : array of dict
+        tables, as returned by `tables`
+    backend : str (optional)
+        `"payload"` (stored values only, the least of all layouts), `"sqlite"`
+        (b-tree cells on full pages, plus the schema page of each database),
+        `"compact"` (packed fixed-width records, with 8-byte rowids only for
+        non-dense tables), or `"mmap"` (one fixed-width slot per possible rowid plus
+        a presence bitmap, each table page-aligned, for O(1) addressing)
+    page_size : int (optional)
+        sqlite / mmap page size in bytes
+
+    Returns
+    -------
+    dict
+        database name -> bytes
+    """
+    out = {}
+    if backend == "sqlite":
+        grouped = {}
+        for spec in specs:
+            key = (spec["db"], spec["table"])
+            rows, cells, max_rowid = grouped.get(key, (0, 0, 0))
+            grouped[key] = (rows+spec["rows"], cells+spec["rows"]*_sqlite_cell(spec), max(max_rowid, spec["max_rowid"]))
+        for (db, table), (rows, cells, max_rowid) in grouped.items():
+            cell = ceil(cells/rows) if rows else 0
+            out[db] = out.get(db, page_size) + sqlite_table_bytes(rows, cell, max_rowid, page_size)
+        return out
+    for spec in specs:
+        width = spec["blob"] + INT_BYTES*len(spec["ints"])
+        if backend == "payload":
+            size = spec["rows"]*width
+        elif backend == "compact":
+            size = spec["rows"]*(width + (0 if spec["dense"] else 8))
+        elif backend == "mmap":
+            slots = spec["max_rowid"]+1
+            size = ceil((slots*width + ceil(slots/8)) / page_size) * page_size
+        else:
+            raise ValueError("unknown storage backend {}".format(backend))
+        out[spec["db"]] = out.get(spec["db"], 0) + size
+    return out
+
+def sizes(N, efficient=False, elem=DEFAULT_SIZES, backend="payload", n=None):
+    """Bytes of crs, pp, aux and keys when all `N` users are registered.
+
+    Parameters
+    ----------
+    N : int
+        maximum number of users
+    efficient : bool (optional)
+        efficient update variant
+    elem : dict (optional)
+        element sizes in bytes
+    backend : str (optional)
+        storage layout to account for (see `storage_bytes`); by default only the
+        stored values are counted
+
+    Returns
+    -------
+    dict
+        bytes of `crs`, `pp`, `aux` (including the count tables), `keys`, the
+        bitmap of registered ids `registered` (the same for every backend), and
+        row counts `pp_rows`, `aux_rows` (group elements in pp and aux)
+    """
+    n, t, B = dims(N, n)
+    specs = tables(N, efficient, elem, n)
+    out = storage_bytes(specs, backend)
+    # header, then a 4-byte count and n bits per block (see bitmap.py)
+    out["registered"] = 16 + B*(4 + (n+7)//8)
+    out["aux"] = out.get("aux", 0) + out.pop("aux_count", 0)
+    out["pp_rows"] = sum(s["rows"] for s in specs if s["db"] == "pp" and s["blob"])
+    out["aux_rows"] = sum(s["rows"] for s in specs if s["db"] == "aux" and s["blob"])
+    return out
+
+def predict(N, costs, efficient=False, elem=DEFAULT_SIZES, n=None):
+    """Predict per-operation latency, total registration time, and parameter sizes.
+
+    Latencies of enc, upd and dec are for a full block; reg is averaged over
+    filling a block, and merge is the average cost of one merge.
+
+    Parameters
+    ----------
+    N : int
+        maximum number of users
+    costs : dict
+        per-primitive costs (s), e.g. from `load_costs`
+    efficient : bool (optional)
+        efficient update variant
+    elem : dict (optional)
+        element sizes in bytes
+
+    Returns
+    -------
+    dict
+        `latency` (s per call, by algorithm), `ops` (counts per call),
+        `reg_total` (s to register all N users), and `sizes` (bytes)
+    """
+    n, t, B = dims(N, n)
+    reg, merge, merges = fill_block(N, n, efficient, n)
+    ops = {
+        "setup": ops_setup(N, efficient, n),
+        "gen": ops_gen(N, n),
+        "reg": add(_ops(), add(reg, merge), 1/n),
+        "enc": ops_enc(N, n, efficient, n),
+        "upd": ops_upd(N, efficient, n),
+        "dec": ops_dec_expected(N, n, efficient, n=n),
+    }
+    if merges != 0:
+        ops["merge"] = add(_ops(), merge, 1/merges)
+    latency = {alg: cost(o, costs) for alg, o in ops.items()}
+    reg_total = 0.0
+    for size in set(block_sizes(N, n)):
+        count = block_sizes(N, n).count(size)
+        reg, merge, merges = fill_block(N, size, efficient, n)
+        reg_total = reg_total + count*(cost(reg, costs) + cost(merge, costs) + size*latency["gen"])
+    return {
+        "N": N,
+        "n": n,
+        "variant": "efficient" if efficient else "regular",
+        "latency": latency,
+        "ops": ops,
+        "reg_total": reg_total,
+        "sizes": sizes(N, efficient, elem, n=n),
+    }
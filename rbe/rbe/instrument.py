@@ -0,0 +1,275 @@
+"""Opt-in operation counting and timing for the RBE algorithms.
+
+While a `Recorder` is active, every pairing, group exponentiation and
+multiplication, (de)serialization, and sqlite connection, statement or commit is counted
+and timed, and attributed to the algorithm (`setup`, `gen`, `reg`, `enc`,
+`upd`, `dec`, `merge`, ...) that is running at the time. When no recorder is
+active the primitives are not wrapped at all, and the algorithms only pay for a
+single global lookup per call.
+
+Examples
+--------
+As a context manager:
+
+>>> from rbe import instrument
+>>> with instrument.Recorder() as rec:
+...     reg(crs, 42, pk, xi)
+>>> rec.print_summary()
+
+Or through the global registry:
+
+>>> rec = instrument.enable()
+>>> reg(crs, 42, pk, xi)
+>>> instrument.disable()
+>>> open("profile.json", "w").write(rec.to_json())
+
+Notes
+-----
+Primitive costs are attributed to the innermost algorithm on the stack, so the
+operations of a `merge` triggered by `reg` are reported under `merge`, while
+the time reported for `reg` includes that merge. Recursive calls of an algorithm
+(`merge` calls itself once per level) are folded into the outermost call.
+Primitives called from within another primitive are not counted separately.
+"""
+
+import functools
+import inspect
+import json
+import sqlite3
+import threading
+from time import perf_counter
+from petrelic.multiplicative.pairing import G1Element,G2Element,GTElement
+
+# the active Recorder, if any
+_active = None
+
+# primitive class -> methods that implement it
+PRIMITIVES = {
+    "pair": [(G1Element, "pair")],
+    "exp_g1": [(G1Element, "__pow__")],
+    "exp_g2": [(G2Element, "__pow__")],
+    "exp_gt": [(GTElement, "__pow__")],
+    "mul_g1": [(G1Element, "__mul__")],
+    "mul_gt": [(GTElement, "__mul__"), (GTElement, "__truediv__")],
+    "serialize": [(G1Element, "to_binary"), (G2Element, "to_binary"), (GTElement, "to_binary")],
+    "deserialize": [(G1Element, "from_binary"), (G2Element, "from_binary"), (GTElement, "from_binary")],
+}
+
+# bucket for primitives that run outside of any instrumented algorithm
+OUTSIDE = "-"
+
+def _new_stats():
+    return {"calls": 0, "time": 0.0, "ops": {}}
+
+def _timed(fn, prim):
+    """Wrap `fn` so that each call is counted as primitive `prim`."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        rec = _active
+        if rec is None or rec._in_primitive:
+            return fn(*args, **kwargs)
+        rec._in_primitive = True
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            rec._in_primitive = False
+            rec._add(prim, perf_counter()-start)
+    return wrapper
+
+class _Cursor(sqlite3.Cursor):
+    def execute(self, *args):
+        return _timed(super().execute, "sql_execute")(*args)
+
+    def executemany(self, *args):
+        return _timed(super().executemany, "sql_execute")(*args)
+
+class _Connection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(_Cursor if factory is None else factory)
+
+    def execute(self, *args):
+        return _timed(super().execute, "sql_execute")(*args)
+
+    def commit(self):
+        return _timed(super().commit, "sql_commit")()
+
+def algorithm(fn):
+    """Decorator marking `fn` as an RBE algorithm whose primitive operations are attributed to it."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        rec = _active
+        if rec is None or (len(rec._stack) != 0 and rec._stack[-1][0] == name):
+            return fn(*args, **kwargs)
+        frame = (name, _new_stats())
+        rec._stack.append(frame)
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            frame[1]["calls"] = 1
+            frame[1]["time"] = perf_counter()-start
+            rec._stack.pop()
+            rec._close(name, frame[1])
+    return wrapper
+
+class Recorder:
+    """Collects primitive operation counts and times per algorithm.
+
+    Parameters
+    ----------
+    per_call : bool (optional)
+        also keep the breakdown of every single algorithm call (in `calls`)
+
+    Attributes
+    ----------
+    algorithms : dict
+        per algorithm name: number of `calls`, total `time` (s), and `ops`,
+        mapping each primitive class to its `count` and total `time` (s)
+    calls : array of (str, dict)
+        per-call breakdowns, in call order (only if `per_call` is set)
+    """
+    def __init__(self, per_call=False):
+        self.per_call = per_call
+        self.algorithms = {}
+        self.calls = []
+        # algorithm stack and primitive flag of each thread (e.g. behind a RegistrationWriter)
+        self._local = threading.local()
+        # totals are shared between threads
+        self._lock = threading.Lock()
+        self._patched = []
+        self._connect = None
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @property
+    def _in_primitive(self):
+        return getattr(self._local, "in_primitive", False)
+
+    @_in_primitive.setter
+    def _in_primitive(self, value):
+        self._local.in_primitive = value
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """Install the instrumentation hooks and make this the active recorder."""
+        global _active
+        if _active is not None:
+            raise RuntimeError("another Recorder is already active")
+        for prim, methods in PRIMITIVES.items():
+            for cls, name in methods:
+                raw = inspect.getattr_static(cls, name)
+                if isinstance(raw, (classmethod, staticmethod)):
+                    wrapped = type(raw)(_timed(raw.__func__, prim))
+                else:
+                    wrapped = _timed(raw, prim)
+                self._patched += [(cls, name, raw, name in cls.__dict__)]
+                setattr(cls, name, wrapped)
+        self._connect = sqlite3.connect
+        connect = self._connect
+        def counting_connect(*args, **kwargs):
+            kwargs.setdefault("factory", _Connection)
+            return connect(*args, **kwargs)
+        sqlite3.connect = _timed(counting_connect, "sql_connect")
+        _active = self
+
+    def stop(self):
+        """Remove the instrumentation hooks."""
+        global _active
+        if _active is not self:
+            return
+        for cls, name, raw, own in reversed(self._patched):
+            if own:
+                setattr(cls, name, raw)
+            else:
+                delattr(cls, name)
+        self._patched = []
+        sqlite3.connect = self._connect
+        _active = None
+
+    def _add(self, prim, elapsed):
+        if len(self._stack) != 0:
+            self._count(self._stack[-1][1], prim, elapsed)
+            return
+        with self._lock:
+            self._count(self._outside(), prim, elapsed)
+
+    @staticmethod
+    def _count(stats, prim, elapsed):
+        op = stats["ops"].setdefault(prim, {"count": 0, "time": 0.0})
+        op["count"] += 1
+        op["time"] += elapsed
+
+    def _outside(self):
+        return self.algorithms.setdefault(OUTSIDE, _new_stats())
+
+    def _close(self, name, stats):
+        with self._lock:
+            if self.per_call:
+                self.calls += [(name, stats)]
+            total = self.algorithms.setdefault(name, _new_stats())
+            total["calls"] += stats["calls"]
+            total["time"] += stats["time"]
+            for prim, op in stats["ops"].items():
+                total_op = total["ops"].setdefault(prim, {"count": 0, "time": 0.0})
+                total_op["count"] += op["count"]
+                total_op["time"] += op["time"]
+
+    def reset(self):
+        """Discard everything recorded so far."""
+        self.algorithms = {}
+        self.calls = []
+
+    def to_dict(self):
+        """Recorded statistics as a JSON-serializable dict."""
+        out = {"algorithms": self.algorithms}
+        if self.per_call:
+            out["calls"] = [{"algorithm": name, **stats} for name, stats in self.calls]
+        return out
+
+    def to_json(self, **kwargs):
+        """Recorded statistics as a JSON string (keyword arguments go to `json.dumps`)."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def print_summary(self):
+        """Print a per-algorithm breakdown of primitive counts and times (averaged per call)."""
+        for name, stats in self.algorithms.items():
+            calls = max(stats["calls"], 1)
+            print("{} ({} calls, {} s/call)".format(name, stats["calls"], stats["time"]/calls))
+            for prim, op in sorted(stats["ops"].items()):
+                print("    {:<12}\t{}\t{} s".format(prim, op["count"]/calls, op["time"]/calls))
+
+def enable(per_call=False):
+    """Start a global `Recorder` and return it.
+
+    Parameters
+    ----------
+    per_call : bool (optional)
+        keep a breakdown of every algorithm call
+    """
+    rec = Recorder(per_call=per_call)
+    rec.start()
+    return rec
+
+def disable():
+    """Stop the global recorder (if any) and return it."""
+    rec = _active
+    if rec is not None:
+        rec.stop()
+    return rec
+
+def get():
+    """The active recorder, or `None` if instrumentation is disabled."""
+    return _active
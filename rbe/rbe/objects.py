@@ -4,10 +4,13 @@
 """
 
 from math import ceil,sqrt,log2
-from petrelic.multiplicative.pairing import G1,G2,GT,G1Element,G2Element
+from collections.abc import Sequence
+from petrelic.multiplicative.pairing import G1,G2,GT,G1Element,G2Element,GTElement
 from petrelic.bn import Bn
 from rbe import utils
+from rbe import torus
 import sqlite3
+import struct
 
 class Ciphertext:
     """RBE ciphertext
@@ -21,6 +24,10 @@ class Ciphertext:
     ct1, ct3 : elements of GT
         second and fourth elements of the ciphertext tuple
     """
+    # flags, then the byte length of each element
+    HEADER = struct.Struct("<BHHHH")
+    COMPRESSED = 1
+
     def __init__(self,ct0,ct1,ct2,ct3):
         """Construct ciphertext object from tuple of elements."""
         self.ct0 = ct0
@@ -28,14 +35,106 @@ class Ciphertext:
         self.ct2 = ct2
         self.ct3 = ct3
 
-    def get_size(self):
+    def to_binary(self,compress=False):
+        """Serialize the ciphertext.
+
+        Parameters
+        ----------
+        compress : bool (optional)
+            encode `ct1` and `ct3` in compressed form (half the size, see torus.py);
+            ignored if the group backend does not support it
+
+        Returns
+        -------
+        bytes
+        """
+        flags = self.COMPRESSED if compress and torus.available() else 0
+        encode_gt = torus.compress if flags & self.COMPRESSED else GTElement.to_binary
+        parts = [G1Element.to_binary(self.ct0), encode_gt(self.ct1), G2Element.to_binary(self.ct2), encode_gt(self.ct3)]
+        return self.HEADER.pack(flags, *[len(b) for b in parts]) + b"".join(parts)
+
+    @classmethod
+    def from_binary(cls,buf):
+        """Deserialize a ciphertext written by `to_binary` (compressed or not)."""
+        if len(buf) < cls.HEADER.size:
+            raise ValueError("truncated ciphertext")
+        flags, *lengths = cls.HEADER.unpack(buf[:cls.HEADER.size])
+        if len(buf) != cls.HEADER.size + sum(lengths):
+            raise ValueError("ciphertext has {} bytes, expected {}".format(len(buf), cls.HEADER.size + sum(lengths)))
+        decode_gt = torus.decompress if flags & cls.COMPRESSED else GTElement.from_binary
+        parts = []
+        pos = cls.HEADER.size
+        for length in lengths:
+            parts += [bytes(buf[pos:pos+length])]
+            pos = pos + length
+        return cls(G1Element.from_binary(parts[0]), decode_gt(parts[1]), G2Element.from_binary(parts[2]), decode_gt(parts[3]))
+
+    def get_size(self,compress=False):
         """Calculate the size (in bytes) of the ciphertext."""
-        ct_size = 0
-        ct_size = ct_size + len(self.group.serialize(self.ct0))
-        ct_size = ct_size + len(self.group.serialize(self.ct1))
-        ct_size = ct_size + len(self.group.serialize(self.ct2))
-        ct_size = ct_size + len(self.group.serialize(self.ct3))
-        return ct_size
+        return len(self.to_binary(compress))
+
+class LazyUpdates(Sequence):
+    """Updating information (list of G1 decommitments) that is deserialized on demand.
+
+    Elements are kept in serialized form and decoded with `G1Element.from_binary`
+    the first time they are accessed; decoded elements are cached. Missing or
+    empty entries decode to the neutral element of G1.
+
+    Parameters
+    ----------
+    raw : array of bytes (or `None`)
+        serialized elements, in update order
+    skip : range (optional)
+        positions of updates that are no longer stored (compacted, see
+        compact.py); they are left out when iterating, so `dec` does not try them,
+        while the other updates keep their positions
+
+    Attributes
+    ----------
+    decoded : int
+        number of elements deserialized so far
+    """
+    def __init__(self,raw,skip=range(0)):
+        """Wrap a list of serialized elements without decoding them."""
+        self.raw = raw
+        self.skip = skip
+        self.elements = [None] * len(raw)
+        self.decoded = 0
+
+    def __len__(self):
+        return len(self.raw)
+
+    def positions(self):
+        """Positions of the stored updates (all but `skip`)."""
+        return [i for i in range(len(self.raw)) if i not in self.skip]
+
+    def __iter__(self):
+        for i in self.positions():
+            yield self[i]
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i = i + len(self)
+        el = self.elements[i]
+        if el is None:
+            el = self._decode(self.raw[i])
+            self.elements[i] = el
+            self.decoded = self.decoded + 1
+        return el
+
+    @staticmethod
+    def _decode(val):
+        if val is None or len(val) == 0:
+            return G1.neutral_element()
+        val = bytes(val)
+        if not any(val):
+            return G1.neutral_element()
+        try:
+            return G1Element.from_binary(val)
+        except:
+            return G1.neutral_element()
 
 class CRS:
     """Common Reference String over the BLS12-381 curve (asymmetric pairing).
@@ -53,13 +152,18 @@ class CRS:
     g2 : element of G2
         generator of G2
     N : int
-        maximum number of users
+        maximum number of users (current capacity, if `elastic`)
     n : int
-        block size, `sqrt(N)`
+        block size, `sqrt(N)` (of the initial `N`, if `elastic`) unless chosen at setup
     log_n : int
         `log2(n)`
+    chunks : int
+        number of commitments (chunks) a block can be split into in the efficient
+        variant, `floor(log2(n))+1` (`log_n`, or `log_n+1` if `n` is a power of two)
     B: int
         number of blocks (`N/n`)
+    elastic : bool
+        whether `N` grows when ids beyond it register (see `grow`)
     h_parameters_g1 : array of elements of G1
         `h[i] = g1**{z**i}`, where i ranges from 1 to 2`n`, inclusive
     h_parameters_g2 : array of elements of G2
@@ -67,7 +171,7 @@ class CRS:
     """
 
 
-    def __init__(self,N=None,g1=None,g2=None,z=None):
+    def __init__(self,N=None,g1=None,g2=None,z=None,elastic=False,n=None):
         """
         Generate a CRS over BLS12-381 using the given parameters.
         
@@ -83,6 +187,11 @@ class CRS:
             generator of G2
         z : element of ZR, optional
             CRS trapdoor in ZR (if `None`, `z` is chosen at random)
+        elastic : bool, optional
+            let the capacity grow beyond `N` (the block size stays fixed)
+        n : int, optional
+            block size (default `ceil(sqrt(N))`); larger blocks make gen and reg
+            more expensive and enc and upd cheaper relative to their number
 
         See Also
         --------
@@ -96,10 +205,14 @@ class CRS:
             except Exception as e:
                 print("Error loading CRS from file: ",e)
         else:
+            if n is not None and n < 1:
+                raise ValueError("block size must be positive, got {}".format(n))
             self.N = N
-            self.n = ceil(sqrt(N))
+            self.n = ceil(sqrt(N)) if n is None else n
             self.log_n = ceil(log2(self.n))
+            self.chunks = self.n.bit_length()
             self.B = ceil(N/self.n)
+            self.elastic = elastic
             self.g1 = G1.generator() if g1 is None else g1
             self.g2 = G2.generator() if g2 is None else g2
 
@@ -126,6 +239,9 @@ class CRS:
         if not keys_db_exists:
             cur.execute('''CREATE TABLE crs(pk BLOB)''')
         cur.execute("INSERT INTO crs(rowid, pk) VALUES(?,?)",(0,self.N))
+        # block size (no longer sqrt(N) once an elastic CRS has grown) and mode
+        cur.execute("INSERT INTO crs(rowid, pk) VALUES(?,?)",(-1,self.n))
+        cur.execute("INSERT INTO crs(rowid, pk) VALUES(?,?)",(-2,int(self.elastic)))
         cur.execute("INSERT INTO crs(rowid, pk) VALUES(?,?)",(1,self.g1.to_binary()))
         cur.execute("INSERT INTO crs(rowid, pk) VALUES(?,?)",(2,self.g2.to_binary()))
         for i in range(2*self.n):
@@ -147,8 +263,14 @@ class CRS:
 
         cur.execute("SELECT * FROM crs WHERE rowid=?", (0,))
         self.N = cur.fetchall()[0][0]
-        self.n = int(ceil(sqrt(self.N)))
+        cur.execute("SELECT * FROM crs WHERE rowid=?", (-1,))
+        fetched = cur.fetchall()
+        self.n = fetched[0][0] if len(fetched) != 0 else int(ceil(sqrt(self.N)))
+        cur.execute("SELECT * FROM crs WHERE rowid=?", (-2,))
+        fetched = cur.fetchall()
+        self.elastic = bool(fetched[0][0]) if len(fetched) != 0 else False
         self.log_n = int(ceil(log2(self.n)))
+        self.chunks = self.n.bit_length()
         self.B = ceil(self.N/self.n)
         cur.execute("SELECT * FROM crs WHERE rowid=?", (1,))
         self.g1 = G1Element.from_binary(cur.fetchall()[0][0])
@@ -168,4 +290,24 @@ class CRS:
         self.h_parameters_g1 = h1
         self.h_parameters_g2 = h2
         con.commit()
+        con.close()
+
+    def grow(self, N):
+        """Raise the capacity to (at least) `N` users by adding blocks of the same size.
+
+        The h_i only depend on the block size, and the databases are addressed
+        without reference to `N`, so nothing is recomputed or migrated.
+
+        Parameters
+        ----------
+        N : int
+            new maximum number of users
+        """
+        if N <= self.N:
+            return
+        self.N = N
+        self.B = ceil(N/self.n)
+        con = sqlite3.connect("crs.db")
+        con.cursor().execute("UPDATE crs SET pk = ? WHERE rowid = ?",(self.N,0))
+        con.commit()
         con.close()
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""Process-pool execution of `enc` and `dec`.
+
+In the efficient variant `enc` encrypts to up to log n commitments, and `dec`
+tries every (ciphertext, update) combination until one opens; both run on one
+core. An `Executor` spreads this work over worker processes: `enc` sends each
+commitment to a worker, and `dec` splits the combinations, in the order `dec`
+tries them, into chunks checked in parallel. Workers stop as soon as one of
+them finds the matching combination, and only that one is used to decrypt.
+
+Elements cross process boundaries in serialized form (updates from `upd` are
+passed on as stored, without being deserialized by the caller). Each worker
+loads the CRS from crs.db (in the current directory) once, when it starts.
+
+Examples
+--------
+>>> from rbe.parallel import Executor
+>>> with Executor(4) as ex:
+...     cts = algos.enc(crs, id, m, efficient=True, executor=ex)
+...     m = algos.dec(crs, id, sk, algos.upd(crs, id, efficient=True), cts, executor=ex)
+
+Notes
+-----
+An `Executor` serves one caller at a time. Passing work to other processes
+costs about a millisecond, so it pays off when a call needs more than a few
+pairings (many commitments, or many updates to try).
+"""
+
+import multiprocessing
+import os
+from math import ceil
+from operator import mod
+from petrelic.multiplicative.pairing import G1Element,G2Element,GTElement,G2,GT
+from rbe.objects import CRS, Ciphertext, LazyUpdates
+
+# per-worker state (see `_init`)
+_worker = {}
+
+def _init(found):
+    _worker["crs"] = CRS()
+    _worker["found"] = found
+
+def _encrypt(args):
+    """Encrypt to one commitment (as `enc` does); returns the serialized ciphertext."""
+    com_ser, id_index, m_ser = args
+    crs = _worker["crs"]
+    h = crs.h_parameters_g2[crs.n-1-id_index]
+    com = LazyUpdates._decode(com_ser)
+    m = GTElement.from_binary(m_ser)
+    r = G2.order().random()
+    ct1 = com.pair(h)**r
+    ct2 = crs.g2**r
+    ct3 = crs.h_parameters_g1[id_index].pair(h)**r * m
+    return G1Element.to_binary(com), GTElement.to_binary(ct1), G2Element.to_binary(ct2), GTElement.to_binary(ct3)
+
+def _check(args):
+    """First combination of a chunk whose update opens the ciphertext's commitment (as `dec` checks)."""
+    token, id_index, pk_pair_ser, candidates = args
+    crs = _worker["crs"]
+    found = _worker["found"]
+    h = crs.h_parameters_g2[crs.n-1-id_index]
+    pk_pair = GTElement.from_binary(pk_pair_ser)
+    ct0_pairs = {}
+    for i, j, ct0_ser, u_ser in candidates:
+        # another worker already found it
+        if found.value == token:
+            return None
+        if i not in ct0_pairs:
+            ct0_pairs[i] = G1Element.from_binary(ct0_ser).pair(h)
+        if ct0_pairs[i] == LazyUpdates._decode(u_ser).pair(crs.g2) * pk_pair:
+            found.value = token
+            return i, j
+    return None
+
+class Executor:
+    """Pool of worker processes for `enc` and `dec`.
+
+    Parameters
+    ----------
+    processes : int (optional)
+        worker processes (default: one per core)
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes if processes is not None else os.cpu_count()
+        # token of the last `decrypt` whose match was found
+        self._found = multiprocessing.Value("q", -1)
+        self._token = 0
+        self._pool = multiprocessing.Pool(self.processes, initializer=_init, initargs=(self._found,))
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def encrypt(self, crs, id, coms, m):
+        """Encrypt `m` to `id` under each of the (serialized) commitments `coms` (see `algos.enc`)."""
+        id_index = mod(id,crs.n)
+        m_ser = GTElement.to_binary(m)
+        cts = []
+        for ct0, ct1, ct2, ct3 in self._pool.map(_encrypt, [(com, id_index, m_ser) for com in coms], chunksize=1):
+            cts += [Ciphertext(G1Element.from_binary(ct0), GTElement.from_binary(ct1), G2Element.from_binary(ct2), GTElement.from_binary(ct3))]
+        return cts
+
+    def decrypt(self, crs, id, sk, upds, cts, upd_idx=-1):
+        """Decrypt `cts` (see `algos.dec`), checking the combinations in parallel."""
+        id_index = mod(id,crs.n)
+        h = crs.h_parameters_g2[crs.n-1-id_index]
+        if isinstance(upds, LazyUpdates):
+            positions = upds.positions() if upd_idx < 0 else [upd_idx]
+            # as stored: workers deserialize them
+            raw = [bytes(upds.raw[p]) if upds.raw[p] is not None else None for p in positions]
+        else:
+            positions = range(len(upds)) if upd_idx < 0 else [upd_idx]
+            raw = [G1Element.to_binary(upds[p]) for p in positions]
+
+        # in the order `dec` tries them
+        candidates = []
+        for i, ct in enumerate(cts):
+            ct0_ser = G1Element.to_binary(ct.ct0)
+            candidates += [(i, j, ct0_ser, u) for j, u in zip(positions, raw)]
+
+        pk_pair = (crs.h_parameters_g1[id_index]**sk).pair(h)
+        self._token = self._token + 1
+        # a few chunks per worker, so that the match is found (and the rest skipped) early
+        size = max(1, ceil(len(candidates)/(2*self.processes)))
+        tasks = [(self._token, id_index, GTElement.to_binary(pk_pair), candidates[k:k+size]) for k in range(0, len(candidates), size)]
+
+        match = None
+        for result in self._pool.imap_unordered(_check, tasks):
+            if result is not None:
+                match = result
+                break
+        if match is None:
+            print("Decryption cannot be done, you need to get update first.")
+            return 0
+
+        i, j = match
+        ct = cts[i]
+        u = upds[j]
+        return ct.ct3/((u.pair(ct.ct2)**(-1)*(ct.ct1))**(sk.mod_pow(-1,GT.order())))
@@ -0,0 +1,632 @@
+"""Blocks partitioned across several curator processes (shards).
+
+Blocks are independent in `reg`, `merge`, `enc` and `upd`; only the CRS is
+shared. A shard is a curator process serving the blocks it owns from the
+databases in its own directory (on any host), with a copy of the common
+crs.db. A `Router` maps id -> block (`id // n`) -> shard with a shard map (a
+json file) and forwards each call to the shard that owns the block:
+
+    {"n": 100,
+     "shards": {"a": ["10.0.0.1", 7000], "b": ["10.0.0.2", 7000]},
+     "placement": ["a", "b"],
+     "blocks": {"17": "b"}}
+
+Block `k` belongs to `blocks[k]` if listed, else to `placement[k % len(placement)]`.
+The placement list is fixed once registrations started; shards added later
+(`add`) only receive blocks that are moved to them.
+
+Moving blocks (`Router.move`, or `rebalance` to even out registered parties)
+copies their rows, in global rowids, from one shard's databases to the other's,
+then updates the map and deletes them at the source. The source stops serving
+the blocks as soon as it exports them and answers "moved" from then on (it
+remembers this in released.json), so a router with an old map reloads it and
+retries; registrations into a block wait (are refused) only while it moves.
+
+Requests and replies are pickled over `multiprocessing.connection`; group
+elements travel serialized (registrations in the packed format of wire.py,
+ciphertexts with `Ciphertext.to_binary`). Unpickling a request may run arbitrary
+code, so a shard serves on a non-loopback address only with an authentication
+key (`authkey`, or the RBE_SHARD_KEY environment variable).
+
+Examples
+--------
+Three local shards and a router:
+
+>>> from rbe import shard
+>>> shard.create(["s0", "s1", "s2"], N=10**6, efficient=True)
+>>> servers = [shard.spawn(d) for d in ["s0", "s1", "s2"]]
+>>> shard.write_map("shards.json", crs.n, {"s{}".format(i): address for i, (process, address) in enumerate(servers)})
+>>> router = shard.Router("shards.json")
+>>> router.reg(id, pk, xi)
+>>> m = algos.dec(crs, id, sk, router.upd(id), router.enc(id, m))
+>>> router.rebalance()
+
+From the command line:
+
+    python3 -m rbe.shard create DIR [DIR ...] -N N [-n n] [-e]
+    python3 -m rbe.shard prepare DIR --crs crs.db [-e]          # storage for a shard added later
+    python3 -m rbe.shard serve DIR [--host H] [--port P]
+    python3 -m rbe.shard map shards.json NAME=HOST:PORT [...] -n n
+    python3 -m rbe.shard add shards.json NAME=HOST:PORT
+    python3 -m rbe.shard status shards.json
+    python3 -m rbe.shard move shards.json --to NAME BLOCK [BLOCK ...]
+    python3 -m rbe.shard rebalance shards.json [--dry-run]
+"""
+
+import argparse
+import ipaddress
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+from multiprocessing.connection import Client, Listener
+from petrelic.multiplicative.pairing import GTElement
+from rbe import algos
+from rbe import bitmap
+from rbe import notify
+from rbe import wire
+from rbe.objects import CRS, Ciphertext, LazyUpdates
+
+RELEASED = "released.json"
+# attached to pp.db, as in writer.py
+ATTACHED = {"aux_db": "aux.db", "aux_count_db": "aux_count.db", "keys_db": "keys.db"}
+
+def _authkey(authkey):
+    if authkey is None:
+        authkey = os.environ.get("RBE_SHARD_KEY")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+def _loopback(host):
+    """Whether `host` (a name or an address) is only reachable from this machine."""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+### storage
+
+def prepare(directory, crs_path, efficient=False):
+    """Create the (empty) storage of a shard in `directory`, for the CRS in `crs_path`."""
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, "crs.db")):
+        raise FileExistsError("{} already holds a crs.db".format(directory))
+    shutil.copyfile(crs_path, os.path.join(directory, "crs.db"))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        algos.init_storage(CRS(), efficient)
+    finally:
+        os.chdir(cwd)
+
+def create(directories, N, efficient=False, n=None, elastic=False):
+    """Set up one CRS and the storage of a shard in each of `directories`; returns the CRS."""
+    cwd = os.getcwd()
+    os.makedirs(directories[0], exist_ok=True)
+    if os.path.exists(os.path.join(directories[0], "crs.db")):
+        raise FileExistsError("{} already holds a crs.db".format(directories[0]))
+    os.chdir(directories[0])
+    try:
+        crs = algos.setup(N, efficient=efficient, elastic=elastic, n=n)
+    finally:
+        os.chdir(cwd)
+    for directory in directories[1:]:
+        prepare(directory, os.path.join(directories[0], "crs.db"), efficient)
+    return crs
+
+def block_tables(crs, efficient, k):
+    """Where block `k` is stored: (database, table, first rowid, last rowid) of each of its row ranges.
+
+    The ranges of key_pairs are ranges of `id` (its rowids are arbitrary).
+    """
+    n = crs.n
+    ids = (k*n, (k+1)*n-1)
+    out = [("aux_db", "block_version", k, k), ("keys_db", "key_pairs", *ids)]
+    if efficient:
+        for i in range(crs.chunks):
+            out += [("main", "pp_{}".format(i), k, k), ("aux_db", "aux_{}".format(i), *ids), ("aux_db", "aux_reg_count_{}".format(i), *ids)]
+        out += [
+            ("main", "pp_block_count", k, k),
+            # one row per commitment, at k*n + index
+            ("main", "pp_com_count", *ids),
+            ("aux_db", "L", algos.l_rowid(crs, ids[0], 0), algos.l_rowid(crs, ids[1]+1, 0)-1),
+            ("aux_db", "L_upd_num", *ids),
+        ]
+    else:
+        out += [("main", "pp", k, k), ("aux_db", "aux", k*n*n, (k+1)*n*n-1), ("aux_count_db", "auxCount", k, k)]
+    return out
+
+def _key(table):
+    return "id" if table == "key_pairs" else "rowid"
+
+def _connect():
+    con = sqlite3.connect("pp.db", isolation_level=None, check_same_thread=False)
+    keys_db_exists = os.path.exists(ATTACHED["keys_db"])
+    for name, db in ATTACHED.items():
+        con.execute("ATTACH DATABASE ? AS {}".format(name), (db,))
+    if not keys_db_exists:
+        # as in `utils.write_pk_to_db`
+        con.execute("PRAGMA keys_db.journal_mode=WAL")
+    con.execute("CREATE TABLE IF NOT EXISTS keys_db.key_pairs(id INTEGER, pk BLOB)")
+    return con
+
+def _is_efficient():
+    con = sqlite3.connect("pp.db")
+    found = con.execute("SELECT count(*) FROM sqlite_master WHERE name = 'pp_block_count'").fetchone()[0]
+    con.close()
+    return found == 1
+
+### shard (server side)
+
+class Moved(Exception):
+    """The block of a request has been released (moved to another shard)."""
+
+    def __init__(self, block):
+        super().__init__("block {} moved".format(block))
+        self.block = block
+
+class Shard:
+    """The blocks stored in the current directory, served to routers.
+
+    Parameters
+    ----------
+    crs : CRS (optional)
+        common reference string (default: loaded from crs.db)
+    """
+
+    def __init__(self, crs=None):
+        self.crs = CRS() if crs is None else crs
+        self.efficient = _is_efficient()
+        # registrations and block moves
+        self._lock = threading.Lock()
+        # the set of released blocks (changed with both locks held)
+        self._released_lock = threading.Lock()
+        self.released = set()
+        if os.path.exists(RELEASED):
+            with open(RELEASED) as f:
+                self.released = set(json.load(f))
+
+    def _is_released(self, k):
+        with self._released_lock:
+            return k in self.released
+
+    def _release(self, blocks, released=True):
+        """Mark `blocks` as released (or served again); the caller holds `_lock`."""
+        with self._released_lock:
+            if released:
+                self.released.update(blocks)
+            else:
+                self.released.difference_update(blocks)
+            with open(RELEASED+".tmp", "w") as f:
+                json.dump(sorted(self.released), f)
+            os.replace(RELEASED+".tmp", RELEASED)
+
+    def handle(self, request):
+        """Reply to one request: ("ok", value), ("moved", block) or ("error", message)."""
+        op, args = request[0], request[1:]
+        k = None
+        try:
+            k = self._block(op, args)
+            if k is not None and self._is_released(k):
+                return ("moved", k)
+            value = getattr(self, "_" + op)(*args)
+            if op != "reg" and k is not None and self._is_released(k):
+                # released while it was read: the rows read may be gone already
+                return ("moved", k)
+            return ("ok", value)
+        except Moved as e:
+            return ("moved", e.block)
+        except Exception as e:
+            if op != "reg" and k is not None and self._is_released(k):
+                return ("moved", k)
+            return ("error", str(e))
+
+    def _block(self, op, args):
+        """Block a request is about (`None` for shard-wide requests)."""
+        if op == "reg":
+            return wire.parse(args[0]).id // self.crs.n
+        if op in ("enc", "upd"):
+            return args[0] // self.crs.n
+        if op == "version":
+            return args[0]
+        return None
+
+    def _info(self):
+        with bitmap.IdBitmap(self.crs.n) as registered:
+            fills = {k: registered.block_fill(k) for k in range(registered.blocks)}
+        return {"N": self.crs.N, "n": self.crs.n, "efficient": self.efficient,
+            "blocks": {k: fill for k, fill in fills.items() if fill != 0 and k not in self.released},
+            "released": sorted(self.released)}
+
+    def _reg(self, data):
+        request = wire.parse(data, n=self.crs.n)
+        with self._lock:
+            # checked again, now that no block can be exported meanwhile
+            if self._is_released(request.id // self.crs.n):
+                raise Moved(request.id // self.crs.n)
+            algos.reg(self.crs, request.id, request.pk, request.helping_values, efficient=self.efficient)
+
+    def _enc(self, id, m_ser, compress=False):
+        cts = algos.enc(self.crs, id, GTElement.from_binary(m_ser), efficient=self.efficient)
+        return [ct.to_binary(compress) for ct in cts]
+
+    def _upd(self, id):
+        u = algos.upd(self.crs, id, efficient=self.efficient)
+        return [bytes(raw) if raw is not None else None for raw in u.raw], (u.skip.start, u.skip.stop)
+
+    def _version(self, k):
+        return notify.version(k)
+
+    def _export(self, blocks):
+        """Stop serving `blocks` and return their rows."""
+        with self._lock:
+            self._release(blocks)
+            con = _connect()
+            con.execute("BEGIN")
+            rows = []
+            for k in blocks:
+                for db, table, lo, hi in block_tables(self.crs, self.efficient, k):
+                    if table == "key_pairs":
+                        cur = con.execute("SELECT id, pk FROM keys_db.key_pairs WHERE id BETWEEN ? AND ?", (lo, hi))
+                    else:
+                        cur = con.execute("SELECT rowid, * FROM {}.{} WHERE rowid BETWEEN ? AND ?".format(db, table), (lo, hi))
+                    rows += [(db, table, [d[0] for d in cur.description], cur.fetchall())]
+            con.execute("COMMIT")
+            con.close()
+        return rows
+
+    def _acquire(self, blocks):
+        """Serve `blocks` again (e.g. their move failed)."""
+        with self._lock:
+            self._release(blocks, False)
+
+    def _import(self, blocks, rows):
+        """Store the rows of `blocks` (replacing anything held for them) and serve them."""
+        with self._lock:
+            con = _connect()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(con, blocks)
+                for db, table, columns, values in rows:
+                    con.executemany("INSERT INTO {}.{} ({}) VALUES ({})".format(db, table, ", ".join(columns), ", ".join("?"*len(columns))), values)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            finally:
+                con.close()
+            with bitmap.IdBitmap(self.crs.n) as registered:
+                for db, table, columns, values in rows:
+                    if table == "key_pairs":
+                        for id, pk in values:
+                            registered.mark(id)
+            self._release(blocks, False)
+        return sum(len(values) for db, table, columns, values in rows)
+
+    def _delete(self, con, blocks):
+        for k in blocks:
+            for db, table, lo, hi in block_tables(self.crs, self.efficient, k):
+                con.execute("DELETE FROM {}.{} WHERE {} BETWEEN ? AND ?".format(db, table, _key(table)), (lo, hi))
+
+    def _drop(self, blocks):
+        """Delete the rows of `blocks` (moved away, so they stay released)."""
+        with self._lock:
+            con = _connect()
+            con.execute("BEGIN IMMEDIATE")
+            self._delete(con, blocks)
+            con.execute("COMMIT")
+            con.close()
+            with bitmap.IdBitmap(self.crs.n) as registered:
+                for k in blocks:
+                    for id in list(registered.registered_ids(k)):
+                        registered.clear(id)
+
+def _session(shard, conn, stop):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            if request[0] == "shutdown":
+                conn.send(("ok", None))
+                stop()
+                return
+            conn.send(shard.handle(request))
+
+def serve(directory, address=("127.0.0.1", 0), authkey=None, ready=None):
+    """Serve the shard in `directory` at `address` until a "shutdown" request.
+
+    `ready` (a `Connection`, optional) is sent the address actually bound (e.g.
+    when the port is 0).
+
+    Raises
+    ------
+    ValueError
+        if `address` is not a loopback address and there is no authentication
+        key (requests are unpickled, i.e. may run arbitrary code)
+    """
+    authkey = _authkey(authkey)
+    if authkey is None and not _loopback(address[0]):
+        raise ValueError("refusing to serve on {} without an authentication key (authkey or RBE_SHARD_KEY)".format(address[0]))
+    os.chdir(directory)
+    shard = Shard()
+    listener = Listener(tuple(address), authkey=authkey)
+    stopped = threading.Event()
+
+    def stop():
+        stopped.set()
+        # wakes up `accept`
+        Client(listener.address, authkey=authkey).close()
+
+    if ready is not None:
+        ready.send(listener.address)
+    with listener:
+        while True:
+            conn = listener.accept()
+            if stopped.is_set():
+                conn.close()
+                return
+            threading.Thread(target=_session, args=(shard, conn, stop), daemon=True).start()
+
+def spawn(directory, address=("127.0.0.1", 0), authkey=None):
+    """Start a shard process for `directory` (e.g. for local testing).
+
+    Returns
+    -------
+    process : multiprocessing.Process
+    address : (str, int)
+        where it listens
+    """
+    receive, send = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=serve, args=(os.path.abspath(directory), address, authkey, send), daemon=True)
+    process.start()
+    return process, receive.recv()
+
+### router (client side)
+
+def write_map(path, n, shards, placement=None, blocks=None):
+    """Write a shard map.
+
+    Parameters
+    ----------
+    path : str
+        json file
+    n : int
+        block size
+    shards : dict
+        shard name -> (host, port)
+    placement : array of str (optional)
+        shards of the blocks not listed in `blocks`, round robin (default: all, in order)
+    blocks : dict (optional)
+        block -> shard name
+    """
+    shard_map = {"n": n, "shards": {name: list(address) for name, address in shards.items()},
+        "placement": list(shards) if placement is None else placement,
+        "blocks": {str(k): name for k, name in (blocks or {}).items()}}
+    with open(path+".tmp", "w") as f:
+        json.dump(shard_map, f, indent=2)
+    os.replace(path+".tmp", path)
+
+class Router:
+    """Routes calls to the shard that owns the block of each id.
+
+    Parameters
+    ----------
+    path : str
+        shard map (json file, see `write_map`)
+    authkey : bytes or str (optional)
+        authentication key of the shards (default: RBE_SHARD_KEY, if set)
+
+    Notes
+    -----
+    A router keeps one connection per shard and is meant for one thread.
+    """
+
+    def __init__(self, path, authkey=None):
+        self.path = path
+        self.authkey = _authkey(authkey)
+        self._conns = {}
+        self.reload()
+
+    def reload(self):
+        """Read the shard map again (another router may have moved blocks)."""
+        with open(self.path) as f:
+            shard_map = json.load(f)
+        self.n = shard_map["n"]
+        self.shards = {name: tuple(address) for name, address in shard_map["shards"].items()}
+        self.placement = shard_map["placement"]
+        self.blocks = {int(k): name for k, name in shard_map["blocks"].items()}
+        for name in list(self._conns):
+            if name not in self.shards:
+                self._conns.pop(name).close()
+
+    def _save(self):
+        write_map(self.path, self.n, self.shards, self.placement, self.blocks)
+
+    def shard_of(self, k):
+        """Name of the shard that owns block `k`."""
+        return self.blocks.get(k, self.placement[k % len(self.placement)])
+
+    def call(self, name, *request):
+        """Send a request to shard `name`; returns its reply (a ("ok"|"moved"|"error", value) pair)."""
+        if name not in self._conns:
+            self._conns[name] = Client(self.shards[name], authkey=self.authkey)
+        conn = self._conns[name]
+        conn.send(request)
+        return conn.recv()
+
+    def _value(self, reply):
+        status, value = reply
+        if status == "error":
+            raise ValueError(value)
+        return value
+
+    def _routed(self, k, *request):
+        reply = self.call(self.shard_of(k), *request)
+        if reply[0] == "moved":
+            # the map changed since it was read
+            self.reload()
+            reply = self.call(self.shard_of(k), *request)
+        if reply[0] == "moved":
+            raise ValueError("block {} is being moved".format(reply[1]))
+        return self._value(reply)
+
+    def reg(self, id, pk, helping_values):
+        """Register `id` (see `algos.reg`) at its shard; raises `ValueError` if rejected."""
+        return self._routed(id // self.n, "reg", wire.encode(id, pk, helping_values))
+
+    def enc(self, id, m, compress=False):
+        """Encrypt `m` to `id` (see `algos.enc`) at its shard; returns the ciphertexts."""
+        cts = self._routed(id // self.n, "enc", id, GTElement.to_binary(m), compress)
+        return [Ciphertext.from_binary(ct) for ct in cts]
+
+    def upd(self, id):
+        """Updating information of `id` (see `algos.upd`) from its shard."""
+        raw, (start, stop) = self._routed(id // self.n, "upd", id)
+        return LazyUpdates(raw, skip=range(start, stop))
+
+    def version(self, k):
+        """Version of block `k` (see notify.py)."""
+        return self._routed(k, "version", k)
+
+    def info(self):
+        """Shard name -> its parameters and registered parties per block."""
+        return {name: self._value(self.call(name, "info")) for name in self.shards}
+
+    def add(self, name, address):
+        """Add a shard (it only receives blocks moved to it)."""
+        if name in self.shards:
+            raise ValueError("shard {} exists".format(name))
+        self.shards[name] = tuple(address)
+        self._save()
+
+    def move(self, blocks, to):
+        """Move `blocks` (from their shards) to shard `to`; returns the number of rows moved."""
+        if to not in self.shards:
+            raise ValueError("unknown shard {}".format(to))
+        by_source = {}
+        for k in blocks:
+            if self.shard_of(k) != to:
+                by_source.setdefault(self.shard_of(k), []).append(k)
+        moved = 0
+        for source, ks in by_source.items():
+            rows = self._value(self.call(source, "export", ks))
+            try:
+                moved = moved + self._value(self.call(to, "import", ks, rows))
+            except Exception:
+                self.call(source, "acquire", ks)
+                raise
+            for k in ks:
+                self.blocks[k] = to
+            self._save()
+            self._value(self.call(source, "drop", ks))
+        return moved
+
+    def plan(self):
+        """Moves that even out the registered parties per shard: list of (block, from, to)."""
+        info = self.info()
+        load = {name: sum(res["blocks"].values()) for name, res in info.items()}
+        owned = {name: dict(res["blocks"]) for name, res in info.items()}
+        moves = []
+        while True:
+            high = max(load, key=load.get)
+            low = min(load, key=load.get)
+            gap = load[high] - load[low]
+            # the block that brings the two closest to each other
+            candidates = [k for k, fill in owned[high].items() if 0 < fill < gap]
+            if len(candidates) == 0:
+                return moves
+            k = min(candidates, key=lambda k: abs(gap - 2*owned[high][k]))
+            fill = owned[high].pop(k)
+            owned[low][k] = fill
+            load[high] = load[high] - fill
+            load[low] = load[low] + fill
+            moves += [(k, high, low)]
+
+    def rebalance(self):
+        """Carry out `plan`; returns the moves made."""
+        moves = self.plan()
+        for k, source, to in moves:
+            self.move([k], to)
+        return moves
+
+    def shutdown(self, name):
+        """Stop shard `name`."""
+        self.call(name, "shutdown")
+        self._conns.pop(name).close()
+
+    def close(self):
+        for conn in self._conns.values():
+            conn.close()
+        self._conns = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _address(spec):
+    """NAME=HOST:PORT -> (NAME, (HOST, PORT))"""
+    name, address = spec.split("=", 1)
+    host, port = address.rsplit(":", 1)
+    return name, (host, int(port))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="block-sharded curators")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('create', help='set up a CRS and the storage of several shards')
+    p.add_argument('directories', nargs='+')
+    p.add_argument('-N','--max_parties', type=int, required=True, dest='N', help='maximum number of parties')
+    p.add_argument('-n','--block-size', type=int, default=None, dest='n', help='block size (default: sqrt(N))')
+    p.add_argument('-e','--efficient', action='store_true', default=False, dest='eff', help='efficient update variant')
+    p = sub.add_parser('prepare', help='set up the storage of a shard for an existing CRS')
+    p.add_argument('directory')
+    p.add_argument('--crs', required=True, dest='crs', help='crs.db to use')
+    p.add_argument('-e','--efficient', action='store_true', default=False, dest='eff', help='efficient update variant')
+    p = sub.add_parser('serve', help='serve a shard')
+    p.add_argument('directory')
+    p.add_argument('--host', default='127.0.0.1', dest='host', help='address to bind (other than loopback only with an authentication key)')
+    p.add_argument('--port', type=int, default=7000, dest='port')
+    p.add_argument('--authkey', default=None, dest='authkey', help='authentication key (default: RBE_SHARD_KEY)')
+    p = sub.add_parser('map', help='write a shard map')
+    p.add_argument('map')
+    p.add_argument('shards', nargs='+', help='NAME=HOST:PORT')
+    p.add_argument('-n','--block-size', type=int, required=True, dest='n', help='block size of the CRS')
+    for command, text in [('add', 'add a shard to a map'), ('status', 'registered parties per shard'), ('move', 'move blocks to a shard'), ('rebalance', 'even out the registered parties per shard')]:
+        p = sub.add_parser(command, help=text)
+        p.add_argument('map')
+        p.add_argument('--authkey', default=None, dest='authkey', help='authentication key (default: RBE_SHARD_KEY)')
+        if command == 'add':
+            p.add_argument('shard', help='NAME=HOST:PORT')
+        if command == 'move':
+            p.add_argument('blocks', type=int, nargs='+')
+            p.add_argument('--to', required=True, dest='to', help='destination shard')
+        if command == 'rebalance':
+            p.add_argument('--dry-run', action='store_true', default=False, dest='dry_run', help='only print the moves')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        create(args.directories, args.N, args.eff, args.n)
+    elif args.command == 'prepare':
+        prepare(args.directory, args.crs, args.eff)
+    elif args.command == 'serve':
+        serve(args.directory, (args.host, args.port), args.authkey)
+    elif args.command == 'map':
+        write_map(args.map, args.n, dict(_address(s) for s in args.shards))
+    else:
+        with Router(args.map, args.authkey) as router:
+            if args.command == 'add':
+                router.add(*_address(args.shard))
+            elif args.command == 'status':
+                for name, res in router.info().items():
+                    print("{}\t{}:{}\t{} blocks\t{} parties".format(name, *router.shards[name], len(res["blocks"]), sum(res["blocks"].values())))
+            elif args.command == 'move':
+                print("{} rows moved".format(router.move(args.blocks, args.to)))
+            else:
+                moves = router.plan() if args.dry_run else router.rebalance()
+                for k, source, to in moves:
+                    print("block {}: {} -> {}".format(k, source, to))
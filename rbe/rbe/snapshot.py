@@ -0,0 +1,453 @@
+"""Point-in-time snapshot and restore of a whole deployment.
+
+`save` writes crs.db, pp.db, aux.db, aux_count.db, keys.db and the bitmap of
+registered ids (see bitmap.py) into one file, and `restore` recreates them from
+it, e.g. to start a warm replica or to reset a benchmark fixture.
+
+Tables are stored column by column in chunks of `CHUNK` rows, as packed arrays
+rather than sqlite records: a run of consecutive rowids is stored as its first
+rowid, integer columns as arrays of int64, and group elements (equal-length
+blobs) back to back with their length stored once. Restoring inserts the rows
+in rowid order, in bulk, with journaling and syncing off, and switches the
+databases back to their journal mode (WAL for pp, aux and aux_count) at the
+end; their auto_vacuum mode is kept as well.
+
+The snapshot is consistent: the databases are briefly locked for writing (as a
+writer would), a read snapshot of each of them is taken, and the lock is
+released before the (long) copy. Registrations, with `reg` or a
+`RegistrationWriter`, thus wait at most for that moment, and the snapshot holds
+each of them either completely or not at all: keys of registrations whose pp and
+aux are not written yet (in progress, or interrupted) are left out. The bitmap
+is rebuilt from the snapshot's keys.db rather than copied, so it agrees with it.
+
+Examples
+--------
+>>> from rbe import snapshot
+>>> snapshot.save("fixture.snap")
+>>> snapshot.restore("fixture.snap", overwrite=True)
+
+From the command line, in the directory holding the databases:
+
+    python3 -m rbe.snapshot save|restore file [-f]
+"""
+
+import argparse
+import array
+import os
+import sqlite3
+import struct
+import sys
+from math import ceil, sqrt
+from time import monotonic, sleep
+from rbe import bitmap
+
+DATABASES = ["crs.db", "pp.db", "aux.db", "aux_count.db", "keys.db"]
+MAGIC = b"RBESNAP\0"
+# version 2 added the auto_vacuum mode of each database
+VERSION = 2
+CHUNK = 65536
+
+# record types
+DATABASE = b"D"
+FILE = b"F"
+END = b"E"
+
+# column encodings
+RANGE = b"r"     # consecutive integers: first value
+INTEGERS = b"q"  # int64 array
+FIXED = b"f"     # blobs of one length: length, then the blobs back to back
+BLOBS = b"v"     # int32 array of lengths, then the blobs back to back
+MIXED = b"m"     # anything else (e.g. the crs table): a type per value, then the values one by one
+
+U32 = struct.Struct("<I")
+U64 = struct.Struct("<Q")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+
+def _write_str(f, s):
+    b = s.encode()
+    f.write(U32.pack(len(b)))
+    f.write(b)
+
+def _read(f, size):
+    b = f.read(size)
+    if len(b) != size:
+        raise ValueError("truncated snapshot")
+    return b
+
+def _read_u32(f):
+    return U32.unpack(_read(f, U32.size))[0]
+
+def _read_str(f):
+    return _read(f, _read_u32(f)).decode()
+
+def _write_array(f, a):
+    if sys.byteorder != "little":
+        a = array.array(a.typecode, a)
+        a.byteswap()
+    f.write(a.tobytes())
+
+def _read_array(f, typecode, count):
+    a = array.array(typecode)
+    a.frombytes(_read(f, a.itemsize*count))
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+def _write_column(f, values):
+    """Write one column of a chunk (NULLs are stored as a mask in front)."""
+    nulls = [v is None for v in values]
+    if any(nulls):
+        f.write(b"\1")
+        f.write(bytes(nulls))
+        values = [v for v in values if v is not None]
+    else:
+        f.write(b"\0")
+
+    if all(type(v) is int for v in values):
+        if len(values) > 0 and values == list(range(values[0], values[0]+len(values))):
+            f.write(RANGE)
+            f.write(I64.pack(values[0]))
+        else:
+            f.write(INTEGERS)
+            _write_array(f, array.array("q", values))
+    elif all(type(v) is bytes for v in values):
+        lengths = set(len(v) for v in values)
+        if len(lengths) == 1:
+            f.write(FIXED)
+            f.write(U32.pack(lengths.pop()))
+        else:
+            f.write(BLOBS)
+            _write_array(f, array.array("i", [len(v) for v in values]))
+        f.write(b"".join(values))
+    else:
+        f.write(MIXED)
+        for v in values:
+            if type(v) is int:
+                f.write(b"i" + I64.pack(v))
+            elif type(v) is float:
+                f.write(b"d" + F64.pack(v))
+            else:
+                b = v if type(v) is bytes else v.encode()
+                f.write((b"b" if type(v) is bytes else b"s") + U32.pack(len(b)) + b)
+
+def _read_column(f, count):
+    nulls = None
+    if _read(f, 1) == b"\1":
+        nulls = _read(f, count)
+        count = count - sum(nulls)
+
+    kind = _read(f, 1)
+    if kind == RANGE:
+        start = I64.unpack(_read(f, I64.size))[0]
+        values = range(start, start+count)
+    elif kind == INTEGERS:
+        values = _read_array(f, "q", count)
+    elif kind == FIXED:
+        length = _read_u32(f)
+        data = _read(f, length*count)
+        values = [data[i:i+length] for i in range(0, length*count, length)]
+    elif kind == BLOBS:
+        lengths = _read_array(f, "i", count)
+        data = _read(f, sum(lengths))
+        values = []
+        pos = 0
+        for length in lengths:
+            values += [data[pos:pos+length]]
+            pos += length
+    elif kind == MIXED:
+        values = []
+        for _ in range(count):
+            t = _read(f, 1)
+            if t == b"i":
+                values += [I64.unpack(_read(f, I64.size))[0]]
+            elif t == b"d":
+                values += [F64.unpack(_read(f, F64.size))[0]]
+            else:
+                b = _read(f, _read_u32(f))
+                values += [b if t == b"b" else b.decode()]
+    else:
+        raise ValueError("unknown column encoding {!r}".format(kind))
+
+    if nulls is None:
+        return values
+    values = iter(values)
+    return [None if null else next(values) for null in nulls]
+
+def _lock(dbs, timeout):
+    """Connection holding the write lock of all `dbs` (as `BEGIN IMMEDIATE` does for every attached database)."""
+    con = sqlite3.connect(dbs[0], isolation_level=None, timeout=timeout)
+    for i, db in enumerate(dbs[1:]):
+        con.execute("ATTACH DATABASE ? AS db{}".format(i+1), (db,))
+    con.execute("BEGIN IMMEDIATE")
+    return con
+
+def _snapshot(dbs):
+    """Read-only connection with a read snapshot of each of `dbs` (schemas main, db1, db2, ...)."""
+    con = sqlite3.connect("file:{}?mode=ro".format(dbs[0]), uri=True)
+    for i, db in enumerate(dbs[1:]):
+        con.execute("ATTACH DATABASE ? AS db{}".format(i+1), ("file:{}?mode=ro".format(db),))
+    con.execute("BEGIN")
+    # a read transaction on each database starts at its first read
+    for i in range(len(dbs)):
+        con.execute("SELECT count(*) FROM {}.sqlite_master".format(_schema(i))).fetchall()
+    return con
+
+def _schema(i):
+    return "main" if i == 0 else "db{}".format(i)
+
+def _block_size(con):
+    """Block size of the CRS in the snapshot (as in `CRS.load_from_file`)."""
+    N = con.execute("SELECT pk FROM main.crs WHERE rowid = 0").fetchall()[0][0]
+    n = con.execute("SELECT pk FROM main.crs WHERE rowid = -1").fetchall()
+    return n[0][0] if len(n) != 0 else int(ceil(sqrt(N)))
+
+def _torn(con, dbs, n):
+    """Blocks whose keys (keys.db) and registrations (block versions in aux.db) differ in the snapshot.
+
+    Every registration bumps its block's version once. Returns the blocks with
+    more keys than registrations (their newest keys belong to registrations not
+    written yet, in progress or interrupted) and those with fewer, as
+    block -> (keys, version).
+    """
+    if "keys.db" not in dbs or "aux.db" not in dbs:
+        return {}, {}
+    keys = _schema(dbs.index("keys.db"))
+    aux = _schema(dbs.index("aux.db"))
+    tables = [name for (name,) in con.execute("SELECT name FROM {}.sqlite_master WHERE type='table'".format(aux))]
+    if "block_version" not in tables:
+        return {}, {}
+    counts = dict(con.execute("SELECT id / ?, count(*) FROM {}.key_pairs GROUP BY id / ?".format(keys), (n, n)).fetchall())
+    versions = dict(con.execute("SELECT rowid, version FROM {}.block_version".format(aux)).fetchall())
+    ahead, behind = {}, {}
+    for k in set(counts) | set(versions):
+        pair = (counts.get(k, 0), versions.get(k, 0))
+        if pair[0] > pair[1]:
+            ahead[k] = pair
+        elif pair[0] < pair[1]:
+            behind[k] = pair
+    return ahead, behind
+
+def _unwritten_keys(con, dbs, n, ahead):
+    """Rowids in keys.db of the newest keys of each block in `ahead`, in excess of its registrations."""
+    keys = _schema(dbs.index("keys.db"))
+    out = set()
+    for k, (count, version) in ahead.items():
+        out.update(rowid for (rowid,) in con.execute("SELECT rowid FROM {}.key_pairs WHERE id BETWEEN ? AND ? ORDER BY rowid DESC LIMIT ?".format(keys),
+            (k*n, (k+1)*n-1, count-version)))
+    return out
+
+def save(path, timeout=30.0):
+    """Write a consistent snapshot of the deployment in the current directory to `path`.
+
+    Parameters
+    ----------
+    path : str
+        snapshot file
+    timeout : float (optional)
+        seconds to wait for registrations in progress
+
+    Returns
+    -------
+    dict
+        number of rows per database
+
+    Raises
+    ------
+    TimeoutError
+        if some block still has fewer keys than registrations after `timeout`
+    """
+    dbs = [db for db in DATABASES if os.path.exists(db)]
+    if "crs.db" not in dbs:
+        raise FileNotFoundError("no deployment (crs.db) in the current directory")
+
+    # a plain `reg` commits keys.db before it starts writing pp.db, so a snapshot may fall in between (or a
+    # `reg` may have stopped there for good): such keys are left out, block by block. Blocks with fewer keys
+    # than registrations are only seen mid-commit of a batch (see writer.py): retry until `timeout`
+    deadline = monotonic() + timeout
+    while True:
+        lock = _lock(dbs, timeout)
+        con = _snapshot(dbs)
+        lock.execute("ROLLBACK")
+        lock.close()
+        n = _block_size(con)
+        ahead, behind = _torn(con, dbs, n)
+        if len(behind) == 0:
+            break
+        con.close()
+        if monotonic() > deadline:
+            raise TimeoutError("keys.db holds fewer keys than registrations in aux.db for blocks {} (block: (keys, registrations))".format(behind))
+        sleep(0.001)
+    unwritten = _unwritten_keys(con, dbs, n, ahead) if len(ahead) != 0 else set()
+
+    rows = {}
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(U32.pack(VERSION))
+        for i, db in enumerate(dbs):
+            schema = _schema(i)
+            journal = con.execute("PRAGMA {}.journal_mode".format(schema)).fetchall()[0][0]
+            auto_vacuum = con.execute("PRAGMA {}.auto_vacuum".format(schema)).fetchall()[0][0]
+            entries = con.execute("SELECT type, name, sql FROM {}.sqlite_master WHERE sql IS NOT NULL ORDER BY type='index', rowid".format(schema)).fetchall()
+            f.write(DATABASE)
+            _write_str(f, db)
+            _write_str(f, journal)
+            f.write(U32.pack(auto_vacuum))
+            f.write(U32.pack(len(entries)))
+            for type_, name, sql in entries:
+                _write_str(f, sql)
+
+            tables = [name for type_, name, sql in entries if type_ == "table"]
+            f.write(U32.pack(len(tables)))
+            rows[db] = 0
+            for table in tables:
+                cur = con.execute("SELECT rowid, * FROM {}.{} ORDER BY rowid".format(schema, table))
+                _write_str(f, table)
+                f.write(U32.pack(len(cur.description)-1))
+                while True:
+                    chunk = cur.fetchmany(CHUNK)
+                    if db == "keys.db" and table == "key_pairs" and len(unwritten) != 0:
+                        fetched = len(chunk)
+                        chunk = [row for row in chunk if row[0] not in unwritten]
+                        if fetched != 0 and len(chunk) == 0:
+                            continue
+                    f.write(U64.pack(len(chunk)))
+                    if len(chunk) == 0:
+                        break
+                    for column in zip(*chunk):
+                        _write_column(f, list(column))
+                    rows[db] += len(chunk)
+
+        # the bitmap of the ids in this snapshot's keys.db
+        if "keys.db" in dbs:
+            data = _bitmap(con, _schema(dbs.index("keys.db")), n, unwritten)
+            f.write(FILE)
+            _write_str(f, bitmap.FILENAME)
+            f.write(U64.pack(len(data)))
+            f.write(data)
+        f.write(END)
+    con.close()
+    return rows
+
+def _bitmap(con, keys, n, unwritten=()):
+    """Contents of the bitmap file for the ids in `keys`.key_pairs (but the rowids in `unwritten`)."""
+    path = bitmap.FILENAME + ".snapshot"
+    registered = bitmap.IdBitmap(n, path)
+    try:
+        cur = con.execute("SELECT rowid, id FROM {}.key_pairs".format(keys))
+        while True:
+            ids = cur.fetchmany(CHUNK)
+            if len(ids) == 0:
+                break
+            for rowid, id in ids:
+                if rowid not in unwritten:
+                    registered.mark(id)
+        registered.close()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+def restore(path, overwrite=False):
+    """Recreate the deployment saved in `path` in the current directory.
+
+    Parameters
+    ----------
+    path : str
+        snapshot file
+    overwrite : bool (optional)
+        replace existing databases (otherwise they must not exist)
+
+    Returns
+    -------
+    dict
+        number of rows per database
+    """
+    rows = {}
+    with open(path, "rb") as f:
+        if _read(f, len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a snapshot".format(path))
+        version = _read_u32(f)
+        if version not in [1, VERSION]:
+            raise ValueError("unsupported snapshot version {}".format(version))
+
+        while True:
+            kind = _read(f, 1)
+            if kind == END:
+                break
+            name = _read_str(f)
+            if os.path.basename(name) != name:
+                raise ValueError("invalid file name {!r} in snapshot".format(name))
+            _clear(name, overwrite)
+
+            if kind == FILE:
+                size = U64.unpack(_read(f, U64.size))[0]
+                with open(name, "wb") as out:
+                    out.write(_read(f, size))
+                continue
+            if kind != DATABASE:
+                raise ValueError("unknown record {!r} in snapshot".format(kind))
+
+            journal = _read_str(f)
+            auto_vacuum = _read_u32(f) if version >= 2 else 0
+            entries = [_read_str(f) for _ in range(_read_u32(f))]
+            con = sqlite3.connect(name)
+            # (before anything is written)
+            con.execute("PRAGMA auto_vacuum={}".format(auto_vacuum))
+            con.execute("PRAGMA journal_mode=OFF")
+            con.execute("PRAGMA synchronous=OFF")
+            # tables first, indices after the data (the snapshot lists them in that order)
+            indices = [sql for sql in entries if sql.lstrip().upper().startswith("CREATE TABLE") == False]
+            for sql in entries:
+                if sql not in indices:
+                    con.execute(sql)
+
+            rows[name] = 0
+            for _ in range(_read_u32(f)):
+                table = _read_str(f)
+                columns = _read_u32(f)
+                insert = "INSERT INTO {} (rowid, {}) VALUES (?{})".format(table,
+                    ", ".join(column[1] for column in con.execute("PRAGMA table_info({})".format(table))),
+                    ", ?"*columns)
+                while True:
+                    count = U64.unpack(_read(f, U64.size))[0]
+                    if count == 0:
+                        break
+                    data = [_read_column(f, count) for _ in range(columns+1)]
+                    con.executemany(insert, zip(*data))
+                    rows[name] += count
+            for sql in indices:
+                con.execute(sql)
+            con.commit()
+            con.execute("PRAGMA journal_mode={}".format(journal))
+            con.close()
+    return rows
+
+def _clear(name, overwrite):
+    files = [name, name+"-wal", name+"-shm", name+"-journal"]
+    if not overwrite and any(os.path.exists(f) for f in files):
+        raise FileExistsError("{} exists (restore with overwrite=True to replace it)".format(name))
+    for f in files:
+        if os.path.exists(f):
+            os.remove(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="snapshot and restore of the databases in the current directory")
+    parser.add_argument('action',
+        choices=['save', 'restore'],
+        help='save a snapshot, or restore one')
+    parser.add_argument('file',
+        help='snapshot file')
+    parser.add_argument('-f','--force',
+        action='store_true',
+        default=False,
+        dest='force',
+        help='overwrite existing databases on restore')
+    args = parser.parse_args()
+
+    if args.action == 'save':
+        rows = save(args.file)
+    else:
+        rows = restore(args.file, overwrite=args.force)
+    for db, count in rows.items():
+        print("{}:\t{} rows".format(db, count))
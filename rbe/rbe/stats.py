@@ -0,0 +1,109 @@
+"""Timing statistics shared by the benchmark scripts.
+"""
+
+import statistics
+from time import perf_counter
+
+# two-sided 95% quantiles of Student's t distribution, by degrees of freedom
+_T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+def measure(fn, reps=10, warmup=2):
+    """Time repeated calls of `fn` with `time.perf_counter`.
+
+    Parameters
+    ----------
+    fn : callable
+        function to time, called without arguments
+    reps : int (optional)
+        number of timed calls
+    warmup : int (optional)
+        number of untimed calls made first
+
+    Returns
+    -------
+    array of float
+        duration of each timed call (s)
+    """
+    for _ in range(warmup):
+        fn()
+    samples = [0.0] * reps
+    for i in range(reps):
+        start = perf_counter()
+        fn()
+        samples[i] = perf_counter()-start
+    return samples
+
+def percentile(sorted_samples, q):
+    """`q`-th percentile (0-100) of sorted samples, linearly interpolated."""
+    if len(sorted_samples) == 0:
+        return None
+    pos = (len(sorted_samples)-1) * q / 100
+    lo = int(pos)
+    hi = min(lo+1, len(sorted_samples)-1)
+    return sorted_samples[lo] + (sorted_samples[hi]-sorted_samples[lo]) * (pos-lo)
+
+def summarize(samples):
+    """Summary statistics of a list of timings.
+
+    Returns
+    -------
+    dict
+        `n`, `mean`, `stdev`, `min`, `max`, `p50`, `p95`, `p99`, `p999`, and `ci95`,
+        the half-width of the 95% confidence interval of the mean
+    """
+    s = sorted(samples)
+    n = len(s)
+    if n == 0:
+        return {"n": 0}
+    mean = statistics.fmean(s)
+    stdev = statistics.stdev(s) if n > 1 else 0.0
+    df = n-1
+    t = _T95[df-1] if 0 < df <= len(_T95) else 1.96
+    return {
+        "n": n,
+        "mean": mean,
+        "stdev": stdev,
+        "min": s[0],
+        "max": s[-1],
+        "p50": percentile(s, 50),
+        "p95": percentile(s, 95),
+        "p99": percentile(s, 99),
+        "p999": percentile(s, 99.9),
+        "ci95": t * stdev / n**0.5 if n > 1 else 0.0,
+    }
+
+def throughput(summary):
+    """Operations per second implied by a summary (from its mean)."""
+    mean = summary.get("mean")
+    return 1/mean if mean else None
+
+def regressions(baseline, current, threshold=0.1):
+    """Find operations that got slower than a baseline.
+
+    An operation regresses if its median grew by more than `threshold` (relative)
+    and its confidence interval no longer overlaps the baseline's.
+
+    Parameters
+    ----------
+    baseline, current : dict
+        maps from a key to a `summarize` dict
+    threshold : float (optional)
+        tolerated relative slowdown of the median
+
+    Returns
+    -------
+    array of (key, float)
+        regressed keys with their relative slowdown
+    """
+    out = []
+    for key, cur in current.items():
+        base = baseline.get(key)
+        if base is None or not base.get("n") or not cur.get("n"):
+            continue
+        slowdown = cur["p50"]/base["p50"] - 1 if base["p50"] > 0 else 0.0
+        separated = cur["mean"] - cur["ci95"] > base["mean"] + base["ci95"]
+        if slowdown > threshold and separated:
+            out += [(key, slowdown)]
+    return out
@@ -0,0 +1,140 @@
+"""Compressed encoding of GT elements (torus T2), for ciphertexts.
+
+GT is the order-r subgroup of Fp12* on BLS12-381, with Fp12 built as
+Fp2 = Fp[u]/(u^2+1), Fp6 = Fp2[v]/(v^3-(1+u)), Fp12 = Fp6[w]/(w^2-v). Elements
+of GT lie in the cyclotomic subgroup, so g = g0 + g1*w has norm g0^2 - g1^2*v = 1
+and is determined by the single Fp6 value
+
+    c = (1+g0)/g1,   recovered as   g = (c+w)/(c-w)
+
+(g1 = 0 only for g = 1, encoded as all zeros). A compressed element is the 6
+coefficients of c, i.e. 288 bytes instead of the 576 of `GTElement.to_binary`.
+Compression and decompression each cost one Fp6 inversion and a few
+multiplications, in Python integers.
+
+The 576-byte serialization is read as 12 big-endian Fp coefficients in tower
+order (as RELIC writes them). `available` checks this layout once, on a sample
+element (it must have norm 1); if it does not hold (e.g. another group backend),
+compression is not available and callers keep the uncompressed encoding.
+"""
+
+from petrelic.multiplicative.pairing import G1,G2,GTElement
+
+P = 0x1a0111ea397fe69a4b1ba7b6434bacd764774b84f38512bf6730d2a0f6b0f6241eabfffeb153ffffb9feffffffffaaab
+FP_BYTES = 48
+SIZE = 6*FP_BYTES
+
+# Fp2 elements are pairs (a, b) = a + b*u, Fp6 elements triples of Fp2 over v
+
+def _add2(a, b):
+    return ((a[0]+b[0]) % P, (a[1]+b[1]) % P)
+
+def _sub2(a, b):
+    return ((a[0]-b[0]) % P, (a[1]-b[1]) % P)
+
+def _mul2(a, b):
+    return ((a[0]*b[0] - a[1]*b[1]) % P, (a[0]*b[1] + a[1]*b[0]) % P)
+
+def _xi2(a):
+    """Multiply by the non-residue 1+u."""
+    return ((a[0]-a[1]) % P, (a[0]+a[1]) % P)
+
+def _inv2(a):
+    d = pow((a[0]*a[0] + a[1]*a[1]) % P, -1, P)
+    return (a[0]*d % P, -a[1]*d % P)
+
+_ZERO6 = ((0, 0), (0, 0), (0, 0))
+_ONE6 = ((1, 0), (0, 0), (0, 0))
+_V6 = ((0, 0), (1, 0), (0, 0))
+
+def _add6(a, b):
+    return tuple(_add2(x, y) for x, y in zip(a, b))
+
+def _sub6(a, b):
+    return tuple(_sub2(x, y) for x, y in zip(a, b))
+
+def _mul6(a, b):
+    c0 = _add2(_mul2(a[0], b[0]), _xi2(_add2(_mul2(a[1], b[2]), _mul2(a[2], b[1]))))
+    c1 = _add2(_add2(_mul2(a[0], b[1]), _mul2(a[1], b[0])), _xi2(_mul2(a[2], b[2])))
+    c2 = _add2(_add2(_mul2(a[0], b[2]), _mul2(a[1], b[1])), _mul2(a[2], b[0]))
+    return (c0, c1, c2)
+
+def _inv6(a):
+    t0 = _sub2(_mul2(a[0], a[0]), _xi2(_mul2(a[1], a[2])))
+    t1 = _sub2(_xi2(_mul2(a[2], a[2])), _mul2(a[0], a[1]))
+    t2 = _sub2(_mul2(a[1], a[1]), _mul2(a[0], a[2]))
+    d = _inv2(_add2(_mul2(a[0], t0), _xi2(_add2(_mul2(a[2], t1), _mul2(a[1], t2)))))
+    return (_mul2(t0, d), _mul2(t1, d), _mul2(t2, d))
+
+def _read6(buf):
+    x = [int.from_bytes(buf[i*FP_BYTES:(i+1)*FP_BYTES], "big") for i in range(6)]
+    if any(xi >= P for xi in x):
+        raise ValueError("coefficient out of range")
+    return ((x[0], x[1]), (x[2], x[3]), (x[4], x[5]))
+
+def _write6(a):
+    return b"".join(x.to_bytes(FP_BYTES, "big") for xy in a for x in xy)
+
+def compress_fp12(g0, g1):
+    """Compressed form of the norm-1 element g0 + g1*w (Fp6 halves)."""
+    if g1 == _ZERO6:
+        return bytes(SIZE)
+    return _write6(_mul6(_add6(_ONE6, g0), _inv6(g1)))
+
+def decompress_fp12(buf):
+    """Fp6 halves (g0, g1) of the element compressed as `buf`."""
+    if len(buf) != SIZE:
+        raise ValueError("compressed GT element must be {} bytes".format(SIZE))
+    if not any(buf):
+        return _ONE6, _ZERO6
+    c = _read6(buf)
+    c2 = _mul6(c, c)
+    d = _inv6(_sub6(c2, _V6))
+    return _mul6(_add6(c2, _V6), d), _mul6(_add6(c, c), d)
+
+def _halves(gt_ser):
+    return _read6(gt_ser[:SIZE]), _read6(gt_ser[SIZE:])
+
+_available = None
+
+def available():
+    """Whether GT elements of the installed backend can be compressed (checked once)."""
+    global _available
+    if _available is None:
+        try:
+            g = G1.generator().pair(G2.generator()) ** G1.order().random()
+            ser = GTElement.to_binary(g)
+            g0, g1 = _halves(ser) if len(ser) == 2*SIZE else (None, None)
+            # norm g0^2 - g1^2*v must be 1, and the encoding must round trip
+            _available = g0 is not None and _sub6(_mul6(g0, g0), _mul6(_V6, _mul6(g1, g1))) == _ONE6 and decompress(compress(g)) == g
+        except ValueError:
+            _available = False
+    return _available
+
+def compress(g):
+    """Compressed encoding (288 bytes) of an element of GT.
+
+    Parameters
+    ----------
+    g : element of GT
+
+    Returns
+    -------
+    bytes
+    """
+    return compress_fp12(*_halves(GTElement.to_binary(g)))
+
+def decompress(buf):
+    """Element of GT from its compressed encoding.
+
+    Parameters
+    ----------
+    buf : bytes-like
+        output of `compress`
+
+    Returns
+    -------
+    element of GT
+    """
+    g0, g1 = decompress_fp12(bytes(buf))
+    return GTElement.from_binary(_write6(g0) + _write6(g1))
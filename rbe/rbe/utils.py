@@ -7,7 +7,7 @@ from os.path import exists
 from rbe import objects
 from petrelic.multiplicative.pairing import G1,G2,GT,G1Element,G2Element
 
-def write_pk_to_db(id,pk):
+def write_pk_to_db(id,pk,con=None):
     """Write public key to the key database.
 
     Parameters
@@ -16,12 +16,21 @@ def write_pk_to_db(id,pk):
         identity whose public key we are storing
     pk : element of G1
         public key to store
+    con : sqlite3.Connection (optional)
+        connection with keys.db attached (and key_pairs created); the key is then
+        written in the caller's transaction
     """
+    if con is not None:
+        con.cursor().execute("INSERT INTO key_pairs (id, pk) VALUES(?, ?)",(id,G1Element.to_binary(pk)))
+        return
+
     keys_db_exists = exists("keys.db")
     con = sqlite3.connect('keys.db')
     cur = con.cursor()
 
     if not keys_db_exists:
+        # WAL, like pp/aux, so that long reads (e.g. `snapshot.save`) do not block registrations
+        cur.execute("PRAGMA journal_mode=WAL")
         cur.execute('''CREATE TABLE key_pairs(id INTEGER, pk BLOB)''')
 
     write_pk_db_time = time.time()
@@ -56,6 +65,27 @@ def write_pk_to_db(id,pk):
 #     con.close()
 #     return sk
 
+def connect_snapshot(db):
+    """Open a read-only connection to `db` and start a read transaction on it.
+
+    Every read through the connection sees the same snapshot of `db`, taken at the
+    first read, until the connection is closed. With the databases in WAL mode (see
+    `setup`), such readers neither wait for nor block `reg`/`merge`, and never see a
+    registration (with its merges) half-applied.
+
+    Parameters
+    ----------
+    db : str
+        database file name (e.g. "pp.db")
+
+    Returns
+    -------
+    sqlite3.Connection
+    """
+    con = sqlite3.connect("file:{}?mode=ro".format(db), uri=True)
+    con.execute("BEGIN")
+    return con
+
 def insert_or_update(inp):
     """For regular (not efficient update) variant, determine whether to append or update a commitment into pp.
 
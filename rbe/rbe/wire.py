@@ -0,0 +1,200 @@
+"""Packed binary format of registration requests (id, pk, helping values).
+
+A request is laid out as
+
+    header   magic "RBER", version, flags (0), record width w, n, id
+             (little endian, 20 bytes)
+    pk       w bytes
+    present  ceil(n/8) bytes, bit i set iff helping value i is not None
+             (bit i of byte i // 8, least significant first, as in bitmap.py)
+    values   one w-byte record per present helping value, in index order
+
+where records are serialized G1 elements (48 bytes on BLS12-381) and an all-zero
+record stands for the neutral element. Requests can be concatenated, so a file
+or a socket carries a stream of them.
+
+Parsing is zero-copy: the helping values of a parsed request are `memoryview`
+slices of the buffer (e.g. an mmap of a file of requests) that are deserialized
+on first access, and holes read as `None`, so the result can be passed to `reg`
+(or a `RegistrationWriter`) as is. `Request.decode` deserializes all of them at
+once.
+
+Examples
+--------
+>>> from rbe import wire
+>>> data = wire.encode(id, pk, xi)
+>>> request = wire.parse(data)
+>>> algos.reg(crs, request.id, request.pk, request.helping_values)
+
+Streaming from a file (or `socket.makefile("rb")`):
+
+>>> with open("requests.bin", "rb") as f:
+...     for request in wire.read_requests(f):
+...         writer.submit(request.id, request.pk, request.helping_values)
+"""
+
+import struct
+from petrelic.multiplicative.pairing import G1,G1Element
+from rbe.objects import LazyUpdates
+
+MAGIC = b"RBER"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHIQ")
+
+class HelpingValues(LazyUpdates):
+    """Helping values of a parsed request: `None` for holes, G1 elements (decoded on first access) otherwise."""
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if self.raw[i] is None:
+            return None
+        return super().__getitem__(i)
+
+class Request:
+    """A parsed registration request.
+
+    Attributes
+    ----------
+    id : int
+        identity to register
+    n : int
+        number of helping values (block size)
+    width : int
+        bytes per serialized element
+    helping_values : HelpingValues
+        helping values (lazy, with `None` holes)
+    nbytes : int
+        size of the request in its buffer
+    """
+
+    def __init__(self, id, n, width, pk_raw, helping_values, nbytes):
+        self.id = id
+        self.n = n
+        self.width = width
+        self.pk_raw = pk_raw
+        self.helping_values = helping_values
+        self.nbytes = nbytes
+        self._pk = None
+
+    @property
+    def pk(self):
+        if self._pk is None:
+            self._pk = G1Element.from_binary(bytes(self.pk_raw))
+        return self._pk
+
+    def decode(self):
+        """Deserialize all helping values; returns them as a list (with `None` holes)."""
+        return [self.helping_values[i] for i in range(self.n)]
+
+def encode(id, pk, helping_values):
+    """Pack a registration request.
+
+    Parameters
+    ----------
+    id : int
+        identity to register
+    pk : element of G1
+        public key
+    helping_values : array of G1 elements (or `None`)
+        helping values, as returned by `gen`
+
+    Returns
+    -------
+    bytes
+    """
+    pk_ser = G1Element.to_binary(pk)
+    width = len(pk_ser)
+    n = len(helping_values)
+    present = bytearray((n+7)//8)
+    records = []
+    for i, h in enumerate(helping_values):
+        if h is None:
+            continue
+        present[i//8] |= 1 << (i % 8)
+        b = G1Element.to_binary(h) if h != G1.neutral_element() else bytes(width)
+        if len(b) != width:
+            raise ValueError("helping value {} serializes to {} bytes, the public key to {}".format(i, len(b), width))
+        records += [b]
+    return HEADER.pack(MAGIC, VERSION, 0, width, n, id) + pk_ser + bytes(present) + b"".join(records)
+
+def _layout(header):
+    magic, version, flags, width, n, id = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("not a registration request")
+    if version != VERSION:
+        raise ValueError("unsupported request version {}".format(version))
+    return width, n, id
+
+def _build(view, width, n, id, nbytes=None):
+    """Request over `view` = pk, presence bitmap, records (no copies)."""
+    present = view[width:width+(n+7)//8]
+    if len(present) < (n+7)//8 or len(view) < _body_size(width, n, present):
+        raise ValueError("truncated request")
+    raw = [None]*n
+    pos = width + (n+7)//8
+    for i in range(n):
+        if present[i >> 3] >> (i & 7) & 1:
+            raw[i] = view[pos:pos+width]
+            pos = pos + width
+    return Request(id, n, width, view[:width], HelpingValues(raw), HEADER.size + pos if nbytes is None else nbytes)
+
+def _body_size(width, n, present):
+    return width + (n+7)//8 + bin(int.from_bytes(present, "little")).count("1")*width
+
+def parse(buf, offset=0, n=None):
+    """Parse the request at `offset` of `buf` (bytes, bytearray, mmap, ...) without copying it.
+
+    Parameters
+    ----------
+    buf : bytes-like
+        buffer holding the request
+    offset : int (optional)
+        position of the request in `buf`
+    n : int (optional)
+        expected block size (e.g. `crs.n`); a request for another one is rejected
+
+    Returns
+    -------
+    Request
+    """
+    view = memoryview(buf)
+    if len(view) < offset + HEADER.size:
+        raise ValueError("truncated request")
+    width, count, id = _layout(view[offset:offset+HEADER.size])
+    if n is not None and count != n:
+        raise ValueError("request has {} helping values, expected {}".format(count, n))
+    return _build(view[offset+HEADER.size:], width, count, id)
+
+def iter_requests(buf, n=None):
+    """Parse the concatenated requests in `buf`, without copying them."""
+    offset = 0
+    while offset < len(buf):
+        request = parse(buf, offset, n)
+        offset = offset + request.nbytes
+        yield request
+
+def read_requests(f, n=None):
+    """Read concatenated requests from a binary file object (or `socket.makefile("rb")`) one by one."""
+    while True:
+        header = f.read(HEADER.size)
+        if len(header) == 0:
+            return
+        if len(header) < HEADER.size:
+            raise ValueError("truncated request")
+        width, count, id = _layout(header)
+        if n is not None and count != n:
+            raise ValueError("request has {} helping values, expected {}".format(count, n))
+        head = f.read(width + (count+7)//8)
+        rest = f.read(_body_size(width, count, head[width:]) - len(head))
+        body = head + rest
+        if len(body) != _body_size(width, count, head[width:]):
+            raise ValueError("truncated request")
+        yield _build(memoryview(body), width, count, id, HEADER.size+len(body))
+
+def write_requests(f, requests):
+    """Write `(id, pk, helping_values)` requests to a binary file object; returns the bytes written."""
+    written = 0
+    for id, pk, helping_values in requests:
+        written = written + f.write(encode(id, pk, helping_values))
+    return written
@@ -0,0 +1,194 @@
+"""Group commit of concurrent registrations.
+
+A plain `reg` makes three or four commits (keys.db, aux.db, aux_count.db and
+pp.db), each of them synced to disk. A `RegistrationWriter` owns a single
+connection to pp.db with aux.db, aux_count.db and keys.db attached, collects the
+registrations submitted by any number of threads during a short `window` (or
+until `max_batch` of them are waiting), applies them in submission order within
+one transaction, and commits once. Callers are acknowledged only after that
+commit, so an acknowledged registration is durable (up to the `synchronous`
+setting).
+
+Each registration runs in its own savepoint, so one that fails (e.g. with
+inconsistent helping values) is rolled back on its own and reported to its
+caller without affecting the rest of the batch.
+
+Examples
+--------
+>>> from rbe.writer import RegistrationWriter
+>>> with RegistrationWriter(crs, efficient=True, window=0.005) as w:
+...     w.register(42, pk, xi)             # blocks until durable
+...     fut = w.submit(43, pk_2, xi_2)     # or asynchronously
+...     fut.result()
+
+Notes
+-----
+Larger windows and batches trade registration latency for throughput (fewer
+syncs). `synchronous` is sqlite's pragma for all four databases: "FULL" syncs on
+every commit, "NORMAL" (the default, safe in WAL mode) may lose the last batches
+on power loss but never corrupts, "OFF" leaves syncing to the OS.
+With pp.db and aux.db in WAL mode, the commit is atomic per database rather than
+across databases if the machine crashes in the middle of it.
+"""
+
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from os.path import exists
+from time import monotonic
+from rbe import algos
+from rbe import bitmap
+from rbe import notify
+
+# attached databases (table names are unique across them, so `reg` needs no schema names)
+ATTACHED = {"aux_db": "aux.db", "aux_count_db": "aux_count.db", "keys_db": "keys.db"}
+
+class RegistrationWriter:
+    """Applies registrations from many callers in batches, one commit per batch.
+
+    Parameters
+    ----------
+    crs : CRS
+        common reference string
+    efficient : bool (optional)
+        use efficient update variant
+    window : float (optional)
+        seconds to wait for more registrations after the first one of a batch
+    max_batch : int (optional)
+        maximum registrations per commit
+    synchronous : str (optional)
+        sqlite synchronous pragma ("OFF", "NORMAL", "FULL" or "EXTRA")
+    """
+
+    def __init__(self, crs, efficient=False, window=0.002, max_batch=64, synchronous="NORMAL"):
+        self.crs = crs
+        self.efficient = efficient
+        self.window = window
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self.batches = 0
+        self.registered = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def _connect(self):
+        # autocommit mode: transactions and savepoints are issued explicitly
+        con = sqlite3.connect("pp.db", isolation_level=None, check_same_thread=False)
+        con.execute("PRAGMA main.synchronous={}".format(self.synchronous))
+        keys_db_exists = exists(ATTACHED["keys_db"])
+        for name, db in ATTACHED.items():
+            con.execute("ATTACH DATABASE ? AS {}".format(name), (db,))
+            con.execute("PRAGMA {}.synchronous={}".format(name, self.synchronous))
+        if not keys_db_exists:
+            # as in `utils.write_pk_to_db`
+            con.execute("PRAGMA keys_db.journal_mode=WAL")
+        con.execute("CREATE TABLE IF NOT EXISTS keys_db.key_pairs(id INTEGER, pk BLOB)")
+        return con
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(self._connect(),), daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Apply everything submitted so far, then stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, id, pk, helping_values):
+        """Queue a registration (see `algos.reg`).
+
+        Returns
+        -------
+        concurrent.futures.Future
+            resolves to `None` once the registration is committed, or raises
+            `ValueError` if it was rejected
+        """
+        fut = Future()
+        self._queue.put((id, pk, helping_values, fut))
+        return fut
+
+    def register(self, id, pk, helping_values):
+        """Register and wait until the registration is durable."""
+        return self.submit(id, pk, helping_values).result()
+
+    def _next_batch(self):
+        """Block for the first registration, then collect more until the window closes or the batch is full."""
+        first = self._queue.get()
+        if first is None:
+            return None, True
+        batch = [first]
+        deadline = monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch += [item]
+        return batch, False
+
+    def _run(self, con):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._apply(con, batch)
+        con.close()
+
+    def _apply(self, con, batch):
+        cur = con.cursor()
+        cur.execute("BEGIN")
+        outcomes = []
+        for id, pk, helping_values, fut in batch:
+            cur.execute("SAVEPOINT reg")
+            try:
+                algos.reg(self.crs, id, pk, helping_values, efficient=self.efficient, con=con)
+                outcomes += [None]
+            except Exception as e:
+                # only this registration is undone
+                cur.execute("ROLLBACK TO reg")
+                outcomes += [e]
+            cur.execute("RELEASE reg")
+
+        try:
+            cur.execute("COMMIT")
+        except Exception as e:
+            if con.in_transaction:
+                cur.execute("ROLLBACK")
+            # `reg` marked the ids that went through as registered
+            with bitmap.IdBitmap(self.crs.n) as registered:
+                for (id, pk, helping_values, fut), outcome in zip(batch, outcomes):
+                    if outcome is None:
+                        registered.clear(id)
+            outcomes = [e]*len(batch)
+
+        self.batches += 1
+        blocks = set()
+        for (id, pk, helping_values, fut), outcome in zip(batch, outcomes):
+            if outcome is None:
+                self.registered += 1
+                blocks.add(id//self.crs.n)
+                fut.set_result(None)
+            else:
+                self.failed += 1
+                fut.set_exception(outcome)
+
+        # tell subscribers only now that the changes are committed
+        if notify.get() is not None:
+            for k in sorted(blocks):
+                cur.execute("SELECT version FROM block_version WHERE rowid = ?", (k,))
+                notify.publish(k, cur.fetchall()[0][0])